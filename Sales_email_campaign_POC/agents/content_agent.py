@@ -2,67 +2,111 @@
 Content Agent - Generates personalized emails
 """
 
-from utils.gemini_client import GeminiClient
-from utils.config import EMAIL_TARGET_WORD_COUNT, GOOGLE_API_KEY
+import re
+import time
+from utils.gemini_client import get_client
+from utils.config import EMAIL_MAX_CONTACTS, EMAIL_SUBJECT_VARIANTS
+from utils.metrics import inc, span
+from utils.prompts import EMAIL, EMAIL_MULTI, EMAIL_FIX
+from utils.schemas import EmailDraft, EmailFix, EMAIL_BATCH_RESPONSE_SCHEMA, EMAIL_FIX_RESPONSE_SCHEMA, parse_json_lenient
 
-def generate_email(enriched_data: dict) -> dict:
-    """Generate email using Gemini"""
+def parse_email(response: str):
+    """
+    Split the 'Subject: ...' line from the body, works on partial text too
+
+    Text before the subject line (e.g. "Here's your email:") is dropped, as
+    is the "Body:" label the format asks for.
+    """
+    lines = response.strip().split('\n')
+    start = next((n for n, line in enumerate(lines) if line.strip().lower().startswith('subject:')), 0)
+    subject = re.sub(r'^\s*subject:\s*', '', lines[start], flags=re.IGNORECASE).strip()
+    body = re.sub(r'^\s*body:\s*', '', '\n'.join(lines[start + 1:]).strip(), flags=re.IGNORECASE)
+    return subject, body
+
+def _stream_response(client, prompt: str, system: str, use_cache: bool, on_partial, company_name: str,
+                     hedge: bool = False) -> tuple:
+    """Stream the email, calling on_partial(subject, body) as text arrives; returns (text, ttft_ms)"""
+    started = time.perf_counter()
+    ttft_ms = None
+    text = ""
+    for chunk in client.generate_stream(prompt, use_cache=use_cache, system=system, hedge=hedge):
+        if ttft_ms is None:
+            ttft_ms = (time.perf_counter() - started) * 1000
+            print(f"[CONTENT] First token for {company_name} after {ttft_ms:.0f} ms")
+        text += chunk
+        # The subject is usable as soon as its line is complete
+        if '\n' in text:
+            on_partial(*parse_email(text))
+    on_partial(*parse_email(text))
+    return text, ttft_ms
+
+def _news_item(enriched_data: dict) -> str:
+    recent_news = enriched_data.get('recent_news', [])
+    if recent_news:
+        return recent_news[0]
+    return f"{enriched_data.get('company_name', 'Company')} is active in {enriched_data.get('industry', 'Business')}"
+
+def _contact_key(name) -> str:
+    return " ".join(str(name).lower().split())
+
+@span("content")
+def generate_email(enriched_data: dict, use_cache: bool = True, on_partial=None, contact: dict = None,
+                   hedge: bool = False) -> dict:
+    """
+    Generate email using Gemini (use_cache=False forces fresh content)
+    
+    If on_partial is given the response is streamed and on_partial(subject, body)
+    is called as it arrives; the time to first token is recorded as ttft_ms.
+    contact picks the recipient (defaults to the first contact). hedge races
+    a second request against a slow first one, for interactive regenerations.
+    """
     
     company_name = enriched_data.get('company_name', 'Company')
     industry = enriched_data.get('industry', 'Business')
     
     print(f"[CONTENT] Generating email for: {company_name}")
     
-    # Get first contact or use generic
+    # Given contact, else first contact, else generic
     contacts = enriched_data.get('contacts', [])
-    if contacts:
-        contact_name = contacts[0].get('name', 'Decision Maker')
-        contact_title = contacts[0].get('title', 'Executive')
+    contact = contact or (contacts[0] if contacts else None)
+    if contact:
+        contact_name = contact.get('name', 'Decision Maker')
+        contact_title = contact.get('title', 'Executive')
         print(f"[CONTENT] Target contact: {contact_name}, {contact_title}")
     else:
         contact_name = 'Decision Maker'
         contact_title = 'Executive'
         print(f"[CONTENT] No contacts found, using generic")
     
-    # Get recent news or use generic
-    recent_news = enriched_data.get('recent_news', [])
-    news_item = recent_news[0] if recent_news else f"{company_name} is active in {industry}"
+    news_item = _news_item(enriched_data)
     
-    prompt = f"""Generate a B2B sales email:
-
-Company: {company_name}
-Industry: {industry}
-Contact: {contact_name}, {contact_title}
-Recent: {news_item}
-
-Requirements:
-- 100-150 words
-- Professional tone
-- Reference their recent activity
-- Clear call-to-action
-- Subject line (3 words max, lowercase)
-
-Format:
-Subject: [subject]
-Body: [email body]
-"""
+    # Requirements and format live in the system instruction
+    prompt = EMAIL.render(
+        company_name=company_name, industry=industry,
+        contact_name=contact_name, contact_title=contact_title, news_item=news_item
+    )
     
     try:
         print(f"[CONTENT] Calling Gemini API for email generation...")
-        client = GeminiClient(GOOGLE_API_KEY)
-        response = client.generate_email(prompt)
+        client = get_client()
+        ttft_ms = None
+        if on_partial:
+            response, ttft_ms = _stream_response(client, prompt, EMAIL.system, use_cache, on_partial, company_name, hedge)
+        else:
+            response = client.generate_email(prompt, use_cache=use_cache, system=EMAIL.system, hedge=hedge)
         print(f"[CONTENT] Email generated successfully")
         
         # Parse response
-        lines = response.split('\n')
-        subject = lines[0].replace('Subject:', '').strip()
-        body = '\n'.join(lines[1:]).strip()
+        subject, body = parse_email(response)
         
-        return {
+        email = {
             "subject": subject,
             "body": body,
             "word_count": len(body.split())
         }
+        if ttft_ms is not None:
+            email["ttft_ms"] = round(ttft_ms, 1)
+        return email
     except Exception as e:
         print(f"[CONTENT] Error: {str(e)}")
         # Fallback email
@@ -72,3 +116,124 @@ Body: [email body]
             "word_count": 20,
             "error": str(e)
         }
+
+def _draft(email: dict, contact: dict) -> dict:
+    """An email dict plus its recipient and subject variants"""
+    email.setdefault("subject_variants", [email["subject"]])
+    email["contact"] = {"name": contact.get("name"), "title": contact.get("title")}
+    email["to"] = contact.get("email")
+    return email
+
+@span("content_multi")
+def generate_emails(enriched_data: dict, use_cache: bool = True, variants: int = EMAIL_SUBJECT_VARIANTS,
+                    max_contacts: int = EMAIL_MAX_CONTACTS, hedge: bool = False) -> list:
+    """
+    Draft an email for every contact, each with several subject lines, in one Gemini call
+    
+    Contacts the answer dropped or mangled get a single-email call of their
+    own, like companies dropped from a research batch. hedge is passed on
+    to the Gemini call (see generate_email).
+    
+    Returns:
+        List of email dicts in contact order, each with subject (the first
+        variant), subject_variants, body, word_count, contact and to
+    """
+    
+    company_name = enriched_data.get('company_name', 'Company')
+    contacts = [c for c in enriched_data.get('contacts', []) if c.get('name')][:max(1, max_contacts)]
+    if not contacts:
+        return [generate_email(enriched_data, use_cache=use_cache, hedge=hedge)]
+    
+    print(f"[CONTENT] Generating {len(contacts)} emails x {variants} subjects for: {company_name}")
+    
+    contact_lines = "\n".join(
+        f"{n}. {c.get('name')}, {c.get('title', 'Executive')}" for n, c in enumerate(contacts, start=1)
+    )
+    prompt = EMAIL_MULTI.render(
+        company_name=company_name, industry=enriched_data.get('industry', 'Business'),
+        news_item=_news_item(enriched_data), variant_count=max(1, variants), contact_lines=contact_lines
+    )
+    
+    client = get_client()
+    drafts = {}
+    try:
+        print(f"[CONTENT] Calling Gemini API for {len(contacts)} emails...")
+        response = client.generate_email(
+            prompt, use_cache=use_cache, system=EMAIL_MULTI.system, schema=EMAIL_BATCH_RESPONSE_SCHEMA, hedge=hedge
+        )
+        parsed, _ = parse_json_lenient(response)
+        for item in parsed if isinstance(parsed, list) else []:
+            draft = EmailDraft.from_dict(item)
+            if draft is not None:
+                drafts.setdefault(_contact_key(draft.contact_name), draft)
+    except Exception as e:
+        print(f"[CONTENT] Multi-email error: {str(e)}")
+        client.forget(prompt, EMAIL_MULTI.system, EMAIL_BATCH_RESPONSE_SCHEMA)
+    
+    emails = []
+    missing = 0
+    for contact in contacts:
+        draft = drafts.get(_contact_key(contact.get('name')))
+        if draft is None:
+            # Dropped or mangled - write this one on its own
+            missing += 1
+            emails.append(_draft(generate_email(enriched_data, use_cache=use_cache, contact=contact), contact))
+            continue
+        emails.append(_draft({
+            "subject": draft.subjects[0],
+            "subject_variants": draft.subjects[:max(1, variants)],
+            "body": draft.body,
+            "word_count": len(draft.body.split())
+        }, contact))
+    
+    inc("content_multi_emails_total", len(contacts) - missing, source="batch")
+    inc("content_multi_emails_total", missing, source="single")
+    print(f"[CONTENT] {len(contacts) - missing} of {len(contacts)} emails from one call, {missing} written singly")
+    return emails
+
+@span("content_fix")
+def fix_emails(items: list) -> dict:
+    """
+    Rewrite several drafts that failed validation in one Gemini call
+    
+    Only the listed problems are to be fixed; the model gets the draft
+    itself rather than the research, so the call is small.
+    
+    Args:
+        items: Dicts with id, company_name, contact_name, contact_title,
+            problems (list of messages), subject and body
+    
+    Returns:
+        {id: {"subject", "body"}} for the drafts that came back; missing
+        ones simply keep their current text
+    """
+    
+    if not items:
+        return {}
+    print(f"[CONTENT] Rewriting {len(items)} drafts that failed validation")
+    
+    email_blocks = "\n".join(
+        f"### {item['id']}\nCompany: {item['company_name']}\n"
+        f"Contact: {item['contact_name']}, {item['contact_title']}\n"
+        f"Problems: {'; '.join(item['problems'])}\nSubject: {item['subject']}\nBody:\n{item['body']}\n"
+        for item in items
+    )
+    prompt = EMAIL_FIX.render(email_blocks=email_blocks)
+    
+    client = get_client()
+    fixes = {}
+    try:
+        # Never serve a cached rewrite: the same input just failed once
+        response = client.generate_email(
+            prompt, use_cache=False, system=EMAIL_FIX.system, schema=EMAIL_FIX_RESPONSE_SCHEMA
+        )
+        parsed, _ = parse_json_lenient(response)
+        for entry in parsed if isinstance(parsed, list) else []:
+            fix = EmailFix.from_dict(entry)
+            if fix is not None:
+                fixes.setdefault(fix.id, {"subject": fix.subject, "body": fix.body})
+    except Exception as e:
+        print(f"[CONTENT] Rewrite error: {str(e)}")
+    
+    print(f"[CONTENT] {len(fixes)} of {len(items)} drafts rewritten")
+    return fixes
@@ -2,61 +2,774 @@
 Orchestrator - Simple workflow coordinator
 """
 
-from agents.research_agent import enrich_prospect
-from agents.content_agent import generate_email
-from agents.publishing_agent import send_email
+from agents.research_agent import enrich_prospects_batch
+from agents.content_agent import generate_email, generate_emails, fix_emails
+from agents.publishing_agent import send_email, send_bulk
+from agents.scheduler import plan, calls_per_prospect, get_quota_ledger
+from utils.config import (
+    ENRICH_CONCURRENCY, RESEARCH_BATCH_SIZE, COMPANY_RESEARCH_TTL_DAYS,
+    EMAIL_MODE, EMAIL_MAX_CONTACTS, EMAIL_SUBJECT_VARIANTS,
+    VALIDATION_ENABLED, VALIDATION_FIX_ROUNDS, VALIDATION_FIX_BATCH_SIZE
+)
+from utils.gemini_client import get_client
+from utils.model_router import get_model_router
+from utils.session_store import get_session_store, get_session_index, make_prospect_id
+from utils.company_index import get_company_index
+from utils.delivery_log import get_delivery_log
+from utils.job_queue import get_job_queue
+from utils.metrics import inc, span
+from utils.prompts import RESEARCH, RESEARCH_BATCH, EMAIL, EMAIL_MULTI
+from utils.validators import (
+    REPAIRED, validate_email, needs_rewrite, body_signature, duplicate_issue, get_duplicate_index
+)
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import json
-import os
-
-SESSION_DIR = "sessions"
-os.makedirs(SESSION_DIR, exist_ok=True)
+import time
 
 def save_session(prospect_id: str, data: dict):
-    """Save session state to file"""
-    with open(f"{SESSION_DIR}/{prospect_id}.json", 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save session state to the session store"""
+    with span("session_io", op="put"):
+        get_session_index().put(prospect_id, data)
+
+def save_sessions(sessions: dict):
+    """Save several sessions in one transaction"""
+    with span("session_io", op="put_many"):
+        get_session_index().put_many(sessions)
+
+def load_sessions(prospect_ids: list) -> dict:
+    """Load several sessions in one query"""
+    with span("session_io", op="get_many"):
+        return get_session_index().get_many(prospect_ids)
 
 def load_session(prospect_id: str):
-    """Load session state from file"""
+    """Load session state from the session store"""
     try:
-        with open(f"{SESSION_DIR}/{prospect_id}.json", 'r') as f:
-            return json.load(f)
-    except:
+        with span("session_io", op="get"):
+            return get_session_index().get(prospect_id)
+    except Exception as e:
+        print(f"[ORCHESTRATOR] Could not load session {prospect_id}: {str(e)}")
         return None
 
-def run_campaign(prospect_id: str, prospect: dict, approved: bool = False):
+# Stage graph: research -> content -> approval -> publish
+#
+# Each stage records a fingerprint of its inputs under session["stages"].
+# A stage re-runs only when that fingerprint changes, so editing the email
+# prompt regenerates emails without re-researching, and vice versa.
+
+
+def _fingerprint(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def research_fingerprint(prospect: dict) -> str:
+    """Inputs to research: the company fields it reads, both research prompts and their models"""
+    fields = [prospect.get(k) for k in ("company_name", "industry", "location")]
+    return _fingerprint("research", fields, RESEARCH.fingerprint, RESEARCH_BATCH.fingerprint, _research_models())
+
+
+def content_fingerprint(enriched: dict) -> str:
+    """Inputs to content: the research output, the email prompt(s) and their models"""
+    router = get_model_router()
+    if EMAIL_MODE == "multi":
+        return _fingerprint("content", enriched, EMAIL.fingerprint, EMAIL_MULTI.fingerprint,
+                            EMAIL_MAX_CONTACTS, EMAIL_SUBJECT_VARIANTS,
+                            router.primary("content_multi"), router.primary("content"))
+    return _fingerprint("content", enriched, EMAIL.fingerprint, router.primary("content"))
+
+
+def company_research_fingerprint() -> str:
+    """Inputs to a company's shared research record: both research prompts and their models"""
+    return _fingerprint("company", RESEARCH.fingerprint, RESEARCH_BATCH.fingerprint, _research_models())
+
+
+def _research_models() -> list:
+    # The tier's configured models (not the Gemini client, which approve/send paths
+    # don't need); a temporary failover doesn't make research stale
+    router = get_model_router()
+    return [router.primary("research"), router.primary("research_batch")]
+
+
+def _link_companies(items: list, campaign_id: str = None) -> list:
+    """Resolve (prospect_id, prospect) pairs to company IDs and point the prospects at them"""
+    index = get_company_index()
+    company_ids = index.resolve_many([prospect for _, prospect in items])
+    index.link_many([(prospect_id, company_id, campaign_id) for (prospect_id, _), company_id in zip(items, company_ids)])
+    return company_ids
+
+
+def _research_companies(items: list) -> list:
+    """
+    Research for (company_id, prospect) pairs through the company index
+    
+    Companies with fresh stored research cost no API call; every other
+    company is researched once, however many of the prospects belong to it.
+    
+    Returns:
+        Enriched dicts in item order, labelled with each prospect's own fields
+    """
+    index = get_company_index()
+    fingerprint = company_research_fingerprint()
+    research = index.get_research_many({company_id for company_id, _ in items}, fingerprint)
+    
+    todo = {}
+    for company_id, prospect in items:
+        if company_id not in research:
+            todo.setdefault(company_id, prospect)
+    if todo:
+        fresh = dict(zip(todo, enrich_prospects_batch(list(todo.values()))))
+        index.put_research_many({cid: r for cid, r in fresh.items() if not r.get("error")}, fingerprint)
+        research.update(fresh)
+    
+    inc("company_research_total", len(todo), result="researched")
+    inc("company_research_total", len(items) - len(todo), result="reused")
+    
+    results = []
+    for company_id, prospect in items:
+        enriched = dict(research[company_id])
+        for key in ("company_name", "industry", "location"):
+            enriched[key] = prospect.get(key, "Unknown")
+        results.append(enriched)
+    return results
+
+
+def _mark_stage(session: dict, stage: str, fingerprint: str, **extra):
+    session.setdefault("stages", {})[stage] = {"fingerprint": fingerprint, "at": time.time(), **extra}
+
+
+def _stage_is_current(session: dict, stage: str, fingerprint: str, output_key: str) -> bool:
+    """True if the stage's saved output was produced from these inputs"""
+    output = session.get(output_key)
+    if not output or output.get("error"):
+        # Fallback output from a failed call is never checkpointed
+        return False
+    record = session.get("stages", {}).get(stage)
+    if record is None:
+        # Sessions saved before checkpointing: adopt their output as current
+        _mark_stage(session, stage, fingerprint)
+        return True
+    return record["fingerprint"] == fingerprint
+
+
+def _research_is_current(session: dict, fingerprint: str) -> bool:
+    """Research inputs unchanged and not older than the company research TTL"""
+    if not _stage_is_current(session, "research", fingerprint, "enriched_data"):
+        return False
+    return time.time() - session["stages"]["research"]["at"] < COMPANY_RESEARCH_TTL_DAYS * 86400
+
+
+def stale_stages(session: dict) -> list:
+    """Names of the stages whose saved output no longer matches its inputs"""
+    stale = []
+    prospect = session.get("prospect") or {}
+    if not _research_is_current(session, research_fingerprint(prospect)):
+        return ["research", "content"]
+    if not _stage_is_current(session, "content", content_fingerprint(session["enriched_data"]), "email"):
+        stale.append("content")
+    return stale
+
+
+def _content_stage(session: dict, regenerate: bool = False, on_partial=None, hedge: bool = False) -> bool:
+    """Run content if its inputs changed (or regenerate is set); returns True if it ran"""
+    fingerprint = content_fingerprint(session["enriched_data"])
+    if not regenerate and _stage_is_current(session, "content", fingerprint, "email"):
+        return False
+
+    if EMAIL_MODE == "multi":
+        # One call drafts every contact's email; the first is selected until the user picks another
+        session["emails"] = generate_emails(session["enriched_data"], use_cache=not regenerate, hedge=hedge)
+        session["email"] = dict(session["emails"][0])
+        if on_partial:
+            on_partial(session["email"]["subject"], session["email"]["body"])
+    else:
+        session.pop("emails", None)
+        session["email"] = generate_email(
+            session["enriched_data"], use_cache=not regenerate, on_partial=on_partial, hedge=hedge
+        )
+    inc("prospects_drafted_total")
+    if not session["email"].get("error"):
+        _mark_stage(session, "content", fingerprint)
+    # A new email needs a new approval
+    session.get("stages", {}).pop("approval", None)
+    session["status"] = "pending_approval"
+    return True
+
+
+def _new_drafts(items: list) -> dict:
+    """{owner: (session, index)} for each draft of these (prospect_id, session) pairs"""
+    drafts = {}
+    for prospect_id, session in items:
+        if session.get("emails"):
+            for index, draft in enumerate(session["emails"]):
+                # Fallback drafts from a failed call aren't checked or rewritten
+                if not draft.get("error"):
+                    drafts[f"{prospect_id}#{index}"] = (session, index)
+        elif session.get("email") and not session["email"].get("error"):
+            drafts[f"{prospect_id}#0"] = (session, None)
+    return drafts
+
+
+def _get_draft(session: dict, index) -> dict:
+    return session["email"] if index is None else session["emails"][index]
+
+
+def _set_draft(session: dict, index, draft: dict):
+    if index is None:
+        session["email"] = draft
+        return
+    session["emails"][index] = draft
+    if index == 0:
+        # The first draft is the one selected until the user picks another
+        session["email"] = dict(draft)
+
+
+def _fix_request(owner: str, session: dict, draft: dict, issues: list) -> dict:
+    enriched = session.get("enriched_data") or {}
+    contacts = enriched.get("contacts") or []
+    contact = draft.get("contact") or (contacts[0] if contacts else {})
+    return {
+        "id": owner,
+        "company_name": enriched.get("company_name", "Company"),
+        "contact_name": contact.get("name", "Decision Maker"),
+        "contact_title": contact.get("title", "Executive"),
+        "problems": [issue.message for issue in issues if needs_rewrite([issue])],
+        "subject": draft.get("subject", ""),
+        "body": draft.get("body", ""),
+    }
+
+
+def _validate_drafts(items: list, campaign_id: str = None):
+    """
+    Check the new drafts of (prospect_id, session) pairs before they go to approval
+    
+    Cheap problems are repaired locally (see utils.validators). Drafts that
+    still fail - wrong length, unusable subject, unfilled placeholders, the
+    same body as another draft in the campaign - are rewritten together,
+    VALIDATION_FIX_BATCH_SIZE per call. Whatever is still wrong after
+    VALIDATION_FIX_ROUNDS is saved on the draft as "issues" for the reviewer.
+    """
+    if not VALIDATION_ENABLED:
+        return
+    drafts = _new_drafts(items)
+    checking = list(drafts)
+    issues = {}
+    rewritten = set()
+    
+    for round_number in range(VALIDATION_FIX_ROUNDS + 1):
+        for owner in checking:
+            session, index = drafts[owner]
+            draft = _get_draft(session, index)
+            draft, issues[owner] = validate_email(draft, session.get("enriched_data"))
+            _set_draft(session, index, draft)
+        
+        clashes = get_duplicate_index().claim_many(campaign_id, [
+            (owner, body_signature(_get_draft(*drafts[owner])["body"])) for owner in checking
+        ])
+        for owner in clashes:
+            issues[owner].append(duplicate_issue())
+        
+        failing = [owner for owner in checking if needs_rewrite(issues[owner])]
+        if not failing or round_number == VALIDATION_FIX_ROUNDS:
+            break
+        
+        requests = []
+        for owner in failing:
+            session, index = drafts[owner]
+            draft = _get_draft(session, index)
+            requests.append(_fix_request(owner, session, draft, issues[owner]))
+        fixes = {}
+        for i in range(0, len(requests), VALIDATION_FIX_BATCH_SIZE):
+            fixes.update(fix_emails(requests[i:i + VALIDATION_FIX_BATCH_SIZE]))
+        
+        for owner, fix in fixes.items():
+            if owner not in drafts:
+                continue
+            session, index = drafts[owner]
+            draft = dict(_get_draft(session, index))
+            draft["body"] = fix["body"]
+            if fix["subject"]:
+                draft["subject"] = fix["subject"]
+                if draft.get("subject_variants"):
+                    draft["subject_variants"] = [fix["subject"]] + draft["subject_variants"][1:]
+            _set_draft(session, index, draft)
+            rewritten.add(owner)
+        # Only the rewritten drafts need checking again
+        checking = [owner for owner in failing if owner in fixes]
+    
+    for owner, (session, index) in drafts.items():
+        draft = _get_draft(session, index)
+        open_issues = [issue.message for issue in issues[owner] if issue.action != REPAIRED]
+        if open_issues:
+            draft["issues"] = open_issues
+        else:
+            draft.pop("issues", None)
+        _set_draft(session, index, draft)
+        
+        if open_issues:
+            result = "flagged"
+        elif owner in rewritten:
+            result = "rewritten"
+        elif issues[owner]:
+            result = "repaired"
+        else:
+            result = "passed"
+        inc("email_validation_total", result=result)
+
+
+def _check_drafts(items: list, campaign_id: str = None):
+    """_validate_drafts, but a failure leaves the drafts as they are rather than failing the prospects"""
+    try:
+        _validate_drafts(items, campaign_id)
+    except Exception as e:
+        print(f"[ORCHESTRATOR] Validation failed, drafts kept unchecked: {str(e)}")
+
+
+def _publish_stage(session: dict) -> dict:
+    """Send the approved email once; a repeat approval of the same email doesn't resend it"""
+    fingerprint = session["stages"]["approval"]["fingerprint"]
+    published = session["stages"].get("publish")
+    if published and published["fingerprint"] == fingerprint and session.get("status") == "sent":
+        return session.get("result", {})
+
+    result = send_email(session["email"], session["enriched_data"])
+    # A single approval shouldn't wait for the next send to be recorded
+    try:
+        get_delivery_log().flush()
+    except Exception as e:
+        # Still buffered and retried; the email went out, so the session must say so
+        print(f"[ORCHESTRATOR] Could not write send events: {str(e)}")
+    if result["status"] == "sent":
+        _mark_stage(session, "publish", fingerprint)
+    return result
+
+
+def run_campaign(prospect_id: str, prospect: dict = None, approved: bool = False, regenerate: bool = False,
+                 campaign_id: str = None, on_partial=None, email: dict = None):
     """
     Run campaign workflow with state persistence
     
+    Walks the stage graph, re-running only stages whose inputs changed
+    since they were saved.
+    
     Args:
         prospect_id: Unique ID for session
-        prospect: Prospect data
-        approved: If True, send email
+        prospect: Prospect data (defaults to the saved one)
+        approved: If True, approve the saved email and send it
+        regenerate: If True, re-run the content stage with a fresh (uncached)
+            call; research is reused unless its own inputs changed
+        campaign_id: Optional campaign (e.g. uploaded file) the prospect belongs to
+        on_partial: Optional callback(subject, body) to stream the email as it is written
+        email: With approved, the (possibly edited) email to send instead of the saved one
     
     Returns:
         Campaign result
     """
     
     # Try to load existing session
-    session = load_session(prospect_id)
+    session = load_session(prospect_id) or {}
+    prospect = prospect or session.get("prospect")
+    session["prospect"] = prospect
+    session["campaign_id"] = campaign_id or session.get("campaign_id")
+    
+    if approved and email:
+        session["email"] = {**(session.get("email") or {}), **email}
     
-    if session and approved:
-        # Resume: Send email
-        result = send_email(session['email'], session['enriched_data'])
-        session['status'] = 'sent'
+    if approved and session.get("email"):
+        # Approve exactly the email the user saw - upstream stages aren't re-run here
+        _mark_stage(session, "approval", content_fingerprint(session["enriched_data"]))
+        result = _publish_stage(session)
+        session['status'] = result['status']
         session['result'] = result
+        session['updated_at'] = time.time()
         save_session(prospect_id, session)
         return session
     
-    # First run: Enrich and generate
-    enriched = enrich_prospect(prospect)
-    email = generate_email(enriched)
+    # Research stage
+    session["company_id"] = _link_companies([(prospect_id, prospect)], session["campaign_id"])[0]
+    fingerprint = research_fingerprint(prospect)
+    if not _research_is_current(session, fingerprint):
+        session["enriched_data"] = _research_companies([(session["company_id"], prospect)])[0]
+        if not session["enriched_data"].get("error"):
+            _mark_stage(session, "research", fingerprint)
+    else:
+        print(f"[ORCHESTRATOR] {prospect_id}: research is current, reusing it")
     
-    session = {
-        "status": "pending_approval",
-        "enriched_data": enriched,
-        "email": email
-    }
+    # Content stage
+    # Someone is waiting on a regeneration: hedge against a slow model
+    if _content_stage(session, regenerate, on_partial, hedge=regenerate):
+        _check_drafts([(prospect_id, session)], session.get("campaign_id"))
+    else:
+        print(f"[ORCHESTRATOR] {prospect_id}: email is current, reusing it")
     
+    session["updated_at"] = time.time()
     save_session(prospect_id, session)
     return session
+
+
+def _run_batch(batch: list, campaign_id: str = None) -> list:
+    """
+    Research + content for a batch of (key, prospect_id, prospect), saved together
+    
+    Only stale stages run: prospects whose research is current skip the
+    research call, and only those whose content inputs changed get a new email.
+    """
+    existing = load_sessions([prospect_id for _, prospect_id, _ in batch])
+    company_ids = _link_companies([(prospect_id, prospect) for _, prospect_id, prospect in batch], campaign_id)
+    sessions = {}
+    to_research = []
+    for (key, prospect_id, prospect), company_id in zip(batch, company_ids):
+        session = existing.get(prospect_id) or {}
+        session["prospect"] = prospect
+        session["campaign_id"] = campaign_id or session.get("campaign_id")
+        session["company_id"] = company_id
+        fingerprint = research_fingerprint(prospect)
+        if not _research_is_current(session, fingerprint):
+            to_research.append((prospect_id, fingerprint))
+        sessions[prospect_id] = session
+    
+    if to_research:
+        enriched_list = _research_companies(
+            [(sessions[pid]["company_id"], sessions[pid]["prospect"]) for pid, _ in to_research]
+        )
+        for (prospect_id, fingerprint), enriched in zip(to_research, enriched_list):
+            sessions[prospect_id]["enriched_data"] = enriched
+            if not enriched.get("error"):
+                _mark_stage(sessions[prospect_id], "research", fingerprint)
+    
+    results = []
+    drafted = []
+    for key, prospect_id, _ in batch:
+        session = sessions[prospect_id]
+        try:
+            if _content_stage(session):
+                drafted.append((prospect_id, session))
+            if session.get("status") in (None, "pending", "queued"):
+                session["status"] = "pending_approval"
+            session["updated_at"] = time.time()
+        except Exception as e:
+            print(f"[ORCHESTRATOR] Prospect {prospect_id} failed: {str(e)}")
+            sessions.pop(prospect_id)
+            session = {"status": "error", "error": str(e)}
+        results.append((key, session))
+    
+    _check_drafts([(pid, session) for pid, session in drafted if pid in sessions], campaign_id)
+    
+    print(f"[ORCHESTRATOR] Batch of {len(batch)}: {len(to_research)} needed research, "
+          f"{len(batch) - len(to_research)} already current")
+    save_sessions(sessions)
+    return results
+
+
+def _run_items(items: list, concurrency: int, on_progress, research_batch_size: int,
+               campaign_id: str = None) -> dict:
+    """Run (key, prospect_id, prospect) items through batched research + content, keyed results"""
+    total = len(items)
+    results = {}
+    
+    if not items:
+        return results
+    
+    batch_size = max(1, research_batch_size)
+    batches = [items[i:i + batch_size] for i in range(0, total, batch_size)]
+    workers = max(1, min(concurrency, len(batches)))
+    print(f"[ORCHESTRATOR] Running {total} prospects in {len(batches)} batches with {workers} workers")
+    
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="campaign") as pool:
+        futures = {pool.submit(_run_batch, batch, campaign_id): batch for batch in batches}
+        
+        for future in as_completed(futures):
+            try:
+                batch_results = future.result()
+            except Exception as e:
+                print(f"[ORCHESTRATOR] Batch failed: {str(e)}")
+                batch_results = [(key, {"status": "error", "error": str(e)}) for key, _, _ in futures[future]]
+            
+            for key, result in batch_results:
+                done += 1
+                results[key] = result
+                if on_progress:
+                    on_progress(done, total, key, result)
+    
+    _log_client_stats()
+    return results
+
+
+def run_campaigns(prospects: list, concurrency: int = ENRICH_CONCURRENCY, on_progress=None, skip: set = None,
+                  research_batch_size: int = RESEARCH_BATCH_SIZE, campaign_id: str = None) -> dict:
+    """
+    Run the enrich -> generate workflow for many prospects at once
+    
+    Args:
+        prospects: List of prospect dicts (position is the prospect index)
+        concurrency: Max number of prospects in flight at the same time
+        on_progress: Optional callback(done, total, idx, result), called from
+            the calling thread as each prospect finishes
+        skip: Optional set of indexes to leave out (e.g. already enriched)
+        research_batch_size: Companies packed into one research prompt
+            (1 = one research call per prospect)
+        campaign_id: Optional campaign recorded on every session; with the
+            company name it makes the session ID (see make_prospect_id)
+    
+    Returns:
+        Dict of prospect index -> campaign result
+    """
+    
+    skip = skip or set()
+    items = [
+        (idx, make_prospect_id(campaign_id, p.get("company_name")), p)
+        for idx, p in enumerate(prospects) if idx not in skip
+    ]
+    return _run_items(items, concurrency, on_progress, research_batch_size, campaign_id)
+
+
+def run_pending(campaign_id: str, concurrency: int = ENRICH_CONCURRENCY, on_progress=None,
+                research_batch_size: int = RESEARCH_BATCH_SIZE) -> dict:
+    """
+    Enrich a campaign's 'pending' (and previously deferred) sessions in priority order
+    
+    The scheduler orders them by value and defers what doesn't fit in the
+    campaign's daily quota.
+    
+    Args:
+        campaign_id: Campaign to enrich
+        on_progress: Optional callback(done, total, prospect_id, result)
+    
+    Returns:
+        Dict of prospect_id -> campaign result
+    """
+    
+    selected, deferred = _plan_enrichment(campaign_id, research_batch_size)
+    sessions = load_sessions([pid for pid, _ in selected])
+    items = [
+        (pid, pid, sessions[pid]['prospect']) for pid, _ in selected if sessions.get(pid, {}).get('prospect')
+    ]
+    return _run_items(items, concurrency, on_progress, research_batch_size, campaign_id)
+
+
+def _log_client_stats():
+    client = get_client()
+    print(f"[ORCHESTRATOR] Gemini connection stats: {client.stats.snapshot()}")
+    if client.cache is not None:
+        print(f"[ORCHESTRATOR] Response cache stats: {client.cache.stats()}")
+
+
+def send_approved(prospect_ids: list, on_progress=None) -> dict:
+    """
+    Send every approved prospect's email through the bulk publishing queue
+    
+    Prospects not in 'approved' status (already sent, skipped, or handed
+    back to the user) are ignored, so a retried job never sends twice.
+    
+    Args:
+        prospect_ids: Session IDs to send
+        on_progress: Optional callback(done, total, prospect_id, result)
+    
+    Returns:
+        Dict of prospect_id -> updated session
+    """
+    
+    sessions = load_sessions(prospect_ids)
+    ready = [(pid, s) for pid, s in sessions.items() if s.get('email') and s.get('status') == 'approved']
+    if not ready:
+        return {}
+    
+    def progress(done, total, position, result):
+        if on_progress:
+            on_progress(done, total, ready[position][0], result)
+    
+    results = send_bulk(
+        [(s['email'], s['enriched_data']) for _, s in ready],
+        on_progress=progress
+    )
+    
+    updated = {}
+    for (pid, session), result in zip(ready, results):
+        fingerprint = content_fingerprint(session['enriched_data'])
+        _mark_stage(session, "approval", fingerprint)
+        if result.get('status') == 'sent':
+            _mark_stage(session, "publish", fingerprint)
+        session['status'] = result.get('status', 'failed')
+        session['result'] = result
+        session['updated_at'] = time.time()
+        updated[pid] = session
+    
+    save_sessions(updated)
+    return updated
+
+
+# Background jobs (see worker.py): the dashboard enqueues, workers run them
+
+# Above any score-based enrichment priority, so approved emails go out first
+SEND_JOB_PRIORITY = 1_000_000
+
+
+def _set_status(prospect_ids: list, status: str, only_from: tuple = None) -> list:
+    """Set status on the prospects (those currently in only_from, if given); returns the IDs changed"""
+    sessions = load_sessions(prospect_ids)
+    changed = {}
+    for pid, session in sessions.items():
+        if only_from is None or session.get('status') in only_from:
+            session['status'] = status
+            session['updated_at'] = time.time()
+            changed[pid] = session
+    save_sessions(changed)
+    return list(changed)
+
+
+def _plan_enrichment(campaign_id: str, batch_size: int) -> tuple:
+    """Scheduler plan for a campaign's pending/deferred prospects; marks the deferred ones"""
+    store = get_session_store()
+    waiting = store.query(status="pending", campaign_id=campaign_id) + \
+        store.query(status="deferred", campaign_id=campaign_id)
+    selected, deferred = plan(campaign_id, waiting, batch_size)
+    _set_status(deferred, "deferred")
+    return selected, deferred
+
+
+def _enqueue_batches(selected: list, campaign_id: str, batch_size: int, priority: int) -> int:
+    """
+    One "enrich" job per research batch of [(prospect_id, score)], highest scores
+    first; marks the prospects 'queued'. Returns the job count
+    """
+    batch_size = max(1, batch_size)
+    # What plan() reserved per prospect and on which day, so abandon_job can give back the unused part
+    quota = {"day": get_quota_ledger().today(), "calls_each": calls_per_prospect(batch_size)}
+    jobs = []
+    for i in range(0, len(selected), batch_size):
+        batch = selected[i:i + batch_size]
+        # Workers claim by priority, so batches across campaigns interleave by value
+        jobs.append((
+            "enrich",
+            {"campaign_id": campaign_id, "prospect_ids": [pid for pid, _ in batch], "quota": quota},
+            priority + round(max(value for _, value in batch) * 100)
+        ))
+    get_job_queue().enqueue_many(jobs, group_id=campaign_id)
+    _set_status([pid for pid, _ in selected], "queued")
+    return len(jobs)
+
+
+def enqueue_enrichment(campaign_id: str, batch_size: int = RESEARCH_BATCH_SIZE, priority: int = 0) -> int:
+    """
+    Queue every pending prospect of a campaign for the background workers
+    
+    The scheduler orders them by value (most valuable batches get the
+    highest job priority) and marks what doesn't fit in the campaign's
+    daily quota 'deferred'; those are reconsidered on the next call.
+    Prospects are grouped into research batches, one job per batch, and
+    marked 'queued' so a second click doesn't queue them twice.
+    
+    Returns:
+        Number of prospects queued
+    """
+    
+    selected, _ = _plan_enrichment(campaign_id, batch_size)
+    if not selected:
+        return 0
+    
+    jobs = _enqueue_batches(selected, campaign_id, batch_size, priority)
+    print(f"[ORCHESTRATOR] Queued {len(selected)} prospects in {jobs} jobs for {campaign_id}")
+    return len(selected)
+
+
+def enqueue_refresh(campaign_id: str, batch_size: int = RESEARCH_BATCH_SIZE, priority: int = 0) -> int:
+    """
+    Queue drafted prospects whose research or email is out of date
+    (e.g. after a prompt edit); workers re-run only the stale stages.
+    
+    Returns:
+        Number of prospects queued
+    """
+    
+    store = get_session_store()
+    stale = [
+        (pid, session) for pid, session in store.query(status="pending_approval", campaign_id=campaign_id)
+        if stale_stages(session)
+    ]
+    # Deferred refreshes simply keep their current draft
+    selected, _ = plan(campaign_id, stale, batch_size)
+    if not selected:
+        return 0
+    
+    jobs = _enqueue_batches(selected, campaign_id, batch_size, priority)
+    print(f"[ORCHESTRATOR] Queued {len(selected)} stale prospects in {jobs} jobs for {campaign_id}")
+    return len(selected)
+
+
+def approve(prospect_ids: list) -> list:
+    """
+    Mark drafts awaiting approval as 'approved'; returns the IDs approved
+    
+    A prospect that was already sent, skipped or has no email yet is left
+    as it is, so selecting it again doesn't send it twice or strand it as
+    'approved'.
+    """
+    sessions = load_sessions(list(prospect_ids))
+    ready = [
+        pid for pid in dict.fromkeys(prospect_ids)
+        if sessions.get(pid, {}).get('email') and sessions[pid].get('status') == 'pending_approval'
+    ]
+    return _set_status(ready, "approved", only_from=("pending_approval",)) if ready else []
+
+
+def enqueue_send(prospect_ids: list, campaign_id: str = None) -> int:
+    """
+    Approve prospects (see approve) and queue them for sending, ahead of any enrichment work
+    
+    Returns:
+        Number of prospects queued
+    """
+    # Marked before the job exists, since workers only send 'approved' prospects
+    approved = approve(prospect_ids)
+    if not approved:
+        return 0
+    get_job_queue().enqueue("send", {"prospect_ids": approved}, SEND_JOB_PRIORITY, group_id=campaign_id)
+    return len(approved)
+
+
+def enrich_batch(prospect_ids: list, campaign_id: str = None) -> dict:
+    """Job handler: research + content for one batch of stored prospects"""
+    sessions = load_sessions(prospect_ids)
+    # Prospects finished before a crash aren't redone when the job is retried
+    items = [
+        (pid, pid, sessions[pid]['prospect']) for pid in prospect_ids
+        if pid in sessions and sessions[pid].get('status') in ("pending", "queued")
+    ]
+    if items:
+        _run_batch(items, campaign_id)
+    return {"enriched": len(items), "skipped": len(prospect_ids) - len(items)}
+
+
+def run_job(job: dict) -> dict:
+    """Dispatch a claimed job to its handler"""
+    payload = job["payload"]
+    if job["kind"] == "enrich":
+        return enrich_batch(payload["prospect_ids"], payload.get("campaign_id"))
+    if job["kind"] == "send":
+        updated = send_approved(payload["prospect_ids"])
+        return {"sent": sum(1 for s in updated.values() if s['status'] == 'sent'), "total": len(updated)}
+    raise ValueError(f"Unknown job kind: {job['kind']}")
+
+
+def abandon_job(job: dict):
+    """Called when a job has used all its attempts: hand its prospects back to the user"""
+    payload = job["payload"]
+    if job["kind"] == "enrich":
+        # Refresh jobs go back to their previous draft, new prospects to 'pending';
+        # the failure is counted so the scheduler ranks them lower next time
+        sessions = load_sessions(payload["prospect_ids"])
+        returned = 0
+        for session in sessions.values():
+            if session.get("status") == "queued":
+                session["retries"] = session.get("retries", 0) + 1
+                session["status"] = "pending_approval" if session.get("email") else "pending"
+                session["updated_at"] = time.time()
+                returned += 1
+        save_sessions(sessions)
+
+        # Their reserved calls go back to the campaign's budget for that day
+        quota = payload.get("quota")
+        if quota and returned:
+            get_quota_ledger().release(payload.get("campaign_id"), returned * quota["calls_each"], quota["day"])
+    elif job["kind"] == "send":
+        _set_status(payload["prospect_ids"], "pending_approval", only_from=("approved",))
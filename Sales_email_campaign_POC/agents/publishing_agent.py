@@ -2,32 +2,278 @@
 Publishing Agent - Sends emails and tracks
 """
 
-import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from utils.config import DATA_DIR
+from email.message import EmailMessage
+from utils.config import (
+    EMAIL_TRANSPORT, SENDER_EMAIL, SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+    SMTP_USE_TLS, SMTP_POOL_SIZE, SMTP_MAX_MESSAGES_PER_CONNECTION,
+    SEND_CONCURRENCY, SEND_PER_DOMAIN_PER_MINUTE
+)
+from utils.delivery_log import get_delivery_log
+from utils.metrics import span
+from utils.rate_limiter import TokenBucket
+
+
+class Transport:
+    """Delivers one EmailMessage; implementations must be thread-safe"""
+
+    def send(self, message: EmailMessage):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MockTransport(Transport):
+    """Doesn't deliver anything, the delivery log is the only record"""
+
+    def send(self, message: EmailMessage):
+        pass
+
+
+class SMTPTransport(Transport):
+    """
+    Pool of persistent SMTP connections shared by all sending threads,
+    so thousands of messages go out over a handful of sessions.
+    """
+
+    def __init__(self, host: str, port: int, username: str = None, password: str = None,
+                 use_tls: bool = False, pool_size: int = 4, max_messages_per_connection: int = 100,
+                 timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.messages_sent = 0
+
+    def _connect(self):
+        # Only the smtp transport needs smtplib (and the ssl module it loads)
+        import smtplib
+
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        conn.ehlo()
+        if self.use_tls:
+            conn.starttls()
+            conn.ehlo()
+        if self.username:
+            conn.login(self.username, self.password)
+        with self._lock:
+            self.connections_opened += 1
+        return [conn, 0]
+
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+
+    def _checkin(self, entry, healthy: bool):
+        conn, used = entry
+        if healthy and used < self.max_messages_per_connection:
+            self._idle.put(entry)
+        else:
+            self._quit(conn)
+        self._slots.release()
+
+    @staticmethod
+    def _quit(conn):
+        try:
+            conn.quit()
+        except Exception:
+            pass
+
+    def send(self, message: EmailMessage):
+        import smtplib
+
+        entry = self._checkout()
+        try:
+            try:
+                entry[0].send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # Server dropped an idle pooled connection, reconnect once
+                self._quit(entry[0])
+                entry[:] = self._connect()
+                entry[0].send_message(message)
+        except Exception:
+            self._checkin(entry, healthy=False)
+            raise
+        entry[1] += 1
+        with self._lock:
+            self.messages_sent += 1
+        self._checkin(entry, healthy=True)
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"connections_opened": self.connections_opened, "messages_sent": self.messages_sent}
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport:
+    """Return the process-wide transport selected by EMAIL_TRANSPORT"""
+    global _transport
+
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                if EMAIL_TRANSPORT == "smtp":
+                    _transport = SMTPTransport(
+                        SMTP_HOST, SMTP_PORT, SMTP_USERNAME, SMTP_PASSWORD,
+                        SMTP_USE_TLS, SMTP_POOL_SIZE, SMTP_MAX_MESSAGES_PER_CONNECTION
+                    )
+                else:
+                    _transport = MockTransport()
+    return _transport
+
+
+def build_message(email_data: dict, to_address: str, sender: str = SENDER_EMAIL) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = sender
+    message["To"] = to_address
+    message["Subject"] = email_data["subject"]
+    message.set_content(email_data["body"])
+    return message
+
+
+def send_email(email_data: dict, prospect: dict, transport: Transport = None) -> dict:
+    """Send one email through the transport and append it to the delivery log"""
 
-def send_email(email_data: dict, prospect: dict) -> dict:
-    """Mock send - just logs to file"""
-    
     result = {
         "prospect": prospect["company_name"],
-        "to": prospect["contacts"][0]["email"],
+        "to": _recipient(email_data, prospect),
         "subject": email_data["subject"],
         "sent_at": datetime.now().isoformat(),
         "status": "sent"
     }
-    
-    # Log to file
-    log_file = f"{DATA_DIR}/sent_emails.json"
+
     try:
-        with open(log_file, 'r') as f:
-            logs = json.load(f)
-    except:
-        logs = []
-    
-    logs.append(result)
-    
-    with open(log_file, 'w') as f:
-        json.dump(logs, f, indent=2)
-    
+        with span("send"):
+            (transport or get_transport()).send(build_message(email_data, result["to"]))
+    except Exception as e:
+        print(f"[PUBLISHING] Send to {result['to']} failed: {str(e)}")
+        result["status"] = "failed"
+        result["error"] = str(e)
+
+    # Append one line to the delivery log, constant cost however long it gets
+    get_delivery_log().append(result)
+
     return result
+
+
+def _recipient(email_data: dict, prospect: dict) -> str:
+    """The contact the draft was written for, else the prospect's first contact"""
+    return email_data.get("to") or prospect["contacts"][0]["email"]
+
+
+def _domain(email_data: dict, prospect: dict) -> str:
+    try:
+        return _recipient(email_data, prospect).rsplit("@", 1)[1].lower()
+    except (KeyError, IndexError, AttributeError):
+        return ""
+
+
+async def _send_bulk_async(items: list, transport: Transport, concurrency: int,
+                           per_domain_per_minute: float, on_progress) -> list:
+    import asyncio
+
+    work = asyncio.Queue()
+    for position, item in enumerate(items):
+        work.put_nowait((position, item))
+
+    workers = max(1, min(concurrency, len(items)))
+    # to_thread would otherwise be capped by the default executor's size
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="send")
+    )
+
+    results = [None] * len(items)
+    throttles = {}
+    done = 0
+
+    async def worker():
+        nonlocal done
+        while True:
+            try:
+                position, (email_data, prospect) = work.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            # Per-domain throttle so one big recipient domain doesn't flag us as spam
+            if per_domain_per_minute:
+                bucket = throttles.setdefault(_domain(email_data, prospect), TokenBucket(per_domain_per_minute))
+                delay = bucket.reserve(1, time.monotonic(), bucket.rate)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            try:
+                result = await asyncio.to_thread(send_email, email_data, prospect, transport)
+            except Exception as e:
+                result = {"status": "failed", "error": str(e)}
+            results[position] = result
+            done += 1
+            if on_progress:
+                on_progress(done, len(items), position, result)
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return results
+
+
+def send_bulk(items: list, transport: Transport = None, concurrency: int = SEND_CONCURRENCY,
+              per_domain_per_minute: float = SEND_PER_DOMAIN_PER_MINUTE, on_progress=None) -> list:
+    """
+    Send many emails through a bounded async queue
+
+    Args:
+        items: List of (email_data, enriched_prospect) tuples
+        transport: Transport to use (defaults to EMAIL_TRANSPORT)
+        concurrency: Max messages in flight
+        per_domain_per_minute: Max messages per recipient domain per minute (0 = no limit)
+        on_progress: Optional callback(done, total, position, result)
+
+    Returns:
+        List of send results, same order as items
+    """
+
+    if not items:
+        return []
+    import asyncio
+
+    transport = transport or get_transport()
+    print(f"[PUBLISHING] Sending {len(items)} emails with concurrency {concurrency}")
+    results = asyncio.run(_send_bulk_async(items, transport, concurrency, per_domain_per_minute, on_progress))
+    try:
+        get_delivery_log().flush()
+    except Exception as e:
+        # Still buffered and retried; the sends themselves must be reported
+        print(f"[PUBLISHING] Could not write send events: {str(e)}")
+
+    sent = sum(1 for r in results if r.get("status") == "sent")
+    print(f"[PUBLISHING] Sent {sent}/{len(items)} emails")
+    return results
@@ -2,103 +2,186 @@
 Research Agent - Enriches prospect data using LLM
 """
 
-from utils.gemini_client import GeminiClient
-from utils.config import GOOGLE_API_KEY
+from utils.company_index import canonical_name
+from utils.gemini_client import get_client
+from utils.metrics import inc, span
+from utils.prompts import RESEARCH, RESEARCH_BATCH
+from utils.schemas import (
+    ResearchRecord, RESEARCH_RESPONSE_SCHEMA, RESEARCH_BATCH_RESPONSE_SCHEMA, parse_json_lenient
+)
 
-def enrich_prospect(prospect: dict) -> dict:
+
+def _prospect_fields(prospect: dict):
+    return (
+        prospect.get("company_name", "Unknown"),
+        prospect.get("industry", "Unknown"),
+        prospect.get("location", "Unknown")
+    )
+
+
+def _parse_response(response: str):
+    """Lenient JSON parse, counting clean vs. recovered responses"""
+    with span("parse"):
+        try:
+            parsed, recovered = parse_json_lenient(response)
+        except ValueError:
+            inc("research_parse_total", result="failed")
+            raise
+    inc("research_parse_total", result="recovered" if recovered else "clean")
+    if recovered:
+        print(f"[RESEARCH] Recovered JSON from a malformed response")
+    return parsed
+
+
+def _build_enriched(prospect: dict, record: ResearchRecord) -> dict:
+    company_name, industry, location = _prospect_fields(prospect)
+    return {
+        "company_name": company_name,
+        "industry": industry,
+        "location": location,
+        "contacts": [contact.to_dict() for contact in record.contacts],
+        "company_info": record.company_info.to_dict(),
+        "recent_news": [item.to_text() for item in record.recent_news],
+        "quality_score": len(record.contacts) * 20
+    }
+
+
+def _fallback_enriched(prospect: dict, error: Exception) -> dict:
+    company_name, industry, location = _prospect_fields(prospect)
+    return {
+        "company_name": company_name,
+        "industry": industry,
+        "location": location,
+        "contacts": [],
+        "company_info": {
+            "description": f"{company_name} operates in {industry}",
+            "website": ""
+        },
+        "recent_news": [],
+        "quality_score": 0,
+        "error": str(error)
+    }
+
+
+def _match_records(prospects: list, records: list) -> list:
+    """
+    The batch record for each prospect, or None
+
+    Records are matched on the company index's canonical name, so "Tesla,
+    Inc." answered as "Tesla Inc" still counts. A prospect with no name
+    match takes the record in its own position, if no other prospect's
+    name claimed it (records skipped as incomplete keep their slot as None).
+    """
+    by_name = {}
+    for position, record in enumerate(records):
+        if record is not None:
+            by_name.setdefault(canonical_name(record.company_name), position)
+
+    matched = [by_name.get(canonical_name(p.get("company_name", "Unknown"))) for p in prospects]
+    claimed = set(m for m in matched if m is not None)
+    for n, position in enumerate(matched):
+        if position is None and n < len(records) and records[n] is not None and n not in claimed:
+            matched[n] = n
+            claimed.add(n)
+    return [records[position] if position is not None else None for position in matched]
+
+
+@span("research")
+def enrich_prospect(prospect: dict, use_cache: bool = True) -> dict:
     """
     Enriches prospect with company info, contacts, news using LLM
+
+    use_cache=False forces a fresh Gemini call instead of a cached response
     """
-    
-    company_name = prospect.get("company_name", "Unknown")
-    industry = prospect.get("industry", "Unknown")
-    location = prospect.get("location", "Unknown")
-    
+
+    company_name, industry, location = _prospect_fields(prospect)
+
     print(f"[RESEARCH] Starting research for: {company_name}")
     print(f"[RESEARCH] Industry: {industry}, Location: {location}")
-    
-    # Optimized prompt for Gemini to find real contacts
-    prompt = f"""You are a B2B research assistant. Research this company and find real, actionable contact information.
-
-Company: {company_name}
-Industry: {industry}
-Location: {location}
-
-Find and provide:
-
-1. DECISION MAKERS (3-5 key contacts):
-   - Full name
-   - Exact job title (CEO, CTO, VP Sales, etc.)
-   - Email address (use common patterns: firstname.lastname@company.com)
-   - Phone number if available
-
-2. COMPANY INFORMATION:
-   - Brief description (what they do)
-   - Company website
-
-3. RECENT NEWS (2-3 items from last 6 months):
-   - Funding, product launches, partnerships
-
-Return ONLY valid JSON in this exact format:
-{{
-  "contacts": [
-    {{"name": "John Smith", "title": "CEO", "email": "john.smith@company.com", "linkedin": "https://linkedin.com/in/johnsmith", "phone": "+1-555-0100"}}
-  ],
-  "company_info": {{
-    "description": "Brief description here",
-    "website": "https://company.com",
-    "linkedin": "https://linkedin.com/company/companyname"
-  }},
-  "recent_news": [
-    "Recent activity here"
-  ]
-}}
-
-IMPORTANT: If any information is not found, use "Not Available" instead of leaving it empty."""
-    
+
+    # Instructions go in the system instruction, only the company varies;
+    # JSON mode constrains the answer to RESEARCH_RESPONSE_SCHEMA
+    prompt = RESEARCH.render(company_name=company_name, industry=industry, location=location)
+
+    client = get_client()
     try:
         print(f"[RESEARCH] Calling Gemini API...")
-        client = GeminiClient(GOOGLE_API_KEY)
-        response = client.generate_email(prompt)
+        response = client.generate_email(
+            prompt, use_cache=use_cache, system=RESEARCH.system, schema=RESEARCH_RESPONSE_SCHEMA
+        )
         print(f"[RESEARCH] Received response from Gemini")
-        
-        # Parse JSON response
-        import json
-        
-        # Clean response
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response.replace("```json", "").replace("```", "").strip()
-        elif response.startswith("```"):
-            response = response.replace("```", "").strip()
-        
+
         print(f"[RESEARCH] Parsing JSON response...")
-        enriched = json.loads(response)
-        print(f"[RESEARCH] Found {len(enriched.get('contacts', []))} contacts")
-        
-        return {
-            "company_name": company_name,
-            "industry": industry,
-            "location": location,
-            "contacts": enriched.get("contacts", []),
-            "company_info": enriched.get("company_info", {}),
-            "recent_news": enriched.get("recent_news", []),
-            "quality_score": len(enriched.get("contacts", [])) * 20
-        }
-    
+        record = ResearchRecord.from_dict(_parse_response(response))
+        print(f"[RESEARCH] Found {len(record.contacts)} contacts")
+
+        return _build_enriched(prospect, record)
+
     except Exception as e:
         print(f"[RESEARCH] Error: {str(e)}")
+        # Don't keep serving a response we couldn't use
+        client.forget(prompt, RESEARCH.system, RESEARCH_RESPONSE_SCHEMA)
         # Fallback with minimal data
-        return {
-            "company_name": company_name,
-            "industry": industry,
-            "location": location,
-            "contacts": [],
-            "company_info": {
-                "description": f"{company_name} operates in {industry}",
-                "website": ""
-            },
-            "recent_news": [],
-            "quality_score": 0,
-            "error": str(e)
-        }
+        return _fallback_enriched(prospect, e)
+
+
+@span("research_batch")
+def enrich_prospects_batch(prospects: list, use_cache: bool = True) -> list:
+    """
+    Research several companies in one Gemini call
+
+    The system instruction is sent once for the whole batch and the answer
+    is split back per company. A truncated answer keeps the companies that
+    came through whole; the ones it dropped or mangled are re-researched
+    one at a time.
+
+    Returns:
+        List of enriched dicts, same order as prospects
+    """
+
+    if len(prospects) == 1:
+        return [enrich_prospect(prospects[0], use_cache=use_cache)]
+
+    print(f"[RESEARCH] Starting batch research for {len(prospects)} companies")
+
+    company_lines = "\n".join(
+        f"{n}. Company: {name} | Industry: {industry} | Location: {location}"
+        for n, (name, industry, location) in enumerate(map(_prospect_fields, prospects), start=1)
+    )
+
+    prompt = RESEARCH_BATCH.render(company_lines=company_lines)
+
+    client = get_client()
+    records = []
+    try:
+        print(f"[RESEARCH] Calling Gemini API (batch)...")
+        response = client.generate_email(
+            prompt, use_cache=use_cache, system=RESEARCH_BATCH.system, schema=RESEARCH_BATCH_RESPONSE_SCHEMA
+        )
+        parsed = _parse_response(response)
+        if isinstance(parsed, dict):
+            # Some responses wrap the array, e.g. {"companies": [...]}
+            parsed = next((v for v in parsed.values() if isinstance(v, list)), [])
+        for item in parsed:
+            # A record cut off by truncation is missing its trailing fields - re-run it singly
+            if not isinstance(item, dict) or any(k not in item for k in RESEARCH_RESPONSE_SCHEMA["required"]):
+                records.append(None)
+                continue
+            record = ResearchRecord.from_dict(item)
+            records.append(record if record.company_name else None)
+    except Exception as e:
+        print(f"[RESEARCH] Batch error: {str(e)}")
+        client.forget(prompt, RESEARCH_BATCH.system, RESEARCH_BATCH_RESPONSE_SCHEMA)
+
+    results = []
+    missing = 0
+    for prospect, record in zip(prospects, _match_records(prospects, records)):
+        if record is None:
+            # Dropped or mangled by the batch - research this one on its own
+            missing += 1
+            results.append(enrich_prospect(prospect, use_cache=use_cache))
+        else:
+            results.append(_build_enriched(prospect, record))
+
+    print(f"[RESEARCH] Batch done: {len(prospects) - missing} from batch, {missing} re-run singly")
+    return results
@@ -0,0 +1,201 @@
+"""
+Scheduler - Orders enrichment by prospect value and keeps each campaign within its Gemini quota
+
+Prospects are scored from their budget, industry weight, how fresh the row
+is, how often enrichment already failed for them and (when refreshing) the
+quality of their research, then popped off a max-heap. With a per-campaign
+daily budget, the last SCHEDULER_RESERVE_FRACTION of it only goes to the
+more valuable half of the rows; whatever doesn't fit is deferred until the
+budget resets.
+"""
+
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from utils.config import (
+    CAMPAIGN_DAILY_CALL_BUDGET, SCHEDULER_RESERVE_FRACTION, SCHEDULER_DEFAULT_BUDGET,
+    SCHEDULER_FRESHNESS_HALF_LIFE_DAYS, SCHEDULER_RETRY_PENALTY, INDUSTRY_WEIGHTS, QUOTA_DB_PATH
+)
+from utils.metrics import inc
+
+_MULTIPLIERS = {"k": 1e3, "m": 1e6, "b": 1e9}
+
+
+def parse_budget(value) -> float:
+    """Deal size from a number or text like "$1,200,000", "500k" or "1.2M" (0 if unreadable)"""
+    if isinstance(value, (int, float)):
+        return 0.0 if math.isnan(value) else max(0.0, float(value))
+    match = re.search(r"(\d+(?:\.\d+)?)\s*([kmb])?", str(value or "").lower().replace(",", ""))
+    if not match:
+        return 0.0
+    return float(match[1]) * _MULTIPLIERS.get(match[2], 1)
+
+
+def parse_weights(spec: str) -> dict:
+    """"SaaS=1.5,FinTech=1.2" -> {"saas": 1.5, "fintech": 1.2}"""
+    weights = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() and weight.strip():
+            weights[name.strip().lower()] = float(weight)
+    return weights
+
+
+_industry_weights = parse_weights(INDUSTRY_WEIGHTS)
+
+
+def score(session: dict, now: float = None) -> float:
+    """Expected value of enriching this prospect now; higher goes first"""
+    now = now or time.time()
+    prospect = session.get("prospect") or {}
+
+    budget = parse_budget(prospect.get("budget")) or SCHEDULER_DEFAULT_BUDGET
+    value = math.log10(1 + budget)
+    value *= _industry_weights.get(str(prospect.get("industry") or "").lower(), 1.0)
+
+    # Newer rows are warmer leads; never drops below half the value
+    age_days = max(0.0, now - session.get("created_at", session.get("updated_at", now))) / 86400
+    value *= 0.5 + 0.5 * 0.5 ** (age_days / SCHEDULER_FRESHNESS_HALF_LIFE_DAYS)
+
+    # Each enrichment that already failed makes another try less likely to pay off
+    value *= SCHEDULER_RETRY_PENALTY ** session.get("retries", 0)
+
+    enriched = session.get("enriched_data")
+    if enriched and not enriched.get("error"):
+        # Refreshing: prospects with more contacts found are worth more
+        value *= 0.75 + min(enriched.get("quality_score", 0), 100) / 400
+    return value
+
+
+def calls_per_prospect(batch_size: int) -> float:
+    """Estimated Gemini calls: a share of one research batch plus one email call"""
+    return 1 + 1 / max(1, batch_size)
+
+
+class QuotaLedger:
+    """
+    Estimated Gemini calls reserved per campaign per UTC day (SQLite, shared by processes)
+
+    plan() reserves up front; work that is given up on before it runs is
+    released again, so a failed batch doesn't use up the day's budget.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS quota_usage (
+                campaign_id TEXT NOT NULL,
+                day TEXT NOT NULL,
+                calls REAL NOT NULL,
+                PRIMARY KEY (campaign_id, day)
+            )
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def today() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+    def used(self, campaign_id: str) -> float:
+        row = self._conn().execute(
+            "SELECT calls FROM quota_usage WHERE campaign_id = ? AND day = ?", (campaign_id or "", self.today())
+        ).fetchone()
+        return row[0] if row else 0.0
+
+    def reserve(self, campaign_id: str, calls: float):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO quota_usage (campaign_id, day, calls) VALUES (?, ?, ?) "
+                "ON CONFLICT (campaign_id, day) DO UPDATE SET calls = calls + excluded.calls",
+                (campaign_id or "", self.today(), calls)
+            )
+
+    def release(self, campaign_id: str, calls: float, day: str = None):
+        """Give back calls reserved on `day` (default today) that were never made"""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE quota_usage SET calls = MAX(0, calls - ?) WHERE campaign_id = ? AND day = ?",
+                (calls, campaign_id or "", day or self.today())
+            )
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_quota_ledger() -> QuotaLedger:
+    """Return the process-wide quota ledger"""
+    global _ledger
+
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = QuotaLedger(QUOTA_DB_PATH)
+    return _ledger
+
+
+def plan(campaign_id: str, sessions: list, batch_size: int, budget: float = CAMPAIGN_DAILY_CALL_BUDGET) -> tuple:
+    """
+    Pick which prospects to enrich now, most valuable first, within the campaign's quota
+
+    Args:
+        campaign_id: Campaign the quota is counted against
+        sessions: [(prospect_id, session)] waiting for enrichment
+        batch_size: Research batch size, for the per-prospect call estimate
+        budget: Estimated Gemini calls per campaign per UTC day (0 = unlimited)
+
+    Returns:
+        ([(prospect_id, score)] to run now in priority order, [prospect_id] deferred)
+    """
+
+    now = time.time()
+    heap = [(-score(session, now), prospect_id) for prospect_id, session in sessions]
+    heapq.heapify(heap)
+    if not heap:
+        return [], []
+
+    ledger = get_quota_ledger()
+    cost = calls_per_prospect(batch_size)
+    used = ledger.used(campaign_id) if budget else 0.0
+    hold_from = budget * (1 - SCHEDULER_RESERVE_FRACTION)
+    # Only the more valuable half of the rows may dip into the reserve
+    median = sorted(-s for s, _ in heap)[len(heap) // 2]
+
+    selected, deferred = [], []
+    spent = 0.0
+    while heap:
+        negative, prospect_id = heapq.heappop(heap)
+        value = -negative
+        if budget and used + spent + cost > budget:
+            deferred.append(prospect_id)
+        elif budget and used + spent + cost > hold_from and value < median:
+            deferred.append(prospect_id)
+        else:
+            selected.append((prospect_id, value))
+            spent += cost
+
+    if budget and spent:
+        ledger.reserve(campaign_id, spent)
+    inc("scheduler_prospects_total", len(selected), decision="scheduled")
+    inc("scheduler_prospects_total", len(deferred), decision="deferred")
+    if deferred:
+        print(f"[SCHEDULER] {campaign_id}: {len(selected)} scheduled, {len(deferred)} deferred "
+              f"({used + spent:.0f}/{budget:.0f} calls of today's budget)")
+    return selected, deferred
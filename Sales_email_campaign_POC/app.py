@@ -2,92 +2,154 @@
 B2B Sales Email Campaign - Professional Dashboard
 """
 
+import math
 import streamlit as st
-import pandas as pd
-from agents.orchestrator import run_campaign
+from agents.orchestrator import run_campaign, save_session, enqueue_enrichment, enqueue_send
+from utils.config import PAGE_SIZE, METRICS_PORT, get_settings
+from utils.job_queue import get_job_queue
+from utils.metrics import start_metrics_server, summary as metrics_summary
+from utils.ingest import preview_csv, ingest_csv
+from utils.session_store import get_session_store
 
 st.set_page_config(page_title="Email Campaign", layout="wide")
 
+get_settings()
+store = get_session_store()
+start_metrics_server()
+
+# Make status user-friendly
+STATUS_DISPLAY = {
+    'pending': 'Not Enriched',
+    'queued': 'Queued',
+    'deferred': 'Deferred (quota)',
+    'approved': 'Approved',
+    'pending_approval': 'Ready to Review',
+    'sent': 'Sent',
+    'failed': 'Send Failed',
+    'skipped': 'Skipped',
+    'error': 'Error'
+}
+
 # Initialize session state
-if "prospects" not in st.session_state:
-    st.session_state.prospects = []
-if "enriched_data" not in st.session_state:
-    st.session_state.enriched_data = {}
 if "selected_rows" not in st.session_state:
     st.session_state.selected_rows = set()
+if "campaign_id" not in st.session_state:
+    st.session_state.campaign_id = None
+if "filter_options" not in st.session_state:
+    st.session_state.filter_options = None
+if "page" not in st.session_state:
+    st.session_state.page = 0
+
+
+def refresh_filter_options():
+    """Precompute filter choices with indexed DISTINCT queries, call after data changes"""
+    campaign_id = st.session_state.campaign_id
+    st.session_state.filter_options = {
+        "campaigns": store.distinct("campaign_id"),
+        "industries": store.distinct("industry", campaign_id) if campaign_id else [],
+        "statuses": store.distinct("status", campaign_id) if campaign_id else [],
+    }
+
+
+def reset_page():
+    st.session_state.page = 0
+
+
+if st.session_state.filter_options is None:
+    refresh_filter_options()
+options = st.session_state.filter_options
 
 # Header
 st.title("Sales Email Campaign")
 st.divider()
 
 # Filters Row
-col1, col2 = st.columns([1, 1])
+col0, col1, col2 = st.columns([1, 1, 1])
 
-with col1:
-    if st.session_state.prospects:
-        industries = ["All Industries"] + list(set([p.get('industry', 'Unknown') for p in st.session_state.prospects]))
+with col0:
+    campaigns = options["campaigns"]
+    if campaigns:
+        current = campaigns.index(st.session_state.campaign_id) if st.session_state.campaign_id in campaigns else 0
+        chosen_campaign = st.selectbox("Campaign", campaigns, index=current)
+        if chosen_campaign != st.session_state.campaign_id:
+            st.session_state.campaign_id = chosen_campaign
+            st.session_state.selected_rows = set()
+            reset_page()
+            refresh_filter_options()
+            st.rerun()
     else:
-        industries = ["All Industries"]
-    selected_industry = st.selectbox("Filter by Industry", industries)
+        st.selectbox("Campaign", ["No campaigns yet"], disabled=True)
+
+with col1:
+    industries = ["All Industries"] + options["industries"]
+    selected_industry = st.selectbox("Filter by Industry", industries, on_change=reset_page)
 
 with col2:
-    statuses = ["All Status", "Pending", "Enriched", "Generated", "Approved", "Sent"]
-    selected_status = st.selectbox("Filter by Status", statuses)
+    status_labels = {STATUS_DISPLAY.get(s, s): s for s in options["statuses"]}
+    statuses = ["All Status"] + list(status_labels)
+    selected_status = st.selectbox("Filter by Status", statuses, on_change=reset_page)
 
 # Action Buttons Row
 col3, col4 = st.columns([1, 1])
 
 with col3:
-    if st.button("Enrich All", type="primary", width="stretch"):
-        try:
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            total = len(st.session_state.prospects)
-            
-            for idx, prospect in enumerate(st.session_state.prospects):
-                if idx not in st.session_state.enriched_data:
-                    company = prospect.get('company_name', 'Unknown')
-                    
-                    # Update progress
-                    progress = (idx + 1) / total
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing {idx + 1}/{total}: {company}")
-                    
-                    # Log to console
-                    print(f"[ENRICHMENT] Starting enrichment for: {company}")
-                    
-                    result = run_campaign(
-                        prospect_id=f"prospect_{idx}",
-                        prospect=prospect,
-                        approved=False
-                    )
-                    
-                    st.session_state.enriched_data[idx] = result
-                    print(f"[ENRICHMENT] Completed: {company}")
-            
-            progress_bar.progress(1.0)
-            status_text.text("All prospects enriched!")
-            st.success("Enrichment complete!")
-            st.rerun()
-            
-        except Exception as e:
-            st.error(f"Error: {str(e)}")
-            print(f"[ERROR] Enrichment failed: {str(e)}")
-            import traceback
-            st.code(traceback.format_exc())
+    if st.button("Enrich All", type="primary", width="stretch", disabled=not st.session_state.campaign_id):
+        # Work runs in worker.py processes, so reruns or a refresh don't stop it
+        queued = enqueue_enrichment(st.session_state.campaign_id)
+        refresh_filter_options()
+        deferred = store.count(status="deferred", campaign_id=st.session_state.campaign_id)
+        if queued:
+            st.success(f"Queued {queued} prospects for enrichment, highest value first")
+        elif not deferred:
+            st.info("Nothing left to enrich")
+        if deferred:
+            st.warning(f"{deferred} lower-value prospects deferred until the campaign's daily quota resets")
 
 with col4:
     if st.button("Approve Selected", disabled=len(st.session_state.selected_rows)==0, width="stretch"):
-        for idx in st.session_state.selected_rows:
-            if idx in st.session_state.enriched_data:
-                prospect = st.session_state.prospects[idx]
-                result = run_campaign(prospect, approved=True)
-                st.session_state.enriched_data[idx]['status'] = 'sent'
-        st.success(f"Sent {len(st.session_state.selected_rows)} emails!")
+        queued = enqueue_send(list(st.session_state.selected_rows), st.session_state.campaign_id)
+        st.success(f"Queued {queued} emails for sending!")
         st.session_state.selected_rows = set()
+        refresh_filter_options()
         st.rerun()
 
+# Background job status for this campaign
+if st.session_state.campaign_id:
+    job_counts = get_job_queue().counts(group_id=st.session_state.campaign_id)
+    active = job_counts.get("queued", 0) + job_counts.get("running", 0)
+    if job_counts:
+        total_jobs = sum(job_counts.values())
+        finished = job_counts.get("done", 0) + job_counts.get("failed", 0)
+        job_cols = st.columns([4, 1])
+        job_cols[0].progress(
+            finished / total_jobs,
+            text=f"Jobs: {job_counts.get('running', 0)} running, {job_counts.get('queued', 0)} queued, "
+                 f"{job_counts.get('done', 0)} done, {job_counts.get('failed', 0)} failed"
+        )
+        if job_cols[1].button("Refresh", width="stretch"):
+            refresh_filter_options()
+            st.rerun()
+        if active:
+            st.caption("Jobs run in the background worker: `python worker.py`")
+
+# Per-stage latency, tokens and cost across the app and all workers. An expander's body runs
+# on every rerun even when collapsed, so the snapshots are only merged while the toggle is on
+if st.toggle("Performance", key="show_performance"):
+    perf = metrics_summary()
+    if not perf["stages"]:
+        st.caption("No measurements yet")
+    else:
+        st.dataframe(perf["stages"], hide_index=True, width="stretch")
+        perf_cols = st.columns(6)
+        perf_cols[0].metric("Prompt tokens", f"{perf['prompt_tokens']:,}")
+        perf_cols[1].metric("Output tokens", f"{perf['output_tokens']:,}")
+        perf_cols[2].metric("Cost / 1,000 prospects", f"${perf['cost_per_1k_prospects']:.2f}")
+        perf_cols[3].metric("Cache hit rate", f"{perf['cache_hit_rate']:.0%}")
+        perf_cols[4].metric("Gemini retries", perf['retries'])
+        perf_cols[5].metric("Company research reused", f"{perf['company_reuse_rate']:.0%}")
+        if METRICS_PORT:
+            st.caption(f"Prometheus: http://localhost:{METRICS_PORT}/metrics")
+
 st.divider()
 
 # Upload Section
@@ -100,103 +162,81 @@ with st.container():
     )
     
     if uploaded_file:
-        df = pd.read_csv(uploaded_file)
-        
-        # Flexible column mapping (case-insensitive, handles spaces)
-        def find_column(df, possible_names):
-            """Find column by matching possible names"""
-            df_cols_lower = {col.lower().strip(): col for col in df.columns}
-            for name in possible_names:
-                if name.lower().strip() in df_cols_lower:
-                    return df_cols_lower[name.lower().strip()]
-            return None
-        
-        # Map to standard names
-        mapping = {}
-        
-        company_col = find_column(df, ['company_name', 'company name', 'company', 'name'])
-        if company_col:
-            mapping[company_col] = 'company_name'
-        
-        location_col = find_column(df, ['location', 'region', 'region / location', 'city'])
-        if location_col:
-            mapping[location_col] = 'location'
-        
-        industry_col = find_column(df, ['industry', 'sector', 'vertical'])
-        if industry_col:
-            mapping[industry_col] = 'industry'
-        
-        budget_col = find_column(df, ['budget', 'deal size', 'value'])
-        if budget_col:
-            mapping[budget_col] = 'budget'
-        
-        # Rename columns
-        df = df.rename(columns=mapping)
-        
-        # Add defaults for missing columns
-        if 'location' not in df.columns:
-            df['location'] = 'Unknown'
-        if 'industry' not in df.columns:
-            df['industry'] = 'General'
+        # Only a sample is read for display, the full file is streamed on load.
+        # The preview is kept per file so reruns don't rescan it
+        preview_key = (uploaded_file.name, uploaded_file.size)
+        if st.session_state.get("preview_key") != preview_key:
+            st.session_state.preview = preview_csv(uploaded_file)
+            st.session_state.preview_key = preview_key
+        sample, mapping, total_rows = st.session_state.preview
         
         # Check if company_name exists
-        if 'company_name' not in df.columns:
+        if 'company_name' not in mapping.values():
             st.error("Could not find company name column. Please ensure your CSV has a column with company names.")
-            st.info(f"Your columns: {', '.join(df.columns.tolist())}")
+            st.info(f"Your columns: {', '.join(map(str, sample.columns))}")
         else:
-            # Show preview - display all columns from CSV
-            st.write(f"**Preview** ({len(df)} prospects found)")
-            st.dataframe(df, width="stretch", height=300)
+            # Show preview - sample of the mapped columns
+            st.write(f"**Preview** (first {len(sample)} of {total_rows} rows)")
+            st.dataframe(sample, width="stretch", height=300)
             
             col_load, col_cancel = st.columns([1, 3])
             
             with col_load:
                 if st.button("Load Prospects", type="primary"):
-                    st.session_state.prospects = df.to_dict('records')
-                    st.session_state.enriched_data = {}
+                    campaign_id = uploaded_file.name
+                    ingest_bar = st.progress(0)
+                    
+                    def on_ingest(rows_read, loaded):
+                        ingest_bar.progress(min(1.0, rows_read / max(total_rows, 1)))
+                    
+                    stats = ingest_csv(uploaded_file, campaign_id, on_progress=on_ingest)
+                    st.session_state.campaign_id = campaign_id
                     st.session_state.selected_rows = set()
-                    st.success(f"Loaded {len(df)} prospects")
+                    reset_page()
+                    refresh_filter_options()
+                    st.success(
+                        f"Loaded {stats['loaded']} prospects "
+                        f"({stats['existing']} already loaded, {stats['duplicates']} duplicate companies skipped)"
+                    )
                     st.rerun()
-            st.rerun()
 
 st.divider()
 
 # Prospect List
-if st.session_state.prospects:
+if st.session_state.campaign_id:
     st.subheader("Prospect List")
     
-    # Filter prospects
-    filtered_prospects = []
-    for idx, prospect in enumerate(st.session_state.prospects):
-        # Industry filter
-        if selected_industry != "All Industries" and prospect.get('industry') != selected_industry:
-            continue
-        
-        # Status filter
-        status = st.session_state.enriched_data.get(idx, {}).get('status', 'Pending')
-        if selected_status != "All Status" and status != selected_status:
-            continue
-        
-        filtered_prospects.append((idx, prospect))
+    # Filters become one indexed query; only the visible page is loaded
+    filters = {
+        "campaign_id": st.session_state.campaign_id,
+        "industry": None if selected_industry == "All Industries" else selected_industry,
+        "status": status_labels.get(selected_status)
+    }
+    total = store.count(**filters)
     
-    if not filtered_prospects:
+    if total == 0:
         st.info("No prospects match the selected filters")
     else:
-        # Display each prospect
-        for idx, prospect in filtered_prospects:
+        pages = math.ceil(total / PAGE_SIZE)
+        page = min(st.session_state.page, pages - 1)
+        page_rows = store.query(**filters, limit=PAGE_SIZE, offset=page * PAGE_SIZE)
+        
+        # Display each prospect on this page
+        for prospect_id, session in page_rows:
+            prospect = session.get('prospect') or session.get('enriched_data', {})
             with st.container():
                 # Main row - all at same level
                 cols = st.columns([0.3, 2, 1.5, 1, 1, 1, 0.5])
             
             # Checkbox
-            is_selected = cols[0].checkbox("", key=f"select_{idx}", value=idx in st.session_state.selected_rows)
+            is_selected = cols[0].checkbox("Select", key=f"select_{prospect_id}", value=prospect_id in st.session_state.selected_rows, label_visibility="collapsed")
             if is_selected:
-                st.session_state.selected_rows.add(idx)
+                st.session_state.selected_rows.add(prospect_id)
             else:
-                st.session_state.selected_rows.discard(idx)
+                st.session_state.selected_rows.discard(prospect_id)
             
             # Company name
-            cols[1].write(f"**{prospect['company_name']}**")
+            cols[1].write(f"**{prospect.get('company_name', 'N/A')}**")
             
             # Industry
             cols[2].write(prospect.get('industry', 'N/A'))
@@ -205,36 +245,26 @@ if st.session_state.prospects:
             cols[3].write(prospect.get('location', 'N/A'))
             
             # Status
-            if idx in st.session_state.enriched_data:
-                status = st.session_state.enriched_data[idx].get('status', 'pending_approval')
-                # Make status user-friendly
-                status_display = {
-                    'pending_approval': 'Ready to Review',
-                    'sent': 'Sent',
-                    'skipped': 'Skipped'
-                }.get(status, 'Enriched')
-            else:
-                status_display = 'Not Enriched'
-            
-            cols[5].write(status_display)
+            status = session.get('status', 'pending')
+            cols[5].write(STATUS_DISPLAY.get(status, 'Enriched'))
             
             # Expand button
-            expand = cols[6].button("Details", key=f"expand_{idx}")
+            expand = cols[6].button("Details", key=f"expand_{prospect_id}")
             
             # Expanded section
             if expand:
-                st.session_state[f"expanded_{idx}"] = not st.session_state.get(f"expanded_{idx}", False)
+                st.session_state[f"expanded_{prospect_id}"] = not st.session_state.get(f"expanded_{prospect_id}", False)
                 st.rerun()
             
-            if st.session_state.get(f"expanded_{idx}", False):
+            if st.session_state.get(f"expanded_{prospect_id}", False):
                 with st.container():
                     st.markdown("---")
                     
                     # Check if enriched
-                    if idx not in st.session_state.enriched_data:
+                    if not session.get('email'):
                         st.warning("Not enriched yet. Click 'Enrich All' first.")
                     else:
-                        data = st.session_state.enriched_data[idx]
+                        data = session
                         
                         # Debug: Show what we have
                         st.write(f"DEBUG: Keys in data: {list(data.keys())}")
@@ -290,9 +320,31 @@ if st.session_state.prospects:
                         with col_right:
                             st.write("**Generated Email**")
                             
-                            subject = st.text_input("Subject", email['subject'], key=f"subj_{idx}")
-                            body = st.text_area("Body", email['body'], height=250, key=f"body_{idx}")
-                            st.write(f"Word Count: {email['word_count']}")
+                            # Multi-contact drafts: pick the recipient and the subject line variant
+                            drafts = data.get('emails') or [email]
+                            draft_no = 0
+                            if len(drafts) > 1:
+                                draft_no = st.selectbox(
+                                    "Contact", range(len(drafts)), key=f"draft_{prospect_id}",
+                                    format_func=lambda n: f"{drafts[n]['contact']['name']} - {drafts[n]['contact']['title']}"
+                                )
+                            draft = drafts[draft_no]
+                            variants = draft.get('subject_variants') or [draft['subject']]
+                            variant_no = 0
+                            if len(variants) > 1:
+                                variant_no = st.radio(
+                                    "Subject variant", range(len(variants)), key=f"variant_{prospect_id}_{draft_no}",
+                                    format_func=lambda n: variants[n], horizontal=True
+                                )
+                            if draft.get('to'):
+                                st.write(f"To: {draft['to']}")
+                            for issue in draft.get('issues', []):
+                                st.warning(issue)
+                            
+                            subject = st.text_input("Subject", variants[variant_no],
+                                                    key=f"subj_{prospect_id}_{draft_no}_{variant_no}")
+                            body = st.text_area("Body", draft['body'], height=250, key=f"body_{prospect_id}_{draft_no}")
+                            st.write(f"Word Count: {len(body.split())}")
                             
                             st.write("**Attachments**")
                             st.write("None")
@@ -300,26 +352,52 @@ if st.session_state.prospects:
                         # Actions
                         action_cols = st.columns([1, 1, 1, 3])
                         
-                        if action_cols[0].button("Approve", key=f"approve_{idx}", type="primary"):
-                            # Resume Strands graph from approval node
-                            result = run_campaign(
-                                prospect_id=f"prospect_{idx}",
-                                prospect=prospect,
-                                approved=True
-                            )
-                            st.session_state.enriched_data[idx]['status'] = 'sent'
+                        if action_cols[0].button("Approve", key=f"approve_{prospect_id}", type="primary"):
+                            # Send what is on screen, edits included; the saved prospect is kept
+                            chosen = {"subject": subject, "body": body, "word_count": len(body.split())}
+                            if draft.get('to'):
+                                chosen.update(to=draft['to'], contact=draft['contact'])
+                            result = run_campaign(prospect_id=prospect_id, approved=True, email=chosen)
+                            refresh_filter_options()
                             st.success("Email sent!")
                             st.rerun()
                         
-                        if action_cols[1].button("Regenerate", key=f"regen_{idx}"):
-                            result = run_campaign(prospect)
-                            st.session_state.enriched_data[idx] = result
+                        if action_cols[1].button("Regenerate", key=f"regen_{prospect_id}"):
+                            # Stream the new email into the page as it is written
+                            live_email = st.empty()
+                            
+                            def on_partial(subject, body):
+                                live_email.markdown(f"**Subject:** {subject}\n\n{body}")
+                            
+                            # Only the email is rewritten (uncached); saved research is reused
+                            result = run_campaign(
+                                prospect_id=prospect_id,
+                                regenerate=True,
+                                on_partial=on_partial
+                            )
+                            # Show the new draft, not the edit boxes' old contents
+                            for widget in [k for k in st.session_state if str(k).startswith((
+                                f"subj_{prospect_id}", f"body_{prospect_id}", f"draft_{prospect_id}", f"variant_{prospect_id}"
+                            ))]:
+                                del st.session_state[widget]
                             st.rerun()
                         
-                        if action_cols[2].button("Skip", key=f"skip_{idx}"):
-                            st.session_state.enriched_data[idx]['status'] = 'skipped'
+                        if action_cols[2].button("Skip", key=f"skip_{prospect_id}"):
+                            session['status'] = 'skipped'
+                            save_session(prospect_id, session)
+                            refresh_filter_options()
                             st.rerun()
             
             st.divider()
+        
+        # Pager
+        nav = st.columns([1, 3, 1])
+        if nav[0].button("Previous", disabled=page == 0, width="stretch"):
+            st.session_state.page = page - 1
+            st.rerun()
+        nav[1].write(f"Page {page + 1} of {pages} ({total} prospects)")
+        if nav[2].button("Next", disabled=page >= pages - 1, width="stretch"):
+            st.session_state.page = page + 1
+            st.rerun()
 else:
     st.info("Upload a CSV file to get started")
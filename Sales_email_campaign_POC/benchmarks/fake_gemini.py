@@ -0,0 +1,234 @@
+"""
+Fake Gemini - Deterministic local stand-in for client.models, no network or quota
+
+Install on the shared client:
+
+    from benchmarks.fake_gemini import FakeGemini, install
+    install(get_client(), FakeGemini(latency=0.02, error_rate=0.01))
+
+Responses, latencies and injected 5xx errors are derived from a hash of the
+prompt and its attempt number, so they don't depend on thread timing. 429
+bursts are time windows (every burst_every seconds, for burst_length seconds),
+which is how real quota exhaustion behaves.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+from google.genai import errors
+
+FIRST_NAMES = ["Alex", "Sam", "Jordan", "Taylor", "Morgan", "Casey", "Riley", "Jamie"]
+LAST_NAMES = ["Smith", "Patel", "Garcia", "Chen", "Müller", "Okafor", "Rossi", "Kim"]
+TITLES = ["CEO", "CTO", "VP Sales", "Head of Operations", "CFO", "VP Engineering"]
+FILLER = ("We help teams in your space cut manual work, shorten sales cycles and "
+          "get clearer reporting without adding headcount or new tools to learn").split()
+
+
+def _digest(*parts) -> int:
+    return int.from_bytes(hashlib.sha256("\x1f".join(map(str, parts)).encode("utf-8")).digest()[:8], "big")
+
+
+def _unit(*parts) -> float:
+    """Deterministic float in [0, 1)"""
+    return _digest(*parts) / 2 ** 64
+
+
+class FakeGemini:
+    """Implements the generate_content / generate_content_stream calls GeminiClient makes"""
+
+    def __init__(self, latency: float = 0.02, jitter: float = 0.5, error_rate: float = 0.0,
+                 burst_every: float = 0.0, burst_length: float = 0.0, malformed_rate: float = 0.0,
+                 chunks: int = 8, seed: int = 0, model_latency: dict = None):
+        self.latency = latency
+        self.model_latency = model_latency or {}  # {model: latency}, e.g. to make one tier slow
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.malformed_rate = malformed_rate
+        self.chunks = chunks
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._attempts = {}
+        self._started = time.monotonic()
+        self.calls = 0
+        self.injected_errors = 0
+        self.injected_throttles = 0
+
+    # Fault injection
+
+    def _attempt(self, prompt: str) -> int:
+        key = _digest(prompt)
+        with self._lock:
+            self.calls += 1
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+            return attempt
+
+    def _in_burst(self) -> bool:
+        if not self.burst_every or not self.burst_length:
+            return False
+        # Each window ends with the burst, so a run starts with quota available
+        return (time.monotonic() - self._started) % self.burst_every >= self.burst_every - self.burst_length
+
+    def _admit(self, prompt: str) -> int:
+        """Raise the error this call is scheduled to get, otherwise return the attempt number"""
+        attempt = self._attempt(prompt)
+        if self._in_burst():
+            with self._lock:
+                self.injected_throttles += 1
+            raise errors.ClientError(429, {"error": {
+                "code": 429, "status": "RESOURCE_EXHAUSTED",
+                "message": f"Resource has been exhausted. Please retry in {self.burst_length:.1f}s."
+            }})
+        if _unit(self.seed, "error", prompt, attempt) < self.error_rate:
+            with self._lock:
+                self.injected_errors += 1
+            raise errors.ServerError(503, {"error": {
+                "code": 503, "status": "UNAVAILABLE", "message": "The model is overloaded."
+            }})
+        return attempt
+
+    def _latency(self, prompt: str, attempt: int, model: str = None) -> float:
+        spread = 1 + self.jitter * (2 * _unit(self.seed, "latency", prompt, attempt) - 1)
+        return max(0.0, self.model_latency.get(model, self.latency) * spread)
+
+    # Responses
+
+    def _contacts(self, company: str) -> list:
+        domain = re.sub(r"[^a-z0-9]", "", company.lower()) or "example"
+        contacts = []
+        for n in range(1 + _digest(self.seed, company) % 4):
+            first = FIRST_NAMES[_digest(company, n, "first") % len(FIRST_NAMES)]
+            last = LAST_NAMES[_digest(company, n, "last") % len(LAST_NAMES)]
+            contacts.append({
+                "name": f"{first} {last}",
+                "title": TITLES[_digest(company, n, "title") % len(TITLES)],
+                "email": f"{first.lower()}.{last.lower()}@{domain}.com",
+                "linkedin": "Not Available",
+                "phone": "Not Available"
+            })
+        return contacts
+
+    def _research(self, company: str) -> dict:
+        return {
+            "company_name": company,
+            "contacts": self._contacts(company),
+            "company_info": {
+                "description": f"{company} builds software for its customers",
+                "website": f"https://{re.sub(r'[^a-z0-9]', '', company.lower())}.com",
+                "linkedin": "Not Available"
+            },
+            "recent_news": [{"headline": f"{company} announced a new product line", "date": "2026-09"}]
+        }
+
+    def _email(self, prompt: str) -> str:
+        company = (re.search(r"Company: (.+)", prompt) or [None, "your company"])[1].strip()
+        contact = (re.search(r"Contact: ([^,\n]+)", prompt) or [None, "there"])[1].strip()
+        words = 110 + _digest(self.seed, prompt) % 40
+        body = " ".join(FILLER[i % len(FILLER)] for i in range(words))
+        return (f"Subject: idea for {company.lower()}\nBody: Hi {contact},\n\n"
+                f"Congrats on the news at {company}. {body}.\n\nBest regards")
+
+    def _fixes(self, prompt: str) -> list:
+        fixes = []
+        for block in re.split(r"^### ", prompt, flags=re.MULTILINE)[1:]:
+            draft_id = block.split("\n", 1)[0].strip()
+            text = self._email(block)
+            subject, body = text.split("\n", 1)
+            fixes.append({"id": draft_id, "subject": subject.replace("Subject: ", ""),
+                          "body": body.replace("Body: ", "", 1)})
+        return fixes
+
+    def _emails(self, prompt: str) -> list:
+        company = (re.search(r"Company: (.+)", prompt) or [None, "your company"])[1].strip()
+        variants = int((re.search(r"Subject lines per email: (\d+)", prompt) or [None, "1"])[1])
+        drafts = []
+        for name in re.findall(r"^\d+\. ([^,\n]+),", prompt, re.MULTILINE):
+            text = self._email(f"Company: {company}\nContact: {name}")
+            subject, body = text.split("\n", 1)
+            drafts.append({
+                "contact_name": name,
+                "subjects": [subject.replace("Subject: ", "")] + [f"{name.split()[0].lower()}, quick question {n}"
+                                                                  for n in range(1, variants)],
+                "body": body.replace("Body: ", "", 1)
+            })
+        return drafts
+
+    def _malform(self, text: str, prompt: str) -> str:
+        """Wrap JSON in prose or cut it off, like an unconstrained or truncated answer"""
+        roll = _unit(self.seed, "malformed", prompt)
+        if roll >= self.malformed_rate:
+            return text
+        if roll < self.malformed_rate / 2:
+            return f"Here is the research you asked for:\n```json\n{text}\n```\nLet me know if you need more."
+        return text[:int(len(text) * 0.8)]
+
+    def respond(self, prompt: str, system: str = "") -> str:
+        if "Emails to fix:" in prompt:
+            return self._malform(json.dumps(self._fixes(prompt)), prompt)
+        if "Companies:" in prompt:
+            companies = re.findall(r"^\d+\. Company: (.*?) \|", prompt, re.MULTILINE)
+            return self._malform(json.dumps([self._research(c) for c in companies]), prompt)
+        if "Contacts:" in prompt:
+            return self._malform(json.dumps(self._emails(prompt)), prompt)
+        if "research assistant" in system or "research assistant" in prompt:
+            company = re.search(r"Company: (.+)", prompt)[1].strip()
+            record = self._research(company)
+            record.pop("company_name")
+            return self._malform(json.dumps(record), prompt)
+        return self._email(prompt)
+
+    @staticmethod
+    def _usage(prompt: str, text: str):
+        prompt_tokens, output_tokens = len(prompt) // 4, len(text) // 4
+        return SimpleNamespace(
+            prompt_token_count=prompt_tokens, candidates_token_count=output_tokens,
+            thoughts_token_count=0, total_token_count=prompt_tokens + output_tokens
+        )
+
+    # client.models API
+
+    @staticmethod
+    def _system(config) -> str:
+        return getattr(config, "system_instruction", None) or ""
+
+    def generate_content(self, model: str, contents: str, config=None):
+        system = self._system(config)
+        attempt = self._admit(system + contents)
+        time.sleep(self._latency(contents, attempt, model))
+        text = self.respond(contents, system)
+        return SimpleNamespace(text=text, usage_metadata=self._usage(system + contents, text))
+
+    def generate_content_stream(self, model: str, contents: str, config=None):
+        system = self._system(config)
+        attempt = self._admit(system + contents)
+        text = self.respond(contents, system)
+        delay = self._latency(contents, attempt, model)
+        step = max(1, len(text) // self.chunks)
+        pieces = [text[i:i + step] for i in range(0, len(text), step)]
+        # Time to first token is ~20% of the total, like a real streamed response
+        time.sleep(delay * 0.2)
+        for n, piece in enumerate(pieces):
+            if n:
+                time.sleep(delay * 0.8 / max(1, len(pieces) - 1))
+            last = n == len(pieces) - 1
+            yield SimpleNamespace(text=piece, usage_metadata=self._usage(system + contents, text) if last else None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "injected_errors": self.injected_errors,
+                "injected_throttles": self.injected_throttles
+            }
+
+
+def install(client, backend: FakeGemini):
+    """Route a GeminiClient's calls to the fake backend"""
+    client.client = SimpleNamespace(models=backend)
+    return client
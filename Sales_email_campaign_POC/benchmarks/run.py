@@ -0,0 +1,283 @@
+"""
+Benchmark Runner - Full pipeline (ingest -> research -> content -> send) against the fake Gemini backend
+
+Usage:
+    python -m benchmarks.run                                  # 100, 10k and 100k rows
+    python -m benchmarks.run --rows 100 10000 --latency 0.05 --error-rate 0.02
+    python -m benchmarks.run --burst-every 30 --burst-length 2  # 429 storms
+    python -m benchmarks.run --baseline benchmarks/results/pipeline-20260101-120000.json
+
+Each size runs in its own subprocess with a scratch directory for every
+store (sessions, cache, company research, quota ledger, duplicate index,
+jobs, delivery log, metrics), so peak memory is per run, runs don't reuse
+each other's research and the real data is never touched. No request leaves the machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(PROJECT_DIR, "benchmarks", "results")
+DEFAULT_ROWS = [100, 10_000, 100_000]
+
+
+def scratch_environment(workdir: str) -> dict:
+    """Every stateful store on a local backend inside workdir, so runs start empty and don't share data"""
+    return {
+        "SESSION_BACKEND": "sqlite",
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.db"),
+        "CACHE_DB_PATH": os.path.join(workdir, "response_cache.db"),
+        "GEMINI_RATE_DB_PATH": os.path.join(workdir, "rate_limits.db"),
+        "COMPANY_INDEX_BACKEND": "sqlite",
+        "COMPANY_DB_PATH": os.path.join(workdir, "companies.db"),
+        "DELIVERY_LOG_BACKEND": "file",
+        "DELIVERY_LOG_PATH": os.path.join(workdir, "sent_emails.jsonl"),
+        "QUOTA_DB_PATH": os.path.join(workdir, "quota.db"),
+        "VALIDATION_DB_PATH": os.path.join(workdir, "validation.db"),
+        "JOB_DB_PATH": os.path.join(workdir, "jobs.db"),
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+    }
+
+
+def _environment(args, workdir: str) -> dict:
+    """Config overrides for a child run; utils.config reads these at import"""
+    env = dict(os.environ)
+    env.update(scratch_environment(workdir))
+    env.update({
+        "GOOGLE_API_KEY": "benchmark-offline",
+        "CACHE_ENABLED": "true" if args.cache else "false",
+        "METRICS_PORT": "0",
+        "EMAIL_TRANSPORT": "mock",
+        "GEMINI_RPM": str(args.rpm),
+        "GEMINI_TPM": str(args.tpm),
+        "GEMINI_BACKOFF_BASE": str(args.backoff_base),
+        "GEMINI_BACKOFF_MAX": str(args.backoff_max),
+    })
+    return env
+
+
+def _percentiles(hists: list, buckets: list) -> dict:
+    """p50/p95/p99 in ms over several histogram series added together"""
+    from utils.metrics import quantile
+
+    merged = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+    for hist in hists:
+        merged["buckets"] = [a + b for a, b in zip(merged["buckets"], hist["buckets"])]
+        merged["sum"] += hist["sum"]
+        merged["count"] += hist["count"]
+    return {
+        "count": merged["count"],
+        **{f"p{int(q * 100)}_ms": round(quantile(merged, q, buckets) * 1000, 2) for q in (0.5, 0.95, 0.99)}
+    }
+
+
+def run_once(args, workdir: str) -> dict:
+    """One pipeline run in this process (the child side)"""
+    from benchmarks.fake_gemini import FakeGemini, install
+    from benchmarks.synthetic import write_csv
+    from utils.gemini_client import get_client
+    from utils.ingest import ingest_csv
+    from utils.metrics import collect
+    from agents.orchestrator import run_pending, approve, send_approved
+
+    backend = FakeGemini(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        burst_every=args.burst_every, burst_length=args.burst_length,
+        malformed_rate=args.malformed_rate, seed=args.seed
+    )
+    client = install(get_client(), backend)
+    csv_path = write_csv(os.path.join(workdir, "prospects.csv"), args.child_rows, seed=args.seed)
+    campaign_id = f"benchmark-{args.child_rows}"
+
+    started = time.perf_counter()
+    ingest = ingest_csv(csv_path, campaign_id)
+    ingest_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    results = run_pending(campaign_id, concurrency=args.concurrency, research_batch_size=args.batch_size)
+    enrich_seconds = time.perf_counter() - started
+    drafted = [pid for pid, session in results.items() if session.get("status") == "pending_approval"]
+
+    started = time.perf_counter()
+    sent = send_approved(approve(drafted)) if args.send else {}
+    send_seconds = time.perf_counter() - started
+
+    snapshot = collect()
+    stages = {}
+    for key, hist in snapshot["histograms"].get("stage_latency_seconds", {}).items():
+        stage = dict(json.loads(key))["stage"]
+        stages.setdefault(stage, []).append(hist)
+    stage_latency = {stage: _percentiles(hists, snapshot["buckets"]) for stage, hists in sorted(stages.items())}
+    total_seconds = ingest_seconds + enrich_seconds + send_seconds
+
+    return {
+        "rows": args.child_rows,
+        "loaded": ingest["loaded"],
+        "drafted": len(drafted),
+        "sent": sum(1 for s in sent.values() if s.get("status") == "sent"),
+        "errors": len(results) - len(drafted),
+        "seconds": {
+            "ingest": round(ingest_seconds, 3),
+            "enrich": round(enrich_seconds, 3),
+            "send": round(send_seconds, 3),
+            "total": round(total_seconds, 3)
+        },
+        "prospects_per_sec": round(len(drafted) / enrich_seconds, 2) if enrich_seconds else 0.0,
+        "end_to_end_per_sec": round(len(drafted) / total_seconds, 2) if total_seconds else 0.0,
+        "ingest_rows_per_sec": round(ingest["rows"] / ingest_seconds, 1) if ingest_seconds else 0.0,
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_mb": round(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1
+        ),
+        "gemini_request_latency": _percentiles(
+            list(snapshot["histograms"].get("gemini_request_seconds", {}).values()), snapshot["buckets"]
+        ),
+        "stage_latency": stage_latency,
+        "gemini": {**backend.stats(), "client_retries": client.retries},
+        "research_parse": {
+            dict(json.loads(key))["result"]: int(value)
+            for key, value in snapshot["counters"].get("research_parse_total", {}).items()
+        }
+    }
+
+
+def _run_child(args, rows: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench-{rows}-")
+    out_path = os.path.join(workdir, "result.json")
+    log_path = os.path.join(workdir, "run.log")
+    command = [
+        sys.executable, "-m", "benchmarks.run", "--child-rows", str(rows), "--child-out", out_path,
+        "--workdir", workdir, *args.passthrough
+    ]
+    print(f"[BENCHMARK] {rows:,} rows ... ", end="", flush=True)
+    with open(log_path, "w", encoding="utf-8") as log:
+        code = subprocess.run(command, cwd=PROJECT_DIR, env=_environment(args, workdir),
+                              stdout=log, stderr=subprocess.STDOUT).returncode
+    if code != 0:
+        print(f"failed (exit {code}), log kept at {log_path}")
+        return {"rows": rows, "error": f"exit {code}", "log": log_path}
+
+    with open(out_path, encoding="utf-8") as f:
+        result = json.load(f)
+    print(f"{result['prospects_per_sec']} prospects/s, peak {result['peak_rss_mb']} MB, "
+          f"Gemini p99 {result['gemini_request_latency']['p99_ms']} ms")
+    if not args.keep:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions vs. a previous report: throughput down or peak memory up by more than tolerance"""
+    previous = {run["rows"]: run for run in baseline.get("runs", []) if "error" not in run}
+    regressions = []
+    for run in report["runs"]:
+        before = previous.get(run["rows"])
+        if before is None or "error" in run:
+            continue
+        if run["prospects_per_sec"] < before["prospects_per_sec"] * (1 - tolerance):
+            regressions.append(f"{run['rows']} rows: {run['prospects_per_sec']} prospects/s "
+                               f"(was {before['prospects_per_sec']})")
+        if run["peak_rss_mb"] > before["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{run['rows']} rows: peak {run['peak_rss_mb']} MB (was {before['peak_rss_mb']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with a fake Gemini backend")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--latency", type=float, default=0.02, help="Mean fake Gemini latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.5, help="Latency spread as a fraction of the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of calls failing with 503")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Seconds between 429 bursts (0 = none)")
+    parser.add_argument("--burst-length", type=float, default=0.0, help="Seconds each 429 burst lasts")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Share of research answers wrapped in prose or truncated")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=None, help="Defaults to ENRICH_CONCURRENCY")
+    parser.add_argument("--batch-size", type=int, default=None, help="Defaults to RESEARCH_BATCH_SIZE")
+    parser.add_argument("--rpm", type=float, default=1e9, help="Limiter requests/min (default: unthrottled)")
+    parser.add_argument("--tpm", type=float, default=1e12, help="Limiter tokens/min (default: unthrottled)")
+    parser.add_argument("--backoff-base", type=float, default=0.05)
+    parser.add_argument("--backoff-max", type=float, default=5.0)
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on")
+    parser.add_argument("--no-send", dest="send", action="store_false", help="Skip the send stage")
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/pipeline-<time>.json)")
+    parser.add_argument("--baseline", help="Previous result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression vs. baseline")
+    parser.add_argument("--keep", action="store_true", help="Keep scratch directories and logs")
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--child-rows", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_rows is not None:
+        from utils.config import ENRICH_CONCURRENCY, RESEARCH_BATCH_SIZE
+        args.concurrency = args.concurrency or ENRICH_CONCURRENCY
+        args.batch_size = args.batch_size or RESEARCH_BATCH_SIZE
+        with open(args.child_out, "w", encoding="utf-8") as f:
+            json.dump(run_once(args, args.workdir), f)
+        return
+
+    # Forward the backend/pipeline options to each child
+    args.passthrough = [
+        "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate),
+        "--burst-every", str(args.burst_every), "--burst-length", str(args.burst_length),
+        "--malformed-rate", str(args.malformed_rate), "--seed", str(args.seed)
+    ]
+    if args.concurrency:
+        args.passthrough += ["--concurrency", str(args.concurrency)]
+    if args.batch_size:
+        args.passthrough += ["--batch-size", str(args.batch_size)]
+    if not args.send:
+        args.passthrough.append("--no-send")
+
+    report = {
+        "benchmark": "pipeline",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {
+            key: getattr(args, key) for key in (
+                "latency", "jitter", "error_rate", "burst_every", "burst_length", "malformed_rate", "seed",
+                "concurrency", "batch_size", "rpm", "tpm", "backoff_base", "backoff_max", "cache", "send"
+            )
+        },
+        "runs": [_run_child(args, rows) for rows in args.rows]
+    }
+
+    out = args.out or os.path.join(RESULTS_DIR, f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCHMARK] Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[BENCHMARK] REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("[BENCHMARK] No regressions vs. baseline")
+
+
+if __name__ == "__main__":
+    main()
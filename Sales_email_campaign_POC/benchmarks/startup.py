@@ -0,0 +1,148 @@
+"""
+Startup Benchmark - Cold import cost of the entry points, measured with python -X importtime
+
+Usage:
+    python -m benchmarks.startup                                  # config, orchestrator, worker, ingest
+    python -m benchmarks.startup --modules worker agents.orchestrator --repeat 20
+    python -m benchmarks.startup --baseline benchmarks/results/startup-20260101-120000.json
+
+Every sample is a fresh interpreter importing one module, which is what a
+worker process or CLI pays before doing any work. Each module is imported
+once first so bytecode compilation isn't counted. Results (median import
+and wall time, slowest imports, which SDKs got loaded) are written as JSON
+to benchmarks/results/.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from benchmarks.run import PROJECT_DIR, RESULTS_DIR, _git_commit, scratch_environment
+
+DEFAULT_MODULES = ["utils.config", "agents.orchestrator", "worker", "utils.ingest"]
+# Imports that should only happen once a Gemini call, DynamoDB backend or send needs them
+HEAVY_MODULES = ["google.genai", "httpx", "boto3", "pandas", "asyncio", "smtplib"]
+
+
+def _environment(workdir: str) -> dict:
+    """Offline settings with every data path in a scratch directory"""
+    env = dict(os.environ)
+    env.update(scratch_environment(workdir))
+    env.update({"GOOGLE_API_KEY": "benchmark-offline", "METRICS_PORT": "0"})
+    return env
+
+
+def parse_importtime(stderr: str) -> dict:
+    """{module: (self_us, cumulative_us)} from -X importtime output"""
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if self_us.strip().isdigit():
+            imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports
+
+
+def _sample(module: str, env: dict) -> tuple:
+    """(wall ms, import ms, {module: (self_us, cumulative_us)}) for one cold interpreter"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_DIR, env=env, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    imports = parse_importtime(result.stderr)
+    return wall_ms, imports.get(module, (0, 0))[1] / 1000, imports
+
+
+def measure(module: str, repeat: int, env: dict, top: int = 10) -> dict:
+    _sample(module, env)  # compile bytecode
+    samples = [_sample(module, env) for _ in range(repeat)]
+    imports = samples[-1][2]
+    slowest = sorted(
+        ((name, cumulative) for name, (_, cumulative) in imports.items() if name != module),
+        key=lambda item: -item[1]
+    )[:top]
+
+    result = {
+        "module": module,
+        "import_ms": round(statistics.median(s[1] for s in samples), 1),
+        "wall_ms": round(statistics.median(s[0] for s in samples), 1),
+        "modules_loaded": len(imports),
+        "heavy_loaded": [name for name in HEAVY_MODULES if name in imports],
+        "slowest": [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in slowest],
+    }
+    print(f"[BENCHMARK] {module}: import {result['import_ms']} ms, process {result['wall_ms']} ms, "
+          f"{result['modules_loaded']} modules, heavy: {', '.join(result['heavy_loaded']) or 'none'}")
+    return result
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions vs. a previous report: import time up by more than tolerance, or a new heavy import"""
+    previous = {run["module"]: run for run in baseline.get("runs", [])}
+    regressions = []
+    for run in report["runs"]:
+        before = previous.get(run["module"])
+        if before is None:
+            continue
+        if run["import_ms"] > before["import_ms"] * (1 + tolerance):
+            regressions.append(f"{run['module']}: import {run['import_ms']} ms (was {before['import_ms']})")
+        added = sorted(set(run["heavy_loaded"]) - set(before["heavy_loaded"]))
+        if added:
+            regressions.append(f"{run['module']}: now imports {', '.join(added)} at startup")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold-start import benchmark (python -X importtime)")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=10, help="Cold interpreters per module")
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to record per module")
+    parser.add_argument("--out", help="Result file (default: benchmarks/results/startup-<time>.json)")
+    parser.add_argument("--baseline", help="Previous result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression vs. baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="startup-bench-") as workdir:
+        env = _environment(workdir)
+        report = {
+            "benchmark": "startup",
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {"repeat": args.repeat},
+            "runs": [measure(module, args.repeat, env, args.top) for module in args.modules]
+        }
+        # Importing must not leave files behind
+        created = sorted(os.listdir(workdir))
+        if created:
+            print(f"[BENCHMARK] Warning: importing created {', '.join(created)}")
+
+    out = args.out or os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"[BENCHMARK] Results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"[BENCHMARK] REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("[BENCHMARK] No regressions vs. baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+"""
+Synthetic prospect CSVs for benchmarking, reproducible from a seed
+"""
+
+import csv
+import random
+
+INDUSTRIES = ["SaaS", "FinTech", "Healthcare", "Retail", "Logistics", "Manufacturing", "EdTech", "Energy"]
+LOCATIONS = ["New York", "London", "Berlin", "Bangalore", "Singapore", "Toronto", "Austin", "Sydney"]
+PREFIXES = ["Blue", "North", "Bright", "Quantum", "Silver", "Apex", "Nimbus", "Vertex", "Cedar", "Iron"]
+SUFFIXES = ["Labs", "Systems", "Analytics", "Works", "Dynamics", "Networks", "Health", "Logistics"]
+
+
+def write_csv(path: str, rows: int, seed: int = 0, duplicate_rate: float = 0.02) -> str:
+    """
+    Write `rows` prospects with the real upload's headers
+
+    About duplicate_rate of the rows repeat an earlier company (with
+    different casing) so ingest dedupe is exercised too.
+    """
+    rng = random.Random(seed)
+    seen = []
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Company Name", "Industry", "Region / Location", "Budget"])
+        for n in range(rows):
+            if seen and rng.random() < duplicate_rate:
+                company = rng.choice(seen).upper()
+            else:
+                company = f"{rng.choice(PREFIXES)} {rng.choice(SUFFIXES)} {n}"
+                seen.append(company)
+            writer.writerow([
+                company, rng.choice(INDUSTRIES), rng.choice(LOCATIONS), rng.randrange(5, 500) * 1000
+            ])
+    return path
@@ -0,0 +1,422 @@
+"""
+Company Index - One research record per company, shared across prospects and campaigns
+
+Prospects resolve to a company by website domain, then canonical name
+("Tesla, Inc." and "tesla" are the same company), then a fuzzy match
+against similar names. Research is stored once per company with the time
+and prompt fingerprint it was made with, so a new list only spends API
+calls on companies not seen before (or whose research went stale).
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from difflib import SequenceMatcher
+from urllib.parse import urlparse
+from utils import dynamodb
+from utils.config import COMPANY_INDEX_BACKEND, COMPANY_DB_PATH, COMPANY_FUZZY_THRESHOLD, COMPANY_RESEARCH_TTL_DAYS
+
+# Trailing words that don't tell companies apart
+LEGAL_SUFFIXES = {
+    "inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation", "co", "company",
+    "plc", "gmbh", "ag", "sa", "bv", "pvt", "pte", "pty", "lp", "llp", "group", "holdings"
+}
+
+# Domains that identify a mail/hosting provider rather than a company
+_SHARED_DOMAINS = {"gmail.com", "outlook.com", "hotmail.com", "yahoo.com", "linkedin.com"}
+
+
+def canonical_name(name) -> str:
+    """Lowercase, punctuation and legal suffixes stripped, whitespace collapsed"""
+    tokens = re.sub(r"[^\w\s]", " ", str(name or "").lower().replace("&", " and ")).split()
+    if tokens and tokens[0] == "the":
+        tokens = tokens[1:]
+    while len(tokens) > 1 and tokens[-1] in LEGAL_SUFFIXES:
+        tokens.pop()
+    return " ".join(tokens)
+
+
+def normalize_domain(value) -> str:
+    """Bare host of a URL or email address ("" if there isn't a usable one)"""
+    value = str(value or "").strip().lower()
+    if not value or value == "not available":
+        return ""
+    if "@" in value and "/" not in value:
+        value = value.rsplit("@", 1)[1]
+    host = urlparse(value if "//" in value else f"//{value}").hostname or ""
+    if host.startswith("www."):
+        host = host[4:]
+    if "." not in host or host in _SHARED_DOMAINS:
+        return ""
+    return host
+
+
+def _block(canonical: str) -> str:
+    # Fuzzy candidates share a prefix and the same digits, so "Blue Labs 1"
+    # never matches "Blue Labs 2" and a lookup never scans the whole table
+    return canonical[:2] + "|" + "".join(re.findall(r"\d", canonical))
+
+
+def same_words(canonical: str, other: str) -> bool:
+    """
+    Whether two names differ only by typos or spacing, word for word
+
+    A close overall spelling isn't enough: "acme corp east" and "acme corp
+    west" score above the fuzzy threshold but are different companies. Each
+    word that differs must start with the same letter and be a near
+    spelling of its counterpart ("microsfot", "technologies"/"technology").
+    """
+    if canonical.replace(" ", "") == other.replace(" ", ""):
+        return True
+    words, other_words = canonical.split(), other.split()
+    if len(words) != len(other_words):
+        return False
+    return all(
+        a == b or (a[0] == b[0] and SequenceMatcher(None, a, b).ratio() >= 0.8)
+        for a, b in zip(words, other_words)
+    )
+
+
+def best_match(canonical: str, candidates, threshold: float):
+    """Company ID of the closest (company_id, canonical_name) candidate at or above threshold"""
+    best, best_ratio = None, threshold
+    for company_id, other in candidates:
+        matcher = SequenceMatcher(None, canonical, other)
+        if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+            continue
+        ratio = matcher.ratio()
+        if ratio >= best_ratio and same_words(canonical, other):
+            best, best_ratio = company_id, ratio
+    return best
+
+
+def _company_id(canonical: str) -> str:
+    # Derived from the name so concurrent workers creating the same company agree
+    return "co_" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+class CompanyIndex:
+    """WAL-mode SQLite: companies, the names/domains that resolve to them and the prospects linked to them"""
+
+    def __init__(self, path: str, fuzzy_threshold: float = COMPANY_FUZZY_THRESHOLD):
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS companies (
+                company_id TEXT PRIMARY KEY,
+                canonical_name TEXT NOT NULL,
+                display_name TEXT,
+                block TEXT NOT NULL,
+                domain TEXT,
+                research TEXT,
+                research_fingerprint TEXT,
+                researched_at REAL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_companies_block ON companies(block);
+            CREATE INDEX IF NOT EXISTS idx_companies_domain ON companies(domain);
+            CREATE INDEX IF NOT EXISTS idx_companies_researched ON companies(researched_at);
+            CREATE TABLE IF NOT EXISTS company_aliases (
+                alias TEXT PRIMARY KEY,
+                company_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS company_links (
+                prospect_id TEXT PRIMARY KEY,
+                company_id TEXT NOT NULL,
+                campaign_id TEXT,
+                linked_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_links_company ON company_links(company_id, campaign_id);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Resolution
+
+    def _fuzzy_match(self, conn, canonical: str):
+        if len(canonical) < 5:
+            return None
+        return best_match(canonical, conn.execute(
+            "SELECT company_id, canonical_name FROM companies "
+            "WHERE block = ? AND abs(length(canonical_name) - ?) <= 3 LIMIT 500",
+            (_block(canonical), len(canonical))
+        ), self.fuzzy_threshold)
+
+    def _resolve(self, conn, prospect: dict, now: float) -> str:
+        canonical = canonical_name(prospect.get("company_name"))
+        if not canonical:
+            raise ValueError("Prospect has no company name")
+
+        domain = normalize_domain(prospect.get("website") or prospect.get("domain"))
+        if domain:
+            row = conn.execute("SELECT company_id FROM companies WHERE domain = ? LIMIT 1", (domain,)).fetchone()
+            if row:
+                conn.execute("INSERT OR IGNORE INTO company_aliases VALUES (?, ?)", (canonical, row[0]))
+                return row[0]
+
+        row = conn.execute("SELECT company_id FROM company_aliases WHERE alias = ?", (canonical,)).fetchone()
+        if row:
+            return row[0]
+
+        company_id = self._fuzzy_match(conn, canonical)
+        if company_id is None:
+            company_id = _company_id(canonical)
+            conn.execute(
+                "INSERT OR IGNORE INTO companies (company_id, canonical_name, display_name, block, domain, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (company_id, canonical, str(prospect.get("company_name")).strip(), _block(canonical), domain or None, now)
+            )
+        conn.execute("INSERT OR IGNORE INTO company_aliases VALUES (?, ?)", (canonical, company_id))
+        return company_id
+
+    def resolve_many(self, prospects: list) -> list:
+        """Company ID for each prospect, creating companies not seen before (one transaction)"""
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            return [self._resolve(conn, prospect, now) for prospect in prospects]
+
+    def resolve(self, prospect: dict) -> str:
+        return self.resolve_many([prospect])[0]
+
+    def link_many(self, links: list):
+        """Point prospects at their company: [(prospect_id, company_id, campaign_id)]"""
+        now = time.time()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO company_links VALUES (?, ?, ?, ?)",
+                [(prospect_id, company_id, campaign_id, now) for prospect_id, company_id, campaign_id in links]
+            )
+
+    def campaigns(self, company_id: str) -> list:
+        """Campaigns that include a company"""
+        return [row[0] for row in self._conn().execute(
+            "SELECT DISTINCT campaign_id FROM company_links WHERE company_id = ? AND campaign_id IS NOT NULL",
+            (company_id,)
+        )]
+
+    # Research
+
+    def get_research_many(self, company_ids, fingerprint: str, max_age: float = None) -> dict:
+        """
+        Stored research for each company that has a fresh record
+
+        A record counts if it was made with the same research fingerprint
+        (prompts + model) and is younger than max_age seconds.
+        """
+        max_age = COMPANY_RESEARCH_TTL_DAYS * 86400 if max_age is None else max_age
+        oldest = time.time() - max_age
+        ids = list(company_ids)
+        results = {}
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for company_id, research in self._conn().execute(
+                f"SELECT company_id, research FROM companies WHERE company_id IN ({placeholders}) "
+                "AND research IS NOT NULL AND research_fingerprint = ? AND researched_at >= ?",
+                (*chunk, fingerprint, oldest)
+            ):
+                results[company_id] = json.loads(research)
+        return results
+
+    def put_research_many(self, records: dict, fingerprint: str):
+        """Store {company_id: enriched research}; the company's website becomes a domain it resolves by"""
+        now = time.time()
+        with self._conn() as conn:
+            for company_id, research in records.items():
+                domain = normalize_domain((research.get("company_info") or {}).get("website"))
+                conn.execute(
+                    "UPDATE companies SET research = ?, research_fingerprint = ?, researched_at = ?, "
+                    "domain = COALESCE(domain, ?) WHERE company_id = ?",
+                    (json.dumps(research), fingerprint, now, domain or None, company_id)
+                )
+
+    def stats(self, max_age: float = None) -> dict:
+        max_age = COMPANY_RESEARCH_TTL_DAYS * 86400 if max_age is None else max_age
+        companies, researched, fresh = self._conn().execute(
+            "SELECT COUNT(*), COUNT(researched_at), COALESCE(SUM(researched_at >= ?), 0) FROM companies",
+            (time.time() - max_age,)
+        ).fetchone()
+        return {"companies": companies, "researched": researched, "fresh": fresh}
+
+
+class DynamoDBCompanyIndex:
+    """
+    Same index in DynamoDB: companies (GSIs on block and domain), aliases,
+    and prospect links (GSI on company) so every node shares one record per company
+    """
+
+    def __init__(self, prefix: str = "", fuzzy_threshold: float = COMPANY_FUZZY_THRESHOLD):
+        self.fuzzy_threshold = fuzzy_threshold
+        self.companies = dynamodb.table_name(f"{prefix}companies")
+        self.aliases = dynamodb.table_name(f"{prefix}company_aliases")
+        self.links = dynamodb.table_name(f"{prefix}company_links")
+        dynamodb.ensure_table(
+            self.companies, "company_id", {"company_id": "S", "block": "S", "domain": "S"},
+            (("block-index", "block", None), ("domain-index", "domain", None))
+        )
+        dynamodb.ensure_table(self.aliases, "alias", {"alias": "S"})
+        dynamodb.ensure_table(
+            self.links, "prospect_id", {"prospect_id": "S", "company_id": "S"},
+            (("company-index", "company_id", None),)
+        )
+
+    # Resolution
+
+    def _by_domain(self, domain: str):
+        for item in dynamodb.iter_items(
+            "query", TableName=self.companies, IndexName="domain-index", KeyConditionExpression="#d = :d",
+            ExpressionAttributeNames={"#d": "domain"}, ExpressionAttributeValues={":d": {"S": domain}},
+            ProjectionExpression="company_id"
+        ):
+            return item["company_id"]["S"]
+        return None
+
+    def _fuzzy_match(self, canonical: str):
+        if len(canonical) < 5:
+            return None
+        candidates = (
+            (item["company_id"]["S"], item["canonical_name"]["S"])
+            for item in dynamodb.iter_items(
+                "query", TableName=self.companies, IndexName="block-index", KeyConditionExpression="block = :b",
+                ExpressionAttributeValues={":b": {"S": _block(canonical)}},
+                ProjectionExpression="company_id, canonical_name"
+            )
+            if abs(len(item["canonical_name"]["S"]) - len(canonical)) <= 3
+        )
+        return best_match(canonical, candidates, self.fuzzy_threshold)
+
+    def _put_if_absent(self, table: str, item: dict, key: str):
+        try:
+            dynamodb.get_dynamodb().put_item(
+                TableName=table, Item=item, ConditionExpression=f"attribute_not_exists({key})"
+            )
+        except Exception as e:
+            if not dynamodb.is_error(e, "ConditionalCheckFailedException"):
+                raise
+
+    def resolve_many(self, prospects: list) -> list:
+        """Company ID for each prospect; known names are looked up in one BatchGetItem"""
+        names = [canonical_name(p.get("company_name")) for p in prospects]
+        if not all(names):
+            raise ValueError("Prospect has no company name")
+        known = {
+            item["alias"]["S"]: item["company_id"]["S"]
+            for item in dynamodb.batch_get(self.aliases, [{"alias": {"S": n}} for n in dict.fromkeys(names)])
+        }
+
+        now = time.time()
+        results = []
+        for prospect, canonical in zip(prospects, names):
+            domain = normalize_domain(prospect.get("website") or prospect.get("domain"))
+            company_id = self._by_domain(domain) if domain else None
+            if company_id is None:
+                company_id = known.get(canonical) or self._fuzzy_match(canonical)
+            if company_id is None:
+                company_id = _company_id(canonical)
+                self._put_if_absent(self.companies, dynamodb.to_item(
+                    company_id=company_id, canonical_name=canonical,
+                    display_name=str(prospect.get("company_name")).strip(), block=_block(canonical),
+                    domain=domain, created_at=now
+                ), "company_id")
+            if known.get(canonical) != company_id:
+                self._put_if_absent(self.aliases, dynamodb.to_item(alias=canonical, company_id=company_id), "alias")
+                known[canonical] = company_id
+            results.append(company_id)
+        return results
+
+    def resolve(self, prospect: dict) -> str:
+        return self.resolve_many([prospect])[0]
+
+    def link_many(self, links: list):
+        now = time.time()
+        # One request can't write the same key twice
+        items = {
+            prospect_id: dynamodb.to_item(prospect_id=prospect_id, company_id=company_id,
+                                          campaign_id=campaign_id, linked_at=now)
+            for prospect_id, company_id, campaign_id in links
+        }
+        dynamodb.batch_write(self.links, puts=list(items.values()))
+
+    def campaigns(self, company_id: str) -> list:
+        return sorted({
+            item["campaign_id"]["S"] for item in dynamodb.iter_items(
+                "query", TableName=self.links, IndexName="company-index", KeyConditionExpression="company_id = :c",
+                ExpressionAttributeValues={":c": {"S": company_id}}, ProjectionExpression="campaign_id"
+            ) if "campaign_id" in item
+        })
+
+    # Research
+
+    def get_research_many(self, company_ids, fingerprint: str, max_age: float = None) -> dict:
+        max_age = COMPANY_RESEARCH_TTL_DAYS * 86400 if max_age is None else max_age
+        oldest = time.time() - max_age
+        results = {}
+        for item in dynamodb.batch_get(self.companies, [{"company_id": {"S": cid}} for cid in set(company_ids)]):
+            values = dynamodb.from_item(item)
+            if (values.get("research") and values.get("research_fingerprint") == fingerprint
+                    and values.get("researched_at", 0) >= oldest):
+                results[values["company_id"]] = json.loads(values["research"])
+        return results
+
+    def put_research_many(self, records: dict, fingerprint: str):
+        client = dynamodb.get_dynamodb()
+        now = time.time()
+        for company_id, research in records.items():
+            # UpdateItem doesn't batch; one call per newly researched company
+            values = {":r": {"S": json.dumps(research)}, ":f": {"S": fingerprint}, ":t": {"N": repr(now)}}
+            expression = "SET research = :r, research_fingerprint = :f, researched_at = :t"
+            domain = normalize_domain((research.get("company_info") or {}).get("website"))
+            if domain:
+                expression += ", #d = if_not_exists(#d, :d)"
+                values[":d"] = {"S": domain}
+            client.update_item(
+                TableName=self.companies, Key={"company_id": {"S": company_id}}, UpdateExpression=expression,
+                ExpressionAttributeValues=values, **({"ExpressionAttributeNames": {"#d": "domain"}} if domain else {})
+            )
+
+    def stats(self, max_age: float = None) -> dict:
+        max_age = COMPANY_RESEARCH_TTL_DAYS * 86400 if max_age is None else max_age
+        oldest = time.time() - max_age
+        companies = researched = fresh = 0
+        for item in dynamodb.iter_items("scan", TableName=self.companies, ProjectionExpression="researched_at"):
+            companies += 1
+            if "researched_at" in item:
+                researched += 1
+                fresh += float(item["researched_at"]["N"]) >= oldest
+        return {"companies": companies, "researched": researched, "fresh": fresh}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_company_index():
+    """Return the process-wide company index"""
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                if COMPANY_INDEX_BACKEND == "dynamodb":
+                    _index = DynamoDBCompanyIndex()
+                elif COMPANY_INDEX_BACKEND == "sqlite":
+                    _index = CompanyIndex(COMPANY_DB_PATH)
+                else:
+                    raise ValueError(f"Unknown COMPANY_INDEX_BACKEND: {COMPANY_INDEX_BACKEND}")
+    return _index
@@ -5,27 +5,214 @@ Configuration - 100% Free Local Setup
 """
 
 import os
+import threading
+from types import SimpleNamespace
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Google Gemini API (Free)
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-GEMINI_MODEL = "gemini-1.5-flash"
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")  # the "standard" tier
+GEMINI_MODEL_FAST = os.getenv("GEMINI_MODEL_FAST", "gemini-2.5-flash-lite")
+GEMINI_MODEL_PRO = os.getenv("GEMINI_MODEL_PRO", "gemini-2.5-pro")
+GEMINI_POOL_SIZE = int(os.getenv("GEMINI_POOL_SIZE", "20"))
+GEMINI_KEEPALIVE_SECONDS = float(os.getenv("GEMINI_KEEPALIVE_SECONDS", "60"))
 
-# DynamoDB Local
+# Gemini Quota (defaults match the free tier for gemini-2.5-flash)
+GEMINI_RPM = float(os.getenv("GEMINI_RPM", "10"))
+GEMINI_TPM = float(os.getenv("GEMINI_TPM", "250000"))
+GEMINI_EST_OUTPUT_TOKENS = int(os.getenv("GEMINI_EST_OUTPUT_TOKENS", "800"))
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "5"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1.0"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "60"))
+
+# Gemini context caching for shared system prefixes (only used above the model's minimum size)
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "true").lower() == "true"
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+
+# Model routing: per-task tiers (e.g. "content=fast,research=pro") and failover to the next
+# faster tier when a model's p95 latency or error rate over the window crosses its threshold
+MODEL_TIERS = os.getenv("MODEL_TIERS", "")
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", "300"))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_P95_THRESHOLD_SECONDS = float(os.getenv("ROUTER_P95_THRESHOLD_SECONDS", "30"))
+ROUTER_ERROR_RATE_THRESHOLD = float(os.getenv("ROUTER_ERROR_RATE_THRESHOLD", "0.25"))
+ROUTER_PROBE_FRACTION = float(os.getenv("ROUTER_PROBE_FRACTION", "0.05"))  # calls still sent to a degraded model
+
+# Hedged requests for interactive regenerations: if no text has arrived after this long,
+# the same request also goes to the next faster model and the first answer wins
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "true").lower() == "true"
+GEMINI_HEDGE_AFTER_SECONDS = float(os.getenv("GEMINI_HEDGE_AFTER_SECONDS", "3"))
+
+# DynamoDB Local (set DYNAMODB_ENDPOINT="" to use AWS with the default credential chain)
 DYNAMODB_ENDPOINT = os.getenv("DYNAMODB_ENDPOINT", "http://localhost:8000")
-AWS_REGION = "us-east-1"
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+DYNAMODB_TABLE_PREFIX = os.getenv("DYNAMODB_TABLE_PREFIX", "campaign_")
+DYNAMODB_MAX_RETRIES = int(os.getenv("DYNAMODB_MAX_RETRIES", "8"))  # rounds for unprocessed batch items
 
 # Directories
 DATA_DIR = "data"
 SESSIONS_DIR = "sessions"
 
+# Session Storage ("sqlite", "dynamodb" to share state between nodes, or "json" for the
+# legacy one-file-per-prospect layout)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(SESSIONS_DIR, "sessions.db"))
+SESSION_INDEX_SIZE = int(os.getenv("SESSION_INDEX_SIZE", "10000"))  # sessions kept in memory per process
+
+# Response Cache
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(DATA_DIR, "response_cache.db"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Gemini quota buckets, shared by the app and every worker process on this host so together
+# they stay within GEMINI_RPM/GEMINI_TPM (with several hosts, give each one its share)
+GEMINI_RATE_DB_PATH = os.getenv("GEMINI_RATE_DB_PATH", os.path.join(DATA_DIR, "rate_limits.db"))
+
+# Company Index (one shared research record per company)
+COMPANY_INDEX_BACKEND = os.getenv("COMPANY_INDEX_BACKEND", "dynamodb" if SESSION_BACKEND == "dynamodb" else "sqlite")
+COMPANY_DB_PATH = os.getenv("COMPANY_DB_PATH", os.path.join(DATA_DIR, "companies.db"))
+COMPANY_RESEARCH_TTL_DAYS = float(os.getenv("COMPANY_RESEARCH_TTL_DAYS", "30"))
+COMPANY_FUZZY_THRESHOLD = float(os.getenv("COMPANY_FUZZY_THRESHOLD", "0.92"))
+
+# Delivery Log (append-only JSON lines, or a DynamoDB table of send events)
+DELIVERY_LOG_BACKEND = os.getenv("DELIVERY_LOG_BACKEND", "dynamodb" if SESSION_BACKEND == "dynamodb" else "file")
+DELIVERY_LOG_PATH = os.getenv("DELIVERY_LOG_PATH", os.path.join(DATA_DIR, "sent_emails.jsonl"))
+DELIVERY_LOG_FSYNC_EVERY = int(os.getenv("DELIVERY_LOG_FSYNC_EVERY", "50"))
+DELIVERY_LOG_FSYNC_SECONDS = float(os.getenv("DELIVERY_LOG_FSYNC_SECONDS", "1.0"))
+
+# Publishing ("mock" only writes the delivery log, "smtp" delivers via SMTP_HOST)
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "mock")
+SENDER_EMAIL = os.getenv("SENDER_EMAIL", "sales@example.com")
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_USE_TLS = os.getenv("SMTP_USE_TLS", "false").lower() == "true"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+SEND_CONCURRENCY = int(os.getenv("SEND_CONCURRENCY", "8"))
+SEND_PER_DOMAIN_PER_MINUTE = float(os.getenv("SEND_PER_DOMAIN_PER_MINUTE", "60"))
+
 # Email Settings
 EMAIL_TARGET_WORD_COUNT = 144
 EMAIL_MIN_WORDS = 100
 EMAIL_MAX_WORDS = 200
+# "single" drafts one email for the first contact, "multi" drafts one per contact
+# (up to EMAIL_MAX_CONTACTS) with EMAIL_SUBJECT_VARIANTS subject lines each, in one call
+EMAIL_MODE = os.getenv("EMAIL_MODE", "single")
+EMAIL_MAX_CONTACTS = int(os.getenv("EMAIL_MAX_CONTACTS", "5"))
+EMAIL_SUBJECT_VARIANTS = int(os.getenv("EMAIL_SUBJECT_VARIANTS", "2"))
+# The prompt asks for 3 words; a little over is accepted rather than paying for a rewrite
+EMAIL_SUBJECT_MAX_WORDS = int(os.getenv("EMAIL_SUBJECT_MAX_WORDS", "5"))
+
+# Draft validation (utils/validators.py): local repairs first, then one batched rewrite call
+# per VALIDATION_FIX_BATCH_SIZE drafts that still fail, for up to VALIDATION_FIX_ROUNDS rounds
+VALIDATION_ENABLED = os.getenv("VALIDATION_ENABLED", "true").lower() == "true"
+VALIDATION_FIX_ROUNDS = int(os.getenv("VALIDATION_FIX_ROUNDS", "1"))
+VALIDATION_FIX_BATCH_SIZE = int(os.getenv("VALIDATION_FIX_BATCH_SIZE", "5"))
+VALIDATION_DB_PATH = os.getenv("VALIDATION_DB_PATH", os.path.join(DATA_DIR, "validation.db"))
+
+# Batch Processing
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "8"))
+RESEARCH_BATCH_SIZE = int(os.getenv("RESEARCH_BATCH_SIZE", "5"))
+
+# Scheduler (value-ordered enrichment with a per-campaign daily quota)
+CAMPAIGN_DAILY_CALL_BUDGET = float(os.getenv("CAMPAIGN_DAILY_CALL_BUDGET", "0"))  # est. Gemini calls/UTC day, 0 = unlimited
+SCHEDULER_RESERVE_FRACTION = float(os.getenv("SCHEDULER_RESERVE_FRACTION", "0.2"))  # last share kept for high-value rows
+SCHEDULER_DEFAULT_BUDGET = float(os.getenv("SCHEDULER_DEFAULT_BUDGET", "10000"))  # assumed deal size when blank
+SCHEDULER_FRESHNESS_HALF_LIFE_DAYS = float(os.getenv("SCHEDULER_FRESHNESS_HALF_LIFE_DAYS", "14"))
+SCHEDULER_RETRY_PENALTY = float(os.getenv("SCHEDULER_RETRY_PENALTY", "0.5"))
+INDUSTRY_WEIGHTS = os.getenv("INDUSTRY_WEIGHTS", "")  # e.g. "SaaS=1.5,FinTech=1.2", others 1.0
+QUOTA_DB_PATH = os.getenv("QUOTA_DB_PATH", os.path.join(DATA_DIR, "quota.db"))
+
+# Background Jobs (worker.py)
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(DATA_DIR, "jobs.db"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "4"))
+
+# Metrics
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 = no Prometheus endpoint
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join(DATA_DIR, "metrics"))
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+# A snapshot from another host that hasn't been refreshed for this long belongs to an exited
+# process (same-host snapshots are checked by pid) and is folded into the archive
+METRICS_STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "600"))
+# USD per million tokens (gemini-2.5-flash list price)
+GEMINI_INPUT_COST_PER_MTOK = float(os.getenv("GEMINI_INPUT_COST_PER_MTOK", "0.30"))
+GEMINI_OUTPUT_COST_PER_MTOK = float(os.getenv("GEMINI_OUTPUT_COST_PER_MTOK", "2.50"))
+
+# CSV Ingestion
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
+PREVIEW_ROWS = int(os.getenv("PREVIEW_ROWS", "100"))
+
+# Dashboard
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "25"))
+
+# Settings object
+# Importing this module only reads the environment; each store creates its own
+# directory on first use. get_settings() checks the values once per process.
+
+_CHOICES = {
+    "SESSION_BACKEND": ("sqlite", "json", "dynamodb"),
+    "COMPANY_INDEX_BACKEND": ("sqlite", "dynamodb"),
+    "DELIVERY_LOG_BACKEND": ("file", "dynamodb"),
+    "EMAIL_TRANSPORT": ("mock", "smtp"),
+    "EMAIL_MODE": ("single", "multi"),
+}
+_POSITIVE = (
+    "GEMINI_POOL_SIZE", "GEMINI_RPM", "GEMINI_TPM", "SESSION_INDEX_SIZE", "SMTP_POOL_SIZE", "SEND_CONCURRENCY",
+    "EMAIL_MAX_CONTACTS", "EMAIL_SUBJECT_VARIANTS", "EMAIL_SUBJECT_MAX_WORDS", "VALIDATION_FIX_BATCH_SIZE",
+    "ENRICH_CONCURRENCY", "RESEARCH_BATCH_SIZE",
+    "JOB_LEASE_SECONDS", "JOB_MAX_ATTEMPTS", "WORKER_PROCESSES", "WORKER_THREADS", "INGEST_CHUNK_SIZE", "PAGE_SIZE",
+)
+_FRACTIONS = (
+    "SCHEDULER_RESERVE_FRACTION", "ROUTER_ERROR_RATE_THRESHOLD", "ROUTER_PROBE_FRACTION", "COMPANY_FUZZY_THRESHOLD",
+)
+
+_settings = None
+_settings_lock = threading.Lock()
+
+
+def validate(values: dict) -> list:
+    """Return a message for every setting that is out of range (empty if all are fine)"""
+    problems = []
+    for name, choices in _CHOICES.items():
+        if values[name] not in choices:
+            problems.append(f"{name}={values[name]!r}, expected one of {', '.join(choices)}")
+    for name in _POSITIVE:
+        if not values[name] > 0:
+            problems.append(f"{name}={values[name]!r} must be greater than 0")
+    for name in _FRACTIONS:
+        if not 0 <= values[name] <= 1:
+            problems.append(f"{name}={values[name]!r} must be between 0 and 1")
+    if not values["EMAIL_MIN_WORDS"] <= values["EMAIL_TARGET_WORD_COUNT"] <= values["EMAIL_MAX_WORDS"]:
+        problems.append("EMAIL_TARGET_WORD_COUNT must lie between EMAIL_MIN_WORDS and EMAIL_MAX_WORDS")
+    return problems
+
+
+def get_settings() -> SimpleNamespace:
+    """
+    Every setting in this module as one read-only-by-convention object
+
+    Validated on first call (ValueError listing every bad value) and cached
+    for the life of the process; entry points call it at startup to fail fast.
+    """
+    global _settings
 
-# Create directories
-os.makedirs(DATA_DIR, exist_ok=True)
-os.makedirs(SESSIONS_DIR, exist_ok=True)
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                values = {name: value for name, value in globals().items() if name.isupper()}
+                problems = validate(values)
+                if problems:
+                    raise ValueError("Invalid configuration:\n  " + "\n  ".join(problems))
+                _settings = SimpleNamespace(**values)
+    return _settings
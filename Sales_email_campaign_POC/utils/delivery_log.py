@@ -0,0 +1,258 @@
+"""
+Delivery Log - Append-only JSON-lines record of sent emails
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from utils import dynamodb
+from utils.config import (
+    DATA_DIR, DELIVERY_LOG_BACKEND, DELIVERY_LOG_PATH, DELIVERY_LOG_FSYNC_EVERY, DELIVERY_LOG_FSYNC_SECONDS
+)
+
+
+class DeliveryLog:
+    """
+    Each record is written with a single O_APPEND write, so concurrent
+    threads and processes never interleave or overwrite each other's
+    lines. fsync is batched: every `fsync_every` records or
+    `fsync_seconds` seconds, whichever comes first.
+    """
+
+    def __init__(self, path: str, fsync_every: int = 50, fsync_seconds: float = 1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, record: dict):
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        with self._lock:
+            os.write(self._fd, line)
+            self._unsynced += 1
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_seconds):
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self._fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def flush(self):
+        with self._lock:
+            if self._unsynced:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._fd is None:
+                return
+            if self._unsynced:
+                self._sync()
+            os.close(self._fd)
+            self._fd = None
+
+
+class DynamoDBDeliveryLog:
+    """
+    Send events as items in a DynamoDB table, with a GSI on status
+
+    Records are buffered and written in BatchWriteItem requests every
+    `flush_every` records or `flush_seconds` seconds, like the file log's
+    batched fsync. A background thread writes out whatever is left once
+    `flush_seconds` pass, so a lone send in a long-lived process isn't held
+    back until the next one. Records that fail to write stay buffered for
+    the next attempt, and flush()/close() raise. Same append/flush/close interface.
+    """
+
+    def __init__(self, name: str, flush_every: int = dynamodb.BATCH_WRITE_LIMIT, flush_seconds: float = 1.0):
+        self.name = name
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+        dynamodb.ensure_table(
+            name, "event_id", {"event_id": "S", "status": "S", "sent_at": "S"},
+            (("status-index", "status", "sent_at"),)
+        )
+        threading.Thread(target=self._flush_loop, name="send-events-flush", daemon=True).start()
+
+    def append(self, record: dict):
+        item = dynamodb.to_item(
+            event_id=uuid.uuid4().hex,
+            status=record.get("status"),
+            sent_at=record.get("sent_at") or datetime.now().isoformat(),
+            prospect=record.get("prospect"),
+            recipient=record.get("to"),
+            data=json.dumps(record)
+        )
+        with self._lock:
+            self._buffer.append(item)
+            if (len(self._buffer) >= self.flush_every
+                    or time.monotonic() - self._last_flush >= self.flush_seconds):
+                try:
+                    self._flush()
+                except Exception as e:
+                    # The email already went out; the record stays buffered for the next flush
+                    print(f"[PUBLISHING] Could not write send events: {str(e)}")
+
+    def _flush(self):
+        """Write the buffer; on failure the items go back in front of it and the error is raised"""
+        items, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        if not items:
+            return
+        try:
+            dynamodb.batch_write(self.name, puts=items)
+        except Exception:
+            # event_id is fixed per record, so rewriting batches that did get through is harmless
+            self._buffer[:0] = items
+            raise
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                with self._lock:
+                    if self._buffer and time.monotonic() - self._last_flush >= self.flush_seconds:
+                        self._flush()
+            except Exception as e:
+                print(f"[PUBLISHING] Could not write send events: {str(e)}")
+
+    def close(self):
+        self.flush()
+
+    def records(self, status: str = None):
+        """Stream send events, oldest first for one status (all statuses: table order)"""
+        if status is None:
+            items = dynamodb.iter_items("scan", TableName=self.name, ProjectionExpression="#d",
+                                        ExpressionAttributeNames={"#d": "data"})
+        else:
+            items = dynamodb.iter_items(
+                "query", TableName=self.name, IndexName="status-index", KeyConditionExpression="#s = :s",
+                ExpressionAttributeNames={"#s": "status", "#d": "data"},
+                ExpressionAttributeValues={":s": {"S": status}}, ProjectionExpression="#d"
+            )
+        for item in items:
+            yield json.loads(item["data"]["S"])
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError:
+        # Torn final line from a crash mid-write
+        return None
+
+
+def iter_records(path: str):
+    """Stream every record from the log without loading it all"""
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                record = _parse_line(line)
+                if record is not None:
+                    yield record
+    except FileNotFoundError:
+        return
+
+
+def tail(path: str, n: int = 20, block_size: int = 64 * 1024) -> list:
+    """Return the last n records, reading backwards from the end of the file"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return []
+
+    with f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b""
+        while position > 0 and data.count(b"\n") <= n:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+
+    records = [r for r in map(_parse_line, data.splitlines()) if r is not None]
+    return records[-n:]
+
+
+def follow(path: str, poll_seconds: float = 0.5, from_start: bool = False):
+    """Yield records as they are appended (like `tail -f`), runs until the caller stops"""
+    while not os.path.exists(path):
+        time.sleep(poll_seconds)
+
+    with open(path, 'rb') as f:
+        if not from_start:
+            f.seek(0, os.SEEK_END)
+        buffer = b""
+        while True:
+            chunk = f.readline()
+            if not chunk:
+                time.sleep(poll_seconds)
+                continue
+            buffer += chunk
+            if buffer.endswith(b"\n"):
+                record = _parse_line(buffer)
+                buffer = b""
+                if record is not None:
+                    yield record
+
+
+def import_legacy_log(legacy_path: str, log: DeliveryLog) -> int:
+    """Move records from the old rewrite-the-whole-file sent_emails.json into the log"""
+    try:
+        with open(legacy_path, 'r') as f:
+            records = json.load(f)
+    except (OSError, ValueError):
+        return 0
+
+    for record in records:
+        log.append(record)
+    log.flush()
+    os.replace(legacy_path, legacy_path + ".imported")
+    return len(records)
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_delivery_log():
+    """Return the process-wide delivery log, flushed on interpreter exit"""
+    global _log
+
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                if DELIVERY_LOG_BACKEND == "dynamodb":
+                    _log = DynamoDBDeliveryLog(dynamodb.table_name("send_events"),
+                                               flush_seconds=DELIVERY_LOG_FSYNC_SECONDS)
+                elif DELIVERY_LOG_BACKEND == "file":
+                    _log = DeliveryLog(DELIVERY_LOG_PATH, DELIVERY_LOG_FSYNC_EVERY, DELIVERY_LOG_FSYNC_SECONDS)
+                else:
+                    raise ValueError(f"Unknown DELIVERY_LOG_BACKEND: {DELIVERY_LOG_BACKEND}")
+                imported = import_legacy_log(os.path.join(DATA_DIR, "sent_emails.json"), _log)
+                if imported:
+                    print(f"[PUBLISHING] Imported {imported} records from legacy sent_emails.json")
+                atexit.register(_log.close)
+    return _log
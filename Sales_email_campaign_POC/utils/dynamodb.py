@@ -0,0 +1,203 @@
+"""
+DynamoDB - Shared client, table setup and batch helpers for the DynamoDB backends
+
+Sessions, the company index and the delivery log can all live in DynamoDB
+(DynamoDB Local from docker-compose.yml, or AWS with DYNAMODB_ENDPOINT=""),
+so several nodes share campaign state without a shared filesystem. The
+job queue, quota ledger and duplicate index stay in local SQLite, so
+workers still run on the machine that enqueues their jobs. boto3 is only
+needed (and only imported) when one of those backends is "dynamodb".
+"""
+
+import os
+import random
+import threading
+import time
+from utils.config import DYNAMODB_ENDPOINT, AWS_REGION, DYNAMODB_TABLE_PREFIX, DYNAMODB_MAX_RETRIES
+
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_dynamodb():
+    """Return the process-wide low-level DynamoDB client"""
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    import boto3
+                    from botocore.config import Config
+                except ImportError:
+                    raise RuntimeError("The DynamoDB backend needs boto3: pip install boto3")
+                kwargs = {}
+                if DYNAMODB_ENDPOINT:
+                    # DynamoDB Local accepts any credentials but still wants some
+                    kwargs = {
+                        "endpoint_url": DYNAMODB_ENDPOINT,
+                        "aws_access_key_id": os.getenv("AWS_ACCESS_KEY_ID", "local"),
+                        "aws_secret_access_key": os.getenv("AWS_SECRET_ACCESS_KEY", "local"),
+                    }
+                _client = boto3.client(
+                    "dynamodb", region_name=AWS_REGION,
+                    config=Config(max_pool_connections=50, retries={"mode": "adaptive", "max_attempts": 5}),
+                    **kwargs
+                )
+    return _client
+
+
+def table_name(name: str) -> str:
+    return f"{DYNAMODB_TABLE_PREFIX}{name}"
+
+
+def is_error(error: Exception, code: str) -> bool:
+    from botocore.exceptions import ClientError
+    return isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") == code
+
+
+def ensure_table(name: str, key: str, attributes: dict, indexes: tuple = ()) -> bool:
+    """
+    Create a pay-per-request table unless it exists; returns True if it was created
+
+    attributes: {attribute: "S" | "N"} for the key and every index key
+    indexes: (index_name, hash_attribute, range_attribute or None), projecting all attributes
+    """
+    from botocore.exceptions import ClientError
+
+    client = get_dynamodb()
+    try:
+        client.describe_table(TableName=name)
+        return False
+    except ClientError as e:
+        if not is_error(e, "ResourceNotFoundException"):
+            raise
+
+    request = {
+        "TableName": name,
+        "BillingMode": "PAY_PER_REQUEST",
+        "KeySchema": [{"AttributeName": key, "KeyType": "HASH"}],
+        "AttributeDefinitions": [{"AttributeName": a, "AttributeType": t} for a, t in attributes.items()],
+    }
+    if indexes:
+        request["GlobalSecondaryIndexes"] = [
+            {
+                "IndexName": index,
+                "KeySchema": [{"AttributeName": hash_key, "KeyType": "HASH"}] +
+                             ([{"AttributeName": range_key, "KeyType": "RANGE"}] if range_key else []),
+                "Projection": {"ProjectionType": "ALL"},
+            }
+            for index, hash_key, range_key in indexes
+        ]
+    try:
+        client.create_table(**request)
+        created = True
+    except ClientError as e:
+        # Another node is creating it right now
+        if not is_error(e, "ResourceInUseException"):
+            raise
+        created = False
+    client.get_waiter("table_exists").wait(TableName=name)
+    print(f"[DYNAMODB] Table {name} ready")
+    return created
+
+
+# Attribute values
+
+def to_item(**values) -> dict:
+    """Python values -> DynamoDB item; None and "" are left out (index keys can't be empty)"""
+    item = {}
+    for name, value in values.items():
+        if value is None or value == "":
+            continue
+        if isinstance(value, bool):
+            item[name] = {"BOOL": value}
+        elif isinstance(value, (int, float)):
+            item[name] = {"N": repr(value)}
+        else:
+            item[name] = {"S": str(value)}
+    return item
+
+
+def from_item(item: dict) -> dict:
+    values = {}
+    for name, value in item.items():
+        if "S" in value:
+            values[name] = value["S"]
+        elif "N" in value:
+            number = float(value["N"])
+            values[name] = int(number) if number.is_integer() and "." not in value["N"] else number
+        elif "BOOL" in value:
+            values[name] = value["BOOL"]
+    return values
+
+
+# Batches with unprocessed-item retry
+
+def _backoff(attempt: int):
+    # Unprocessed items mean the table is throttling us: back off with full jitter
+    time.sleep(random.uniform(0, min(5.0, 0.05 * 2 ** attempt)))
+
+
+def batch_write(table: str, puts: list = (), deletes: list = ()):
+    """
+    Put items / delete keys in BatchWriteItem requests of 25
+
+    Items DynamoDB hands back as unprocessed are retried with backoff;
+    RuntimeError if some are still left after DYNAMODB_MAX_RETRIES.
+    """
+    requests = [{"PutRequest": {"Item": item}} for item in puts] + \
+               [{"DeleteRequest": {"Key": key}} for key in deletes]
+    client = get_dynamodb()
+    for i in range(0, len(requests), BATCH_WRITE_LIMIT):
+        pending = {table: requests[i:i + BATCH_WRITE_LIMIT]}
+        for attempt in range(DYNAMODB_MAX_RETRIES + 1):
+            pending = client.batch_write_item(RequestItems=pending).get("UnprocessedItems") or {}
+            if not pending:
+                break
+            _backoff(attempt)
+        else:
+            raise RuntimeError(f"{len(pending[table])} items to {table} still unprocessed after retries")
+
+
+def batch_get(table: str, keys: list, projection: str = None, names: dict = None,
+              consistent: bool = False) -> list:
+    """
+    Fetch keys in BatchGetItem requests of 100, retrying unprocessed keys; order isn't kept
+
+    consistent=True makes the reads strongly consistent (twice the read
+    capacity), so they see every write that completed before them.
+    """
+    client = get_dynamodb()
+    items = []
+    for i in range(0, len(keys), BATCH_GET_LIMIT):
+        request = {"Keys": keys[i:i + BATCH_GET_LIMIT], "ConsistentRead": consistent}
+        if projection:
+            request["ProjectionExpression"] = projection
+        if names:
+            request["ExpressionAttributeNames"] = names
+        pending = {table: request}
+        for attempt in range(DYNAMODB_MAX_RETRIES + 1):
+            response = client.batch_get_item(RequestItems=pending)
+            items.extend(response.get("Responses", {}).get(table, []))
+            pending = response.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+            _backoff(attempt)
+        else:
+            raise RuntimeError(f"{len(pending[table]['Keys'])} keys from {table} still unprocessed after retries")
+    return items
+
+
+def paginate(operation: str, **kwargs):
+    """Yield every page of a query/scan, following LastEvaluatedKey"""
+    yield from get_dynamodb().get_paginator(operation).paginate(**kwargs)
+
+
+def iter_items(operation: str, **kwargs):
+    """Yield every item of a query/scan across pages"""
+    for page in paginate(operation, **kwargs):
+        yield from page.get("Items", [])
@@ -0,0 +1,130 @@
+"""
+Fake SMTP Server - Local stand-in for throughput testing without sending real mail
+
+Run standalone:  python -m utils.fake_smtp --port 1025
+"""
+
+import argparse
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Speaks just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        server = self.server
+        server.record_connection()
+        self._reply("220 fake-smtp ready")
+
+        sender, recipients = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+
+            if verb in ("EHLO", "HELO"):
+                if verb == "EHLO":
+                    self._reply("250-fake-smtp")
+                    self._reply("250 8BITMIME")
+                else:
+                    self._reply("250 fake-smtp")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line)
+                if server.latency:
+                    time.sleep(server.latency)
+                server.record_message(sender, recipients, b"".join(lines))
+                self._reply("250 OK queued")
+                sender, recipients = None, []
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Threaded in-memory SMTP sink that counts connections and messages"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, keep_messages: bool = True):
+        super().__init__((host, port), _SMTPHandler)
+        self.latency = latency
+        self.keep_messages = keep_messages
+        self.messages = []
+        self.connections = 0
+        self.message_count = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_message(self, sender, recipients, data: bytes):
+        with self._lock:
+            self.message_count += 1
+            if self.keep_messages:
+                self.messages.append({"from": sender, "to": recipients, "data": data})
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local fake SMTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait per message")
+    args = parser.parse_args()
+
+    server = FakeSMTPServer(args.host, args.port, args.latency, keep_messages=False)
+    print(f"[FAKE SMTP] Listening on {args.host}:{server.port}")
+    try:
+        server.serve_forever(poll_interval=0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[FAKE SMTP] {server.message_count} messages over {server.connections} connections")
+        server.server_close()
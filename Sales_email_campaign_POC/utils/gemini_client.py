@@ -1,18 +1,518 @@
 """
 Gemini Client - Wrapper for Google Gemini API (NEW package)
+
+google.genai and httpx take most of a cold start to import, so they are
+imported when the first client is built rather than with this module.
 """
 
-from google import genai
+import contextvars
+import hashlib
+import json
+import queue
+import random
+import re
+import threading
+import time
+from utils.config import (
+    GOOGLE_API_KEY, GEMINI_MODEL, GEMINI_POOL_SIZE, GEMINI_KEEPALIVE_SECONDS,
+    GEMINI_RPM, GEMINI_TPM, GEMINI_EST_OUTPUT_TOKENS,
+    GEMINI_MAX_RETRIES, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX,
+    GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_MIN_TOKENS, GEMINI_CONTEXT_CACHE_TTL,
+    GEMINI_HEDGE_ENABLED, GEMINI_HEDGE_AFTER_SECONDS,
+    GEMINI_RATE_DB_PATH, CACHE_ENABLED, CACHE_DB_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES
+)
+from utils.metrics import inc, observe, current_stage, record_usage
+from utils.model_router import ModelRouter, get_model_router
+from utils.rate_limiter import RateLimiter, SharedRateLimiter
+from utils.response_cache import ResponseCache
+
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {"RESOURCE_EXHAUSTED"}
+RETRY_HINT_PATTERNS = [
+    re.compile(r"retryDelay['\"]?\s*:\s*['\"]?([\d.]+)s"),
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+]
+_END = object()  # end of a hedged stream
+
+_limiter = None
+_limiter_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return the Gemini rate limiter, whose budget is shared with the host's other processes"""
+    global _limiter
+
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = SharedRateLimiter(GEMINI_RATE_DB_PATH, GEMINI_RPM, GEMINI_TPM)
+    return _limiter
+
+
+def get_response_cache():
+    """Return the process-wide response cache, or None when caching is disabled"""
+    global _cache
+
+    if not CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(CACHE_DB_PATH, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES)
+    return _cache
+
+
+def is_throttle(error: Exception) -> bool:
+    """True for quota errors (429 / RESOURCE_EXHAUSTED)"""
+    return getattr(error, "code", None) == 429 or getattr(error, "status", None) in THROTTLE_STATUSES
+
+
+def is_retryable(error: Exception) -> bool:
+    import httpx
+    from google.genai import errors
+
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_CODES or is_throttle(error)
+    return False
+
+
+def retry_hint(error: Exception):
+    """Seconds the server asked us to wait (Retry-After / RetryInfo), or None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        pass
+
+    text = str(error)
+    for pattern in RETRY_HINT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def backoff_delay(attempt: int, hint=None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server hint"""
+    delay = random.uniform(0, min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * (2 ** attempt)))
+    if hint is not None:
+        delay = max(delay, hint + random.uniform(0, GEMINI_BACKOFF_BASE))
+    return min(delay, GEMINI_BACKOFF_MAX)
+
+
+class ConnectionStats:
+    """Counts HTTP requests vs. new TCP connections opened by the pool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def _trace(self, event_name, info):
+        # httpcore emits this once per freshly opened connection
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    async def _atrace(self, event_name, info):
+        self._trace(event_name, info)
+
+    def on_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._trace
+
+    async def aon_request(self, request):
+        with self._lock:
+            self.requests += 1
+        request.extensions["trace"] = self._atrace
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": max(0, self.requests - self.new_connections)
+            }
+
 
 class GeminiClient:
-    def __init__(self, api_key: str):
-        self.client = genai.Client(api_key=api_key)
-        self.model = 'gemini-2.5-flash'
-    
-    def generate_email(self, prompt: str) -> str:
-        """Generate content using Gemini"""
-        response = self.client.models.generate_content(
-            model=self.model,
-            contents=prompt
+    def __init__(self, api_key: str, pool_size: int = GEMINI_POOL_SIZE, limiter: RateLimiter = None,
+                 cache: ResponseCache = None, router: ModelRouter = None):
+        self.stats = ConnectionStats()
+        self.limiter = limiter or get_rate_limiter()
+        self.cache = cache or get_response_cache()
+        self.router = router or get_model_router()
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+        self._context_caches = {}
+        self._context_pending = {}  # key -> Event set once the thread creating that cache is done
+        self._context_lock = threading.Lock()
+
+        import httpx
+        from google import genai
+        from google.genai import types
+
+        # One keep-alive pool shared by every thread using this client
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size,
+            keepalive_expiry=GEMINI_KEEPALIVE_SECONDS
         )
-        return response.text
+        http_options = types.HttpOptions(
+            client_args={
+                "limits": limits,
+                "event_hooks": {"request": [self.stats.on_request]}
+            },
+            async_client_args={
+                "limits": limits,
+                "event_hooks": {"request": [self.stats.aon_request]}
+            }
+        )
+
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self.model = GEMINI_MODEL
+
+    def _estimate_tokens(self, prompt: str, system: str = None) -> int:
+        # ~4 characters per token is close enough for budgeting
+        return (len(prompt) + len(system or "")) // 4 + GEMINI_EST_OUTPUT_TOKENS
+
+    def model_for(self, task: str = None) -> str:
+        """Model a task (default: the current metrics stage) is routed to when healthy"""
+        return self.router.primary(task or current_stage())
+
+    def _context_cache(self, system: str, model: str):
+        """
+        Name of an explicit context cache holding this system instruction, or None
+
+        Gemini only caches prefixes above a minimum size; smaller ones are
+        sent as system_instruction (2.5 models also cache those implicitly).
+        Caches belong to one model, so each model gets its own.
+        """
+        if not GEMINI_CONTEXT_CACHE or len(system) // 4 < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        key = hashlib.sha256(f"{model}\0{system}".encode("utf-8")).hexdigest()
+        while True:
+            now = time.time()
+            with self._context_lock:
+                if key in self._context_caches:
+                    entry = self._context_caches[key]
+                    # None: creating it failed before, don't keep trying
+                    if entry is None or entry[1] > now + 60:
+                        return entry and entry[0]
+                pending = self._context_pending.get(key)
+                if pending is None:
+                    # This thread creates it; others wait for this key only
+                    self._context_pending[key] = threading.Event()
+                    break
+            pending.wait()
+
+        from google.genai import types
+        entry = None
+        try:
+            cached = self.client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=system, ttl=f"{GEMINI_CONTEXT_CACHE_TTL}s"
+                )
+            )
+            entry = (cached.name, now + GEMINI_CONTEXT_CACHE_TTL)
+            print(f"[GEMINI] Created context cache {cached.name} for {model}")
+        except Exception as e:
+            print(f"[GEMINI] Context cache unavailable, sending system_instruction: {str(e)}")
+        finally:
+            with self._context_lock:
+                self._context_caches[key] = entry
+                self._context_pending.pop(key).set()
+        return entry and entry[0]
+
+    def _request_config(self, model: str, system: str = None, schema: dict = None):
+        from google.genai import types
+
+        options = {}
+        if system:
+            cached = self._context_cache(system, model)
+            if cached:
+                options["cached_content"] = cached
+            else:
+                options["system_instruction"] = system
+        if schema:
+            # Constrained decoding: the response is JSON matching the schema
+            options["response_mime_type"] = "application/json"
+            options["response_schema"] = schema
+        return types.GenerateContentConfig(**options) if options else None
+
+    def _cache_key(self, task: str, prompt: str, system: str = None, schema: dict = None) -> str:
+        # Keyed on the task's primary model, so an answer from a failover model is reused too
+        if schema:
+            system = f"{system or ''}\0{json.dumps(schema, sort_keys=True)}"
+        return ResponseCache.make_key(self.router.primary(task), prompt, system)
+
+    def _record_success(self, response, estimated: int, model: str, started: float):
+        elapsed = time.perf_counter() - started
+        self.router.record(model, elapsed, ok=True)
+        observe("gemini_request_seconds", elapsed, stage=current_stage())
+        inc("gemini_model_requests_total", stage=current_stage(), model=model)
+        usage = getattr(response, "usage_metadata", None)
+        self.limiter.reconcile(estimated, getattr(usage, "total_token_count", None) or 0)
+        self.limiter.on_success()
+        record_usage(response)
+
+    def _record_failure(self, error: Exception, attempt: int, model: str, started: float) -> float:
+        """Return how long to back off, or re-raise when the error is final"""
+        self.router.record(model, time.perf_counter() - started, ok=False)
+        if attempt >= GEMINI_MAX_RETRIES or not is_retryable(error):
+            raise error
+        if is_throttle(error):
+            self.limiter.on_throttle()
+        with self._retries_lock:
+            self.retries += 1
+        inc("gemini_retries_total", stage=current_stage(), code=str(getattr(error, "code", type(error).__name__)))
+        delay = backoff_delay(attempt, retry_hint(error))
+        print(f"[GEMINI] {type(error).__name__} ({getattr(error, 'code', '-')}) from {model}, retry {attempt + 1}/{GEMINI_MAX_RETRIES} in {delay:.1f}s")
+        return delay
+
+    def _cache_lookup(self, task: str, prompt: str, use_cache: bool, system: str = None, schema: dict = None):
+        """Return (key, cached_text); key is None when caching is off"""
+        if self.cache is None:
+            return None, None
+        key = self._cache_key(task, prompt, system, schema)
+        if not use_cache:
+            return key, None
+        cached = self.cache.get(key)
+        inc("gemini_cache_total", stage=current_stage(), result="miss" if cached is None else "hit")
+        return key, cached
+
+    def _cache_store(self, key, task: str, text: str):
+        if key is not None and text:
+            self.cache.put(key, self.router.primary(task), text)
+
+    def forget(self, prompt: str, system: str = None, schema: dict = None, task: str = None):
+        """Drop a cached response, e.g. one that turned out to be unparseable"""
+        if self.cache is not None:
+            self.cache.delete(self._cache_key(task or current_stage(), prompt, system, schema))
+
+    def generate_email(self, prompt: str, use_cache: bool = True, system: str = None, schema: dict = None,
+                       task: str = None, hedge: bool = False) -> str:
+        """
+        Generate content using Gemini
+        
+        use_cache=False skips the cache lookup (the fresh response is still stored).
+        system is sent as the system instruction (see utils.prompts); schema
+        switches on JSON mode constrained to that response schema. task picks
+        the model tier (default: the current metrics stage); hedge races a
+        second request against a slow first one (interactive calls only).
+        """
+        task = task or current_stage()
+        key, cached = self._cache_lookup(task, prompt, use_cache, system, schema)
+        if cached is not None:
+            return cached
+        if hedge and GEMINI_HEDGE_ENABLED:
+            text = "".join(self._hedged(lambda model: iter([self._generate(prompt, system, schema, task, model)]), task))
+        else:
+            text = self._generate(prompt, system, schema, task)
+        self._cache_store(key, task, text)
+        return text
+
+    async def agenerate_email(self, prompt: str, use_cache: bool = True, system: str = None,
+                              schema: dict = None, task: str = None) -> str:
+        """Async version of generate_email, shares the same pool, limiter, cache and router"""
+        task = task or current_stage()
+        key, cached = self._cache_lookup(task, prompt, use_cache, system, schema)
+        if cached is not None:
+            return cached
+        text = await self._agenerate(prompt, system, schema, task)
+        self._cache_store(key, task, text)
+        return text
+
+    def generate_stream(self, prompt: str, use_cache: bool = True, system: str = None, task: str = None,
+                        hedge: bool = False):
+        """
+        Yield the response text in chunks as Gemini produces it
+
+        A cache hit yields the whole cached text at once. Retries only happen
+        before the first chunk; once text has been yielded errors propagate.
+        With hedge, a second stream is started if the first is slow to
+        produce its first chunk, and whichever starts first is kept.
+        """
+        task = task or current_stage()
+        key, cached = self._cache_lookup(task, prompt, use_cache, system)
+        if cached is not None:
+            yield cached
+            return
+
+        if hedge and GEMINI_HEDGE_ENABLED:
+            chunks = self._hedged(lambda model: self._stream(prompt, system, task, model), task)
+        else:
+            chunks = self._stream(prompt, system, task)
+        parts = []
+        for text in chunks:
+            parts.append(text)
+            yield text
+        self._cache_store(key, task, "".join(parts))
+
+    def _hedged(self, start, task: str):
+        """
+        Yield the chunks of whichever of two requests produces text first
+
+        start(model) returns a chunk iterator. The task's routed model goes
+        first; if it has produced nothing after GEMINI_HEDGE_AFTER_SECONDS,
+        the next faster model (or the same one, if none) is started too.
+        The loser is abandoned: a stream stops at its next chunk, a plain
+        request finishes in the background and its answer is dropped.
+        """
+        primary = self.router.route(task)
+        models = [primary, self.router.fallback(primary) or primary]
+        events = queue.Queue()
+        state = {"winner": None, "closed": False}
+
+        def pump(index: int, model: str):
+            chunks = None
+            try:
+                chunks = start(model)
+                for text in chunks:
+                    if state["closed"] or state["winner"] not in (None, index):
+                        return
+                    events.put((index, text))
+                events.put((index, _END))
+            except Exception as e:
+                events.put((index, e))
+            finally:
+                close = getattr(chunks, "close", None)
+                if close:
+                    close()
+
+        def launch(index: int):
+            # Each thread needs its own copy of the metrics stage
+            threading.Thread(target=contextvars.copy_context().run, args=(pump, index, models[index]),
+                             daemon=True).start()
+
+        launch(0)
+        started, failed = 1, 0
+        try:
+            while True:
+                try:
+                    waiting = state["winner"] is None and started == 1
+                    index, item = events.get(timeout=GEMINI_HEDGE_AFTER_SECONDS if waiting else None)
+                except queue.Empty:
+                    print(f"[GEMINI] No answer from {models[0]} after {GEMINI_HEDGE_AFTER_SECONDS:.1f}s, hedging on {models[1]}")
+                    inc("gemini_hedged_total", stage=task, result="started")
+                    launch(1)
+                    started = 2
+                    continue
+                if state["winner"] is None:
+                    if isinstance(item, Exception):
+                        failed += 1
+                        if failed == started:
+                            raise item
+                        continue
+                    state["winner"] = index
+                    if started == 2:
+                        inc("gemini_hedged_total", stage=task, result="won" if index else "lost")
+                elif index != state["winner"]:
+                    continue
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            state["closed"] = True
+
+    def _stream(self, prompt: str, system: str, task: str, model: str = None):
+        """Chunks of one streamed answer, retrying (and re-routing) until the first chunk"""
+        estimated = self._estimate_tokens(prompt, system)
+        attempt = 0
+        while True:
+            model = model or self.router.route(task)
+            self.limiter.acquire(estimated)
+            emitted = False
+            last = None
+            started = time.perf_counter()
+            try:
+                for chunk in self.client.models.generate_content_stream(
+                    model=model,
+                    contents=prompt,
+                    config=self._request_config(model, system)
+                ):
+                    last = chunk
+                    if chunk.text and not emitted:
+                        observe("gemini_ttft_seconds", time.perf_counter() - started, stage=current_stage())
+                    if chunk.text:
+                        emitted = True
+                        yield chunk.text
+            except Exception as e:
+                if emitted:
+                    raise
+                time.sleep(self._record_failure(e, attempt, model, started))
+                attempt += 1
+                model = None
+                continue
+            self._record_success(last, estimated, model, started)
+            return
+
+    def _generate(self, prompt: str, system: str, schema: dict, task: str, model: str = None) -> str:
+        estimated = self._estimate_tokens(prompt, system)
+        attempt = 0
+        while True:
+            # A retry is routed again, so it moves off a model that just became degraded
+            model = model or self.router.route(task)
+            self.limiter.acquire(estimated)
+            started = time.perf_counter()
+            try:
+                response = self.client.models.generate_content(
+                    model=model,
+                    contents=prompt,
+                    config=self._request_config(model, system, schema)
+                )
+            except Exception as e:
+                time.sleep(self._record_failure(e, attempt, model, started))
+                attempt += 1
+                model = None
+                continue
+            self._record_success(response, estimated, model, started)
+            return response.text
+
+    async def _agenerate(self, prompt: str, system: str, schema: dict, task: str) -> str:
+        import asyncio
+
+        estimated = self._estimate_tokens(prompt, system)
+        attempt = 0
+        while True:
+            model = self.router.route(task)
+            delay = self.limiter.reserve(estimated)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.perf_counter()
+            try:
+                response = await self.client.aio.models.generate_content(
+                    model=model,
+                    contents=prompt,
+                    config=self._request_config(model, system, schema)
+                )
+            except Exception as e:
+                await asyncio.sleep(self._record_failure(e, attempt, model, started))
+                attempt += 1
+                continue
+            self._record_success(response, estimated, model, started)
+            return response.text
+
+
+_shared_client = None
+_shared_lock = threading.Lock()
+
+
+def get_client() -> GeminiClient:
+    """Return the process-wide GeminiClient, creating it on first use"""
+    global _shared_client
+
+    if _shared_client is None:
+        with _shared_lock:
+            if _shared_client is None:
+                _shared_client = GeminiClient(GOOGLE_API_KEY)
+    return _shared_client
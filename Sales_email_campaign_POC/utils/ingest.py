@@ -0,0 +1,149 @@
+"""
+Ingest - Streaming CSV loader that maps headers, dedupes and writes prospects to the session store
+"""
+
+import time
+import pandas as pd
+from utils.config import INGEST_CHUNK_SIZE, PREVIEW_ROWS
+from utils.session_store import get_session_store, make_prospect_id
+from utils.company_index import canonical_name
+
+# Accepted header names for each standard column, in priority order
+COLUMN_ALIASES = {
+    'company_name': ['company_name', 'company name', 'company', 'name'],
+    'location': ['location', 'region', 'region / location', 'city'],
+    'industry': ['industry', 'sector', 'vertical'],
+    'budget': ['budget', 'deal size', 'value'],
+    'website': ['website', 'domain', 'url', 'company website'],
+}
+
+COLUMN_DEFAULTS = {
+    'location': 'Unknown',
+    'industry': 'General',
+}
+
+
+def find_column(columns, possible_names):
+    """Find column by matching possible names (case-insensitive, handles spaces)"""
+    cols_lower = {str(col).lower().strip(): col for col in columns}
+    for name in possible_names:
+        if name.lower().strip() in cols_lower:
+            return cols_lower[name.lower().strip()]
+    return None
+
+
+def map_columns(columns) -> dict:
+    """Return {csv_column: standard_name} for every header we recognise"""
+    mapping = {}
+    for standard, aliases in COLUMN_ALIASES.items():
+        column = find_column(columns, aliases)
+        if column is not None and column not in mapping:
+            mapping[column] = standard
+    return mapping
+
+
+def normalize_company(name) -> str:
+    """Dedupe key: the company index's canonical name, so "Tesla, Inc." and "tesla" collapse"""
+    return canonical_name(name)
+
+
+def _normalize_chunk(chunk: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    chunk = chunk.rename(columns=mapping)
+    for column, default in COLUMN_DEFAULTS.items():
+        if column not in chunk.columns:
+            chunk[column] = default
+        else:
+            chunk[column] = chunk[column].fillna(default)
+    # NaN -> None so sessions serialise as valid JSON
+    return chunk.astype(object).where(pd.notna(chunk), None)
+
+
+def preview_csv(file, rows: int = PREVIEW_ROWS):
+    """
+    Read only the first rows plus a streamed row count
+
+    Returns:
+        (sample DataFrame with standard column names, mapping, total row count)
+    """
+    file.seek(0)
+    sample = pd.read_csv(file, nrows=rows)
+    mapping = map_columns(sample.columns)
+
+    file.seek(0)
+    total = sum(len(chunk) for chunk in pd.read_csv(file, usecols=[0], chunksize=INGEST_CHUNK_SIZE))
+
+    file.seek(0)
+    return _normalize_chunk(sample, mapping), mapping, total
+
+
+def ingest_csv(file, campaign_id: str, chunksize: int = INGEST_CHUNK_SIZE, on_progress=None,
+               store=None) -> dict:
+    """
+    Stream a CSV into the session store chunk by chunk
+
+    Each chunk is header-mapped, defaulted, deduped on company name and
+    written in one transaction, so memory stays bounded by chunksize
+    rather than file size. Session IDs come from the campaign and company
+    (make_prospect_id), so re-uploading a file keeps the work already done
+    on its prospects instead of resetting them.
+
+    Args:
+        file: Path or file-like object
+        campaign_id: Recorded on every session
+        chunksize: Rows per chunk / write transaction
+        on_progress: Optional callback(rows_read, loaded)
+        store: Session store (defaults to the configured one)
+
+    Returns:
+        {"rows": read, "loaded": written, "existing": already stored, "duplicates": dropped,
+         "missing_company": dropped}
+    """
+
+    store = store or get_session_store()
+    if hasattr(file, "seek"):
+        file.seek(0)
+
+    seen = set()
+    stats = {"rows": 0, "loaded": 0, "existing": 0, "duplicates": 0, "missing_company": 0}
+    mapping = None
+
+    for chunk in pd.read_csv(file, chunksize=chunksize):
+        if mapping is None:
+            mapping = map_columns(chunk.columns)
+            if 'company_name' not in mapping.values():
+                raise ValueError(f"No company name column in: {', '.join(map(str, chunk.columns))}")
+
+        now = time.time()
+        sessions = {}
+        for record in _normalize_chunk(chunk, mapping).to_dict('records'):
+            stats["rows"] += 1
+            if not record.get('company_name'):
+                stats["missing_company"] += 1
+                continue
+
+            key = normalize_company(record['company_name'])
+            if key in seen:
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+
+            sessions[make_prospect_id(campaign_id, record['company_name'])] = {
+                "status": "pending",
+                "campaign_id": campaign_id,
+                "prospect": record,
+                "created_at": now,
+                "updated_at": now
+            }
+
+        # Prospects from an earlier upload of this file keep their session
+        for prospect_id in store.versions(list(sessions)):
+            del sessions[prospect_id]
+            stats["existing"] += 1
+        stats["loaded"] += len(sessions)
+
+        store.put_many(sessions)
+        if on_progress:
+            on_progress(stats["rows"], stats["loaded"])
+
+    print(f"[INGEST] {campaign_id}: {stats}")
+    return stats
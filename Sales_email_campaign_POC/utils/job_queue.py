@@ -0,0 +1,253 @@
+"""
+Job Queue - Persistent SQLite work queue with priorities, leases and heartbeats (no broker needed)
+
+The queue is a local file, so it is shared by the app and the worker
+processes on one machine only, even when sessions are kept in DynamoDB.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from utils.config import JOB_DB_PATH, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+LOST = "lost"  # returned by fail() when the lease had already passed to another worker
+
+
+class JobQueue:
+    """
+    Jobs are claimed under a lease. A worker that dies stops heartbeating,
+    its lease expires and reap() puts the job back in the queue for another
+    worker (or fails it once its attempts are used up), so a crash mid-batch
+    only costs the unfinished job.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                group_id TEXT,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, id);
+            CREATE INDEX IF NOT EXISTS idx_jobs_lease ON jobs(status, lease_expires);
+            CREATE INDEX IF NOT EXISTS idx_jobs_group ON jobs(group_id, status);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None so claim() can take BEGIN IMMEDIATE itself
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _job(row) -> dict:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        if job["result"]:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def enqueue(self, kind: str, payload: dict, priority: int = 0, group_id: str = None,
+                max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        return self.enqueue_many([(kind, payload, priority)], group_id, max_attempts)[0]
+
+    def enqueue_many(self, jobs: list, group_id: str = None, max_attempts: int = JOB_MAX_ATTEMPTS) -> list:
+        """Insert [(kind, payload, priority)] in one transaction, returns job ids"""
+        now = time.time()
+        conn = self._conn()
+        ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for kind, payload, priority in jobs:
+                cursor = conn.execute(
+                    "INSERT INTO jobs (kind, group_id, payload, priority, status, max_attempts, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (kind, group_id, json.dumps(payload), priority, QUEUED, max_attempts, now, now)
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return ids
+
+    def reap(self) -> list:
+        """
+        Handle jobs whose worker stopped heartbeating: requeue those with attempts
+        left and mark the rest failed. Returns the failed jobs so the caller can
+        abandon them - each one is returned to exactly one caller.
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND lease_expires < ?", (RUNNING, now)
+            ).fetchall()
+            exhausted = [row for row in rows if row["attempts"] >= row["max_attempts"]]
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts < max_attempts",
+                (QUEUED, now, RUNNING, now)
+            )
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, "lease expired", now, RUNNING, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        failed = []
+        for row in exhausted:
+            job = self._job(row)
+            job.update(status=FAILED, error="lease expired", lease_owner=None, lease_expires=None)
+            failed.append(job)
+        return failed
+
+    def claim(self, worker_id: str, kinds: list = None):
+        """Take the highest-priority queued job under a lease, or None if there is nothing to do"""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            sql = "SELECT * FROM jobs WHERE status = ?"
+            params = [QUEUED]
+            if kinds:
+                sql += f" AND kind IN ({','.join('?' * len(kinds))})"
+                params += list(kinds)
+            row = conn.execute(sql + " ORDER BY priority DESC, id LIMIT 1", params).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (RUNNING, worker_id, now + self.lease_seconds, now, row["id"])
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        job = self._job(row)
+        job.update(status=RUNNING, lease_owner=worker_id, attempts=row["attempts"] + 1)
+        return job
+
+    def heartbeat(self, job_id: int, worker_id: str) -> bool:
+        """Extend the lease, returns False if the job was lost to another worker"""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+            (now + self.lease_seconds, now, job_id, RUNNING, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result: dict = None) -> bool:
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND lease_owner = ?",
+            (DONE, json.dumps(result), time.time(), job_id, RUNNING, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> str:
+        """
+        Requeue the job if it has attempts left, otherwise mark it failed; returns the
+        new status, or LOST if the lease already expired and the job is no longer ours
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = ? AND lease_owner = ?",
+                (job_id, RUNNING, worker_id)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return LOST
+            status = QUEUED if row["attempts"] < row["max_attempts"] else FAILED
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return status
+
+    def get(self, job_id: int):
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def counts(self, group_id: str = None, kind: str = None) -> dict:
+        """Job counts per status, e.g. {"queued": 3, "running": 1, "done": 10}"""
+        sql = "SELECT status, COUNT(*) FROM jobs"
+        clauses, params = [], []
+        if group_id is not None:
+            clauses.append("group_id = ?")
+            params.append(group_id)
+        if kind is not None:
+            clauses.append("kind = ?")
+            params.append(kind)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        rows = self._conn().execute(sql + " GROUP BY status", params)
+        return {status: count for status, count in rows}
+
+    def purge(self, older_than_seconds: float = 7 * 24 * 3600) -> int:
+        """Delete finished jobs older than the cutoff"""
+        cursor = self._conn().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+            (DONE, FAILED, time.time() - older_than_seconds)
+        )
+        return cursor.rowcount
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Return the process-wide job queue"""
+    global _queue
+
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue(JOB_DB_PATH)
+    return _queue
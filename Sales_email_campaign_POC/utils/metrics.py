@@ -0,0 +1,462 @@
+"""
+Metrics - Timing spans, counters and latency histograms with a Prometheus text endpoint
+
+Every process (Streamlit, each worker) records into its own registry and
+periodically writes a snapshot to METRICS_DIR. The endpoint and the
+dashboard merge those snapshots, so work done by background workers shows
+up next to the app's own numbers. Snapshots of processes that have exited
+are folded into one archive.json, so the directory holds one file per
+running process plus the archive however often processes restart.
+
+Run standalone:  python -m utils.metrics --port 9464
+"""
+
+import argparse
+import atexit
+import contextvars
+import glob
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from utils.config import (
+    METRICS_PORT, METRICS_DIR, METRICS_FLUSH_SECONDS, METRICS_STALE_SECONDS,
+    GEMINI_INPUT_COST_PER_MTOK, GEMINI_OUTPUT_COST_PER_MTOK
+)
+
+PREFIX = "campaign_"
+ARCHIVE_NAME = "archive.json"
+PRUNE_EVERY_SECONDS = 60
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+# Stage of the innermost open span, used to attribute Gemini tokens and retries
+_stage = contextvars.ContextVar("metrics_stage", default="other")
+
+
+def _label_key(labels: dict) -> str:
+    return json.dumps(sorted(labels.items()))
+
+
+class Metrics:
+    """Thread-safe counters and fixed-bucket histograms keyed by name + labels"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.version = 0
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+            self.version += 1
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    hist["buckets"][i] += 1
+                    break
+            hist["sum"] += value
+            hist["count"] += 1
+            self.version += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return json.loads(json.dumps({
+                "buckets": [b if b != float("inf") else "+Inf" for b in self.buckets],
+                "counters": self._counters,
+                "histograms": self._histograms
+            }))
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+_snapshot_path = None
+
+
+def get_metrics() -> Metrics:
+    """Return the process-wide registry, starting its snapshot flusher"""
+    global _metrics, _snapshot_path
+
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                _metrics = Metrics()
+                if METRICS_DIR:
+                    os.makedirs(METRICS_DIR, exist_ok=True)
+                    _snapshot_path = os.path.join(
+                        METRICS_DIR, f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}.json"
+                    )
+                    threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+                    atexit.register(flush)
+    return _metrics
+
+
+def flush():
+    """Write this process's snapshot so other processes can merge it"""
+    if _metrics is None or _snapshot_path is None:
+        return
+    tmp = _snapshot_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_metrics.snapshot(), f)
+    os.replace(tmp, _snapshot_path)
+
+
+def _flush_loop():
+    written = -1
+    pruned = 0.0
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            if _metrics.version != written:
+                written = _metrics.version
+                flush()
+            else:
+                # Heartbeat, so other hosts can tell an idle process from an exited one
+                os.utime(_snapshot_path)
+            if time.monotonic() - pruned >= PRUNE_EVERY_SECONDS:
+                pruned = time.monotonic()
+                prune()
+        except (OSError, ValueError) as e:
+            print(f"[METRICS] Could not write snapshot: {str(e)}")
+
+
+def _read_snapshot(path: str):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _exited(path: str, now: float) -> bool:
+    """Whether the process that wrote this snapshot ({host}-{pid}-{started}.json) has exited"""
+    host, pid, _ = os.path.basename(path)[:-len(".json")].rsplit("-", 2)
+    if host == socket.gethostname() and os.name == "posix":
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except (PermissionError, ValueError):
+            pass
+        return False
+    return now - os.path.getmtime(path) > METRICS_STALE_SECONDS
+
+
+def prune() -> int:
+    """
+    Fold the snapshots of exited processes into archive.json and delete them
+
+    Holds an exclusive lock on the directory so only one process folds at a
+    time. The archive lists the files it just absorbed, so a crash between
+    writing it and deleting them doesn't count them twice. Returns the
+    number of snapshots removed.
+    """
+    if not METRICS_DIR:
+        return 0
+    try:
+        import fcntl
+    except ImportError:
+        return 0  # no flock (Windows): snapshots are kept
+
+    with open(os.path.join(METRICS_DIR, "archive.lock"), "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0  # another process is pruning
+
+        archive_path = os.path.join(METRICS_DIR, ARCHIVE_NAME)
+        now = time.time()
+        exited = []
+        for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+            if path in (archive_path, _snapshot_path):
+                continue
+            try:
+                if _exited(path, now):
+                    exited.append(path)
+            except (OSError, ValueError):
+                continue
+        if not exited:
+            return 0
+
+        archive = _read_snapshot(archive_path)
+        already = set(archive.get("folded", [])) if archive else set()
+        snapshots = [archive] if archive else []
+        for path in exited:
+            if os.path.basename(path) not in already:
+                snapshot = _read_snapshot(path)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+        merged = _merge(snapshots)
+        merged["folded"] = [os.path.basename(path) for path in exited]
+
+        tmp = archive_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(merged, f)
+        os.replace(tmp, archive_path)
+        for path in exited:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    return len(exited)
+
+
+def inc(name: str, amount: float = 1, **labels):
+    get_metrics().inc(name, amount, **labels)
+
+
+def observe(name: str, value: float, **labels):
+    get_metrics().observe(name, value, **labels)
+
+
+def current_stage() -> str:
+    return _stage.get()
+
+
+@contextmanager
+def span(stage: str, **labels):
+    """
+    Time a pipeline stage into stage_latency_seconds{stage=...}
+
+    Gemini calls made inside the span are attributed to this stage.
+    """
+    token = _stage.set(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("stage_errors_total", stage=stage, **labels)
+        raise
+    finally:
+        _stage.reset(token)
+        observe("stage_latency_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+
+def record_usage(response):
+    """Count prompt/output tokens and their cost from Gemini usage metadata"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    stage = current_stage()
+    prompt_tokens = getattr(usage, "prompt_token_count", None) or 0
+    # Thinking tokens are billed as output
+    output_tokens = (getattr(usage, "candidates_token_count", None) or 0) + \
+                    (getattr(usage, "thoughts_token_count", None) or 0)
+    inc("gemini_prompt_tokens_total", prompt_tokens, stage=stage)
+    inc("gemini_output_tokens_total", output_tokens, stage=stage)
+    cost = (prompt_tokens * GEMINI_INPUT_COST_PER_MTOK + output_tokens * GEMINI_OUTPUT_COST_PER_MTOK) / 1e6
+    inc("gemini_cost_usd_total", cost, stage=stage)
+
+
+# Reading: merge snapshots from every process
+
+def _merge(snapshots: list) -> dict:
+    buckets = get_metrics().snapshot()["buckets"]
+    merged = {"buckets": buckets, "counters": {}, "histograms": {}}
+    for snap in snapshots:
+        if snap.get("buckets") != buckets:
+            # Written by a build with different buckets, can't be added up
+            continue
+        for name, series in snap["counters"].items():
+            target = merged["counters"].setdefault(name, {})
+            for key, value in series.items():
+                target[key] = target.get(key, 0) + value
+        for name, series in snap["histograms"].items():
+            target = merged["histograms"].setdefault(name, {})
+            for key, hist in series.items():
+                if key not in target:
+                    target[key] = {"buckets": list(hist["buckets"]), "sum": hist["sum"], "count": hist["count"]}
+                    continue
+                total = target[key]
+                total["buckets"] = [a + b for a, b in zip(total["buckets"], hist["buckets"])]
+                total["sum"] += hist["sum"]
+                total["count"] += hist["count"]
+    return merged
+
+
+def collect() -> dict:
+    """This process's live registry merged with every other process's last snapshot"""
+    snapshots = [get_metrics().snapshot()]
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")) if METRICS_DIR else []:
+        if path == _snapshot_path:
+            continue
+        snapshot = _read_snapshot(path)
+        if snapshot is not None:
+            snapshots.append(snapshot)
+    return _merge(snapshots)
+
+
+def quantile(hist: dict, q: float, buckets: list) -> float:
+    """Estimate a quantile from bucket counts (linear within a bucket, like histogram_quantile)"""
+    if not hist["count"]:
+        return 0.0
+    rank = q * hist["count"]
+    seen = 0
+    lower = 0.0
+    for bound, count in zip(buckets, hist["buckets"]):
+        if count and seen + count >= rank:
+            if bound == "+Inf":
+                return lower
+            return lower + (bound - lower) * (rank - seen) / count
+        seen += count
+        lower = bound if bound != "+Inf" else lower
+    return lower
+
+
+def _labels(key: str) -> dict:
+    return dict(json.loads(key))
+
+
+def summary(snapshot: dict = None) -> dict:
+    """Per-stage p50/p95 plus token, cost and cache totals for the dashboard"""
+    snapshot = snapshot or collect()
+    buckets = snapshot["buckets"]
+    counters = snapshot["counters"]
+
+    def total(name, **match):
+        return sum(
+            value for key, value in counters.get(name, {}).items()
+            if all(_labels(key).get(k) == v for k, v in match.items())
+        )
+
+    stages = {}
+    for key, hist in snapshot["histograms"].get("stage_latency_seconds", {}).items():
+        stage = _labels(key)["stage"]
+        merged = stages.setdefault(stage, {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0})
+        merged["buckets"] = [a + b for a, b in zip(merged["buckets"], hist["buckets"])]
+        merged["sum"] += hist["sum"]
+        merged["count"] += hist["count"]
+
+    rows = [
+        {
+            "stage": stage,
+            "count": hist["count"],
+            "p50_ms": round(quantile(hist, 0.5, buckets) * 1000, 1),
+            "p95_ms": round(quantile(hist, 0.95, buckets) * 1000, 1),
+            "mean_ms": round(hist["sum"] / hist["count"] * 1000, 1) if hist["count"] else 0.0,
+            "errors": int(total("stage_errors_total", stage=stage))
+        }
+        for stage, hist in sorted(stages.items())
+    ]
+
+    prospects = total("prospects_drafted_total")
+    cost = total("gemini_cost_usd_total")
+    hits = total("gemini_cache_total", result="hit")
+    misses = total("gemini_cache_total", result="miss")
+    reused = total("company_research_total", result="reused")
+    researched = total("company_research_total", result="researched")
+    return {
+        "stages": rows,
+        "prompt_tokens": int(total("gemini_prompt_tokens_total")),
+        "output_tokens": int(total("gemini_output_tokens_total")),
+        "retries": int(total("gemini_retries_total")),
+        "cache_hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        "company_reuse_rate": reused / (reused + researched) if reused + researched else 0.0,
+        "prospects": int(prospects),
+        "cost_usd": cost,
+        "cost_per_1k_prospects": cost / prospects * 1000 if prospects else 0.0
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def render_prometheus(snapshot: dict = None) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    snapshot = snapshot or collect()
+    lines = []
+    for name, series in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for key, value in series.items():
+            lines.append(f"{PREFIX}{name}{_format_labels(_labels(key))} {value}")
+    for name, series in sorted(snapshot["histograms"].items()):
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for key, hist in series.items():
+            labels = _labels(key)
+            cumulative = 0
+            for bound, count in zip(snapshot["buckets"], hist["buckets"]):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {hist['sum']}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def _make_server(host: str, port: int):
+    # http.server is only imported by the process that actually serves /metrics
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return ThreadingHTTPServer((host, port), MetricsHandler)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1"):
+    """Serve /metrics on a daemon thread once per process; returns the server or None"""
+    global _server
+
+    if not port:
+        return None
+    if _server is None:
+        with _server_lock:
+            if _server is None:
+                try:
+                    _server = _make_server(host, port)
+                except OSError as e:
+                    # e.g. a second dashboard on the same machine - the first one already exports
+                    print(f"[METRICS] Endpoint not started on port {port}: {str(e)}")
+                    return None
+                _server.daemon_threads = True
+                threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+                print(f"[METRICS] Serving http://{host}:{port}/metrics")
+    return _server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve merged campaign metrics in Prometheus format")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=METRICS_PORT or 9464)
+    args = parser.parse_args()
+
+    server = start_metrics_server(args.port, args.host)
+    try:
+        while server is not None:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
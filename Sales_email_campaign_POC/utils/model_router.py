@@ -0,0 +1,152 @@
+"""
+Model Router - Picks the Gemini model for each task and fails over when it degrades
+
+Every task (the metrics stage a Gemini call is made in) declares a tier in
+TASK_TIERS, and each tier maps to a model. When a model's recent p95 latency
+or error rate crosses its threshold, calls fall back to the next faster
+tier until the model recovers; a small share of calls keeps probing it so
+recovery is noticed.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from utils.config import (
+    GEMINI_MODEL, GEMINI_MODEL_FAST, GEMINI_MODEL_PRO, MODEL_TIERS,
+    ROUTER_WINDOW_SECONDS, ROUTER_MIN_SAMPLES, ROUTER_P95_THRESHOLD_SECONDS,
+    ROUTER_ERROR_RATE_THRESHOLD, ROUTER_PROBE_FRACTION
+)
+from utils.metrics import inc
+
+# Slowest/most capable first; a degraded tier falls back to the next one
+TIERS = ("pro", "standard", "fast")
+
+# Every task runs on the standard model by default; the fast tier is the failover
+# (or opt in per task, e.g. MODEL_TIERS=content=fast to trade email quality for cost)
+TASK_TIERS = {
+    "research": "standard",
+    "research_batch": "standard",
+    "content": "standard",
+    "content_multi": "standard",
+    "content_fix": "standard",
+}
+DEFAULT_TIER = "standard"
+
+
+def parse_tiers(spec: str) -> dict:
+    """"content=standard,research=pro" -> {"content": "standard", "research": "pro"}"""
+    tiers = {}
+    for part in spec.split(","):
+        task, _, tier = part.partition("=")
+        if task.strip() and tier.strip():
+            if tier.strip() not in TIERS:
+                raise ValueError(f"Unknown model tier '{tier.strip()}' for {task.strip()}, expected one of {TIERS}")
+            tiers[task.strip()] = tier.strip()
+    return tiers
+
+
+class ModelHealth:
+    """Latency and outcome of a model's calls over the last window_seconds"""
+
+    def __init__(self, window_seconds: float, max_samples: int = 2000):
+        self.window_seconds = window_seconds
+        self._samples = deque(maxlen=max_samples)
+
+    def record(self, seconds: float, ok: bool):
+        self._samples.append((time.monotonic(), seconds, ok))
+
+    def snapshot(self) -> dict:
+        cutoff = time.monotonic() - self.window_seconds
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+        latencies = sorted(seconds for _, seconds, ok in self._samples if ok)
+        errors = sum(1 for _, _, ok in self._samples if not ok)
+        return {
+            "samples": len(self._samples),
+            "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+            "error_rate": errors / len(self._samples) if self._samples else 0.0,
+        }
+
+
+class ModelRouter:
+    def __init__(self, models: dict, task_tiers: dict, window_seconds: float = ROUTER_WINDOW_SECONDS,
+                 min_samples: int = ROUTER_MIN_SAMPLES, p95_threshold: float = ROUTER_P95_THRESHOLD_SECONDS,
+                 error_rate_threshold: float = ROUTER_ERROR_RATE_THRESHOLD,
+                 probe_fraction: float = ROUTER_PROBE_FRACTION):
+        self.models = models
+        self.task_tiers = task_tiers
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.p95_threshold = p95_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.probe_fraction = probe_fraction
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def primary(self, task: str) -> str:
+        """The model a task is configured for (used for cache keys and stage fingerprints)"""
+        return self.models[self.task_tiers.get(task, DEFAULT_TIER)]
+
+    def fallback(self, model: str):
+        """The next faster tier's model, or None if model is already the fastest"""
+        tiers = [tier for tier in TIERS if tier in self.models]
+        for tier in tiers[tiers.index(self._tier(model)) + 1:]:
+            if self.models[tier] != model:
+                return self.models[tier]
+        return None
+
+    def _tier(self, model: str) -> str:
+        return next((tier for tier in reversed(TIERS) if self.models.get(tier) == model), DEFAULT_TIER)
+
+    def record(self, model: str, seconds: float, ok: bool):
+        with self._lock:
+            if model not in self._health:
+                self._health[model] = ModelHealth(self.window_seconds)
+            self._health[model].record(seconds, ok)
+
+    def health(self, model: str) -> dict:
+        with self._lock:
+            health = self._health.get(model)
+            return health.snapshot() if health else {"samples": 0, "p95": 0.0, "error_rate": 0.0}
+
+    def degraded(self, model: str) -> bool:
+        health = self.health(model)
+        if health["samples"] < self.min_samples:
+            return False
+        return health["p95"] > self.p95_threshold or health["error_rate"] > self.error_rate_threshold
+
+    def route(self, task: str) -> str:
+        """Model to call for this task now: its primary unless that is degraded"""
+        primary = model = self.primary(task)
+        while self.degraded(model) and random.random() >= self.probe_fraction:
+            fallback = self.fallback(model)
+            if fallback is None:
+                break
+            model = fallback
+        if model != primary:
+            inc("model_failover_total", task=task, primary=primary, model=model)
+        return model
+
+    def status(self) -> dict:
+        """{model: health plus degraded flag} for every model in use"""
+        return {
+            model: {**self.health(model), "degraded": self.degraded(model)}
+            for model in dict.fromkeys(self.models.values())
+        }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> ModelRouter:
+    """Return the process-wide model router"""
+    global _router
+
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                models = {"pro": GEMINI_MODEL_PRO, "standard": GEMINI_MODEL, "fast": GEMINI_MODEL_FAST}
+                _router = ModelRouter(models, {**TASK_TIERS, **parse_tiers(MODEL_TIERS)})
+    return _router
@@ -0,0 +1,195 @@
+"""
+Prompts - Registry of compiled prompt templates
+
+Each template splits into a static system instruction (role, instructions,
+output rules), sent as Gemini's system_instruction and identical on every
+call, and a short per-prospect part with just the variables. The static
+prefix is what Gemini's context cache (explicit, or implicit on 2.5 models)
+can reuse, and it is no longer repeated inside every user prompt.
+
+Report token counts:  python -m utils.prompts [--exact]
+"""
+
+import argparse
+import hashlib
+from string import Formatter
+
+_templates = {}
+
+
+class PromptTemplate:
+    """A system instruction plus a user template compiled once into literal/field parts"""
+
+    def __init__(self, name: str, system: str, template: str):
+        self.name = name
+        self.system = system.strip()
+        self.template = template
+        # Parse once; render() only joins literals and values
+        self._parts = [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+        self.fields = tuple(dict.fromkeys(field for _, field in self._parts if field))
+        self.fingerprint = hashlib.sha256(f"{name}\0{self.system}\0{template}".encode("utf-8")).hexdigest()[:16]
+
+    def render(self, **values) -> str:
+        missing = [field for field in self.fields if field not in values]
+        if missing:
+            raise KeyError(f"Template {self.name} is missing: {', '.join(missing)}")
+        return "".join(literal + (str(values[field]) if field else "") for literal, field in self._parts)
+
+    def static_text(self) -> str:
+        """Everything that doesn't change between calls"""
+        return self.system + "".join(literal for literal, _ in self._parts)
+
+
+def register(name: str, system: str, template: str) -> PromptTemplate:
+    template = PromptTemplate(name, system, template)
+    _templates[name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    return _templates[name]
+
+
+def all_templates() -> dict:
+    return dict(_templates)
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token, same rule the rate limiter budgets with
+    return max(1, len(text) // 4)
+
+
+# Research
+
+_RESEARCH_INSTRUCTIONS = """Find and provide:
+1. DECISION MAKERS (3-5 key contacts): full name, exact job title (CEO, CTO, VP Sales, etc.), email address (use common patterns: firstname.lastname@company.com), phone number if available
+2. COMPANY INFORMATION: brief description (what they do), company website
+3. RECENT NEWS (2-3 items from last 6 months): funding, product launches, partnerships
+
+If any information is not found, use "Not Available" instead of leaving it empty."""
+
+# Output shape is enforced by the response schemas in utils.schemas (JSON mode),
+# so no example JSON is spelled out here
+
+RESEARCH = register(
+    "research",
+    system=f"""You are a B2B research assistant. Research the company you are given and find real, actionable contact information.
+
+{_RESEARCH_INSTRUCTIONS}""",
+    template="Company: {company_name}\nIndustry: {industry}\nLocation: {location}"
+)
+
+RESEARCH_BATCH = register(
+    "research_batch",
+    system=f"""You are a B2B research assistant. Research each company you are given and find real, actionable contact information.
+
+For EACH company:
+{_RESEARCH_INSTRUCTIONS}
+
+Return exactly one object per company, using the company_name exactly as listed.""",
+    template="Companies:\n{company_lines}"
+)
+
+
+# Content
+
+_EMAIL_REQUIREMENTS = """Requirements:
+- 100-150 words
+- Professional tone
+- Reference their recent activity
+- Clear call-to-action
+- Subject line (3 words max, lowercase)"""
+
+EMAIL = register(
+    "email",
+    system=f"""You write B2B sales emails.
+
+{_EMAIL_REQUIREMENTS}
+
+Format:
+Subject: [subject]
+Body: [email body]""",
+    template="Company: {company_name}\nIndustry: {industry}\nContact: {contact_name}, {contact_title}\nRecent: {news_item}"
+)
+
+# One call drafts an email for every contact, each with A/B subject lines
+# (output shape: EMAIL_BATCH_RESPONSE_SCHEMA in utils.schemas)
+EMAIL_MULTI = register(
+    "email_multi",
+    system=f"""You write B2B sales emails.
+
+Write one email for EACH contact you are given, angled to that person's role.
+
+{_EMAIL_REQUIREMENTS}
+
+Give each email the requested number of distinct subject lines to A/B test, and use the contact_name exactly as listed.""",
+    template="Company: {company_name}\nIndustry: {industry}\nRecent: {news_item}\n"
+             "Subject lines per email: {variant_count}\nContacts:\n{contact_lines}"
+)
+
+# Drafts that failed validation (utils/validators.py) and couldn't be repaired locally
+# are rewritten together (output shape: EMAIL_FIX_RESPONSE_SCHEMA in utils.schemas)
+EMAIL_FIX = register(
+    "email_fix",
+    system=f"""You revise B2B sales emails that failed review.
+
+{_EMAIL_REQUIREMENTS}
+
+For EACH email you are given, fix every listed problem and keep the rest (facts, angle, call-to-action) as close to the original as you can. Write the finished text: no placeholders such as [Name]. Return exactly one object per email, using its id exactly as listed.""",
+    template="Emails to fix:\n{email_blocks}"
+)
+
+
+# Token report
+
+SAMPLE_VALUES = {
+    "company_name": "Mayo Clinic", "industry": "Healthcare", "location": "Rochester MN",
+    "company_lines": "\n".join(
+        f"{n}. Company: Example Company {n} | Industry: Healthcare | Location: Rochester MN" for n in range(1, 6)
+    ),
+    "contact_name": "Jane Smith", "contact_title": "Chief Operating Officer",
+    "news_item": "Mayo Clinic announced a new AI partnership to speed up diagnostics",
+    "variant_count": 2,
+    "contact_lines": "1. Jane Smith, Chief Operating Officer\n2. Raj Patel, CTO\n3. Ana Lopez, VP Sales",
+    "email_blocks": "### e1\nCompany: Mayo Clinic\nContact: Jane Smith, Chief Operating Officer\n"
+                    "Problems: Body has 212 words, needs 100-200\nSubject: quick idea\nBody:\n" + "word " * 212,
+}
+
+
+def token_report(count_tokens=estimate_tokens) -> list:
+    """
+    Per template: static system tokens vs. per-call variable tokens
+
+    count_tokens: text -> token count (defaults to the local estimate)
+    """
+    rows = []
+    for name, template in _templates.items():
+        system = count_tokens(template.system)
+        variable = count_tokens(template.render(**{f: SAMPLE_VALUES.get(f, "x") for f in template.fields}))
+        rows.append({
+            "template": name,
+            "system_tokens": system,
+            "variable_tokens": variable,
+            "total_tokens": system + variable,
+            "fingerprint": template.fingerprint
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Token counts per prompt template")
+    parser.add_argument("--exact", action="store_true", help="Count with the Gemini count_tokens API")
+    args = parser.parse_args()
+
+    if args.exact:
+        from utils.gemini_client import get_client
+        client = get_client()
+
+        def counter(text):
+            return client.client.models.count_tokens(model=client.model, contents=text).total_tokens
+    else:
+        counter = estimate_tokens
+
+    print(f"{'template':<16}{'system':>8}{'variable':>10}{'total':>8}")
+    for row in token_report(counter):
+        print(f"{row['template']:<16}{row['system_tokens']:>8}{row['variable_tokens']:>10}{row['total_tokens']:>8}")
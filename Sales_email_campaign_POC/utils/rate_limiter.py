@@ -0,0 +1,185 @@
+"""
+Rate Limiter - Client-side token buckets for Gemini quota (requests/min + tokens/min)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Reservation-style token bucket, callers may go into debt and wait it off"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float, rate: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float, rate: float) -> float:
+        """Take amount tokens and return how many seconds to wait before using them"""
+        self._refill(now, rate)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / rate
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """
+    Shared requests/min and tokens/min budget with AIMD-style adaptation:
+    the effective rate is cut on every throttle from the server and slowly
+    restored on success, so we settle just under the real quota.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float,
+                 min_factor: float = 0.1, decrease: float = 0.7, increase: float = 0.02):
+        self._lock = threading.Lock()
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.factor = 1.0
+        self.min_factor = min_factor
+        self.decrease = decrease
+        self.increase = increase
+        self.throttled = 0
+
+    def _now(self) -> float:
+        return time.monotonic()
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve one request and `tokens` tokens, return seconds to wait"""
+        with self._lock:
+            now = self._now()
+            wait_requests = self.requests.reserve(1, now, self.requests.rate * self.factor)
+            wait_tokens = self.tokens.reserve(tokens, now, self.tokens.rate * self.factor)
+            return max(wait_requests, wait_tokens)
+
+    def acquire(self, tokens: int):
+        """Block until a request with `tokens` tokens fits in the budget"""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    def reconcile(self, estimated: int, actual: int):
+        """Correct the token bucket once the real usage is known"""
+        if not actual:
+            return
+        with self._lock:
+            if actual > estimated:
+                self.tokens.tokens -= actual - estimated
+            else:
+                self.tokens.refund(estimated - actual)
+
+    def on_success(self):
+        with self._lock:
+            self.factor = min(1.0, self.factor + self.increase)
+
+    def on_throttle(self):
+        with self._lock:
+            self.factor = max(self.min_factor, self.factor * self.decrease)
+            self.throttled += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "rate_factor": round(self.factor, 3),
+                "effective_rpm": round(self.requests.capacity * self.factor, 2),
+                "effective_tpm": round(self.tokens.capacity * self.factor, 2),
+                "throttled": self.throttled
+            }
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    RateLimiter whose buckets and rate factor live in SQLite, so the app and
+    every worker process on the host draw on one budget instead of each
+    getting the full quota
+    
+    Each update loads the state, applies the in-memory logic and writes it
+    back inside one BEGIN IMMEDIATE transaction. Bucket times are wall-clock,
+    since monotonic clocks aren't comparable between processes.
+    """
+
+    def __init__(self, path: str, requests_per_minute: float, tokens_per_minute: float, **kwargs):
+        super().__init__(requests_per_minute, tokens_per_minute, **kwargs)
+        self.path = path
+        self._local = threading.local()
+        self._shared_lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        """)
+        now = self._now()
+        conn.executemany(
+            "INSERT OR IGNORE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+            [("requests", self.requests.capacity, now), ("tokens", self.tokens.capacity, now), ("factor", 1.0, now)]
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _now(self) -> float:
+        return time.time()
+
+    @contextmanager
+    def _shared(self):
+        """Load the shared state, let the caller update it, write it back"""
+        with self._shared_lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                state = {name: (tokens, updated) for name, tokens, updated in
+                         conn.execute("SELECT name, tokens, updated FROM rate_buckets")}
+                self.requests.tokens, self.requests.updated = state["requests"]
+                self.tokens.tokens, self.tokens.updated = state["tokens"]
+                self.factor = state["factor"][0]
+                yield
+                conn.executemany("UPDATE rate_buckets SET tokens = ?, updated = ? WHERE name = ?", [
+                    (self.requests.tokens, self.requests.updated, "requests"),
+                    (self.tokens.tokens, self.tokens.updated, "tokens"),
+                    (self.factor, state["factor"][1], "factor"),
+                ])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def reserve(self, tokens: int) -> float:
+        with self._shared():
+            return super().reserve(tokens)
+
+    def reconcile(self, estimated: int, actual: int):
+        if not actual:
+            return
+        with self._shared():
+            super().reconcile(estimated, actual)
+
+    def on_success(self):
+        with self._shared():
+            super().on_success()
+
+    def on_throttle(self):
+        with self._shared():
+            super().on_throttle()
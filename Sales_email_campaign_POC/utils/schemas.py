@@ -0,0 +1,289 @@
+"""
+Schemas - Typed research records, Gemini response schemas and a lenient JSON parser
+"""
+
+import json
+from dataclasses import dataclass, field
+
+NOT_AVAILABLE = "Not Available"
+
+
+def _text(value, default: str = NOT_AVAILABLE) -> str:
+    if value is None:
+        return default
+    value = str(value).strip()
+    return value or default
+
+
+@dataclass(slots=True)
+class Contact:
+    name: str
+    title: str = NOT_AVAILABLE
+    email: str = NOT_AVAILABLE
+    linkedin: str = NOT_AVAILABLE
+    phone: str = NOT_AVAILABLE
+
+    @classmethod
+    def from_dict(cls, data):
+        """None for entries that aren't a usable contact"""
+        if not isinstance(data, dict):
+            return None
+        name, email = _text(data.get("name"), ""), _text(data.get("email"), "")
+        if not name and not email:
+            return None
+        return cls(
+            name=name or NOT_AVAILABLE,
+            title=_text(data.get("title")),
+            email=email or NOT_AVAILABLE,
+            linkedin=_text(data.get("linkedin")),
+            phone=_text(data.get("phone"))
+        )
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "title": self.title, "email": self.email,
+                "linkedin": self.linkedin, "phone": self.phone}
+
+
+@dataclass(slots=True)
+class CompanyInfo:
+    description: str = NOT_AVAILABLE
+    website: str = NOT_AVAILABLE
+    linkedin: str = NOT_AVAILABLE
+
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            return cls()
+        return cls(
+            description=_text(data.get("description")),
+            website=_text(data.get("website")),
+            linkedin=_text(data.get("linkedin"))
+        )
+
+    def to_dict(self) -> dict:
+        return {"description": self.description, "website": self.website, "linkedin": self.linkedin}
+
+
+@dataclass(slots=True)
+class NewsItem:
+    headline: str
+    date: str = ""
+
+    @classmethod
+    def from_value(cls, data):
+        """Accepts {"headline", "date"} objects or plain strings"""
+        if isinstance(data, dict):
+            headline = _text(data.get("headline") or data.get("title") or data.get("summary"), "")
+            return cls(headline, _text(data.get("date"), "")) if headline else None
+        headline = _text(data, "")
+        return cls(headline) if headline else None
+
+    def to_text(self) -> str:
+        # Sessions and the email prompt use plain strings
+        return f"{self.headline} ({self.date})" if self.date else self.headline
+
+
+@dataclass(slots=True)
+class ResearchRecord:
+    company_name: str = ""
+    contacts: list = field(default_factory=list)
+    company_info: CompanyInfo = field(default_factory=CompanyInfo)
+    recent_news: list = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Validate and coerce one research object
+
+        Malformed contacts/news entries are dropped rather than failing the
+        whole record; only a non-object raises ValueError.
+        """
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object, got {type(data).__name__}")
+        contacts = data.get("contacts")
+        news = data.get("recent_news")
+        return cls(
+            company_name=_text(data.get("company_name"), ""),
+            contacts=[c for c in map(Contact.from_dict, contacts if isinstance(contacts, list) else []) if c],
+            company_info=CompanyInfo.from_dict(data.get("company_info")),
+            recent_news=[n for n in map(NewsItem.from_value, news if isinstance(news, list) else []) if n]
+        )
+
+
+@dataclass(slots=True)
+class EmailDraft:
+    contact_name: str
+    subjects: list
+    body: str
+
+    @classmethod
+    def from_dict(cls, data):
+        """None for entries without a body or any subject line"""
+        if not isinstance(data, dict):
+            return None
+        subjects = data.get("subjects")
+        subjects = [s for s in (_text(v, "") for v in (subjects if isinstance(subjects, list) else [])) if s]
+        body = _text(data.get("body"), "")
+        if not subjects or not body:
+            return None
+        return cls(_text(data.get("contact_name"), ""), list(dict.fromkeys(subjects)), body)
+
+
+@dataclass(slots=True)
+class EmailFix:
+    id: str
+    subject: str
+    body: str
+
+    @classmethod
+    def from_dict(cls, data):
+        """None for entries missing their id or body"""
+        if not isinstance(data, dict):
+            return None
+        fix = cls(_text(data.get("id"), ""), _text(data.get("subject"), ""), _text(data.get("body"), ""))
+        return fix if fix.id and fix.body else None
+
+
+# Gemini response schemas (OpenAPI subset) - output is constrained to these
+
+_STRING = {"type": "STRING"}
+
+CONTACT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {k: _STRING for k in ("name", "title", "email", "linkedin", "phone")},
+    "required": ["name", "title", "email"],
+    "propertyOrdering": ["name", "title", "email", "linkedin", "phone"]
+}
+
+RESEARCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "contacts": {"type": "ARRAY", "items": CONTACT_SCHEMA},
+        "company_info": {
+            "type": "OBJECT",
+            "properties": {k: _STRING for k in ("description", "website", "linkedin")},
+            "propertyOrdering": ["description", "website", "linkedin"]
+        },
+        "recent_news": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"headline": _STRING, "date": _STRING},
+                "required": ["headline"],
+                "propertyOrdering": ["headline", "date"]
+            }
+        }
+    },
+    "required": ["contacts", "company_info", "recent_news"],
+    "propertyOrdering": ["contacts", "company_info", "recent_news"]
+}
+
+RESEARCH_BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        **RESEARCH_RESPONSE_SCHEMA,
+        "properties": {"company_name": _STRING, **RESEARCH_RESPONSE_SCHEMA["properties"]},
+        "required": ["company_name", *RESEARCH_RESPONSE_SCHEMA["required"]],
+        "propertyOrdering": ["company_name", *RESEARCH_RESPONSE_SCHEMA["propertyOrdering"]]
+    }
+}
+
+
+EMAIL_BATCH_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"contact_name": _STRING, "subjects": {"type": "ARRAY", "items": _STRING}, "body": _STRING},
+        "required": ["contact_name", "subjects", "body"],
+        "propertyOrdering": ["contact_name", "subjects", "body"]
+    }
+}
+
+EMAIL_FIX_RESPONSE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": _STRING, "subject": _STRING, "body": _STRING},
+        "required": ["id", "subject", "body"],
+        "propertyOrdering": ["id", "subject", "body"]
+    }
+}
+
+
+# Parsing
+
+def strip_fences(response: str) -> str:
+    """Remove ```json fences Gemini sometimes wraps around JSON"""
+    response = response.strip()
+    if response.startswith("```json"):
+        response = response.replace("```json", "").replace("```", "").strip()
+    elif response.startswith("```"):
+        response = response.replace("```", "").strip()
+    return response
+
+
+def _close_truncated(text: str):
+    """
+    Recover the longest complete prefix of truncated JSON
+
+    Scans once, remembering every point where a value just ended, then
+    closes the open brackets at the latest such point that parses.
+    """
+    stack = []
+    cuts = []
+    in_string = escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+            cuts.append((i + 1, tuple(stack)))
+        elif ch in "}]":
+            if not stack:
+                break
+            stack.pop()
+            cuts.append((i + 1, tuple(stack)))
+            if not stack:
+                break
+        elif ch == ",":
+            cuts.append((i, tuple(stack)))
+
+    for end, still_open in reversed(cuts):
+        try:
+            return json.loads(text[:end] + "".join(reversed(still_open)))
+        except ValueError:
+            continue
+    raise ValueError("No recoverable JSON")
+
+
+def parse_json_lenient(response: str):
+    """
+    Parse model output as JSON, recovering what we can
+
+    Returns (value, recovered): recovered is False for clean JSON and True
+    when prose around it was skipped or a truncated tail was dropped.
+    Raises ValueError if nothing usable is found.
+    """
+    text = strip_fences(response)
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        raise ValueError("No JSON object or array in response")
+    text = text[min(starts):]
+    try:
+        # Complete value followed by prose
+        return json.JSONDecoder().raw_decode(text)[0], True
+    except ValueError:
+        return _close_truncated(text), True
@@ -0,0 +1,511 @@
+"""
+Session Store - Pluggable persistence for campaign sessions (SQLite default)
+"""
+
+import copy
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from utils import dynamodb
+from utils.config import SESSION_BACKEND, SESSION_DB_PATH, SESSIONS_DIR, SESSION_INDEX_SIZE
+from utils.company_index import canonical_name
+
+
+def make_prospect_id(campaign_id: str, company_name) -> str:
+    """
+    Stable session ID from the campaign and the company's canonical name
+
+    The same company in a re-uploaded or reordered file gets the same ID,
+    so its session is found again instead of colliding with another row.
+    """
+    digest = hashlib.sha256(f"{campaign_id}\0{canonical_name(company_name)}".encode("utf-8")).hexdigest()
+    return f"p_{digest[:16]}"
+
+
+def session_fields(session: dict) -> dict:
+    """Pull the indexed columns out of a session dict"""
+    enriched = session.get("enriched_data") or {}
+    prospect = session.get("prospect") or {}
+    return {
+        "status": session.get("status", "pending"),
+        "industry": enriched.get("industry") or prospect.get("industry"),
+        "campaign_id": session.get("campaign_id"),
+        "company_name": enriched.get("company_name") or prospect.get("company_name"),
+    }
+
+
+class SessionStore:
+    """Interface every session backend implements"""
+
+    def get(self, prospect_id: str):
+        raise NotImplementedError
+
+    def get_many(self, prospect_ids: list) -> dict:
+        return {pid: s for pid in prospect_ids if (s := self.get(pid)) is not None}
+
+    def put(self, prospect_id: str, session: dict):
+        raise NotImplementedError
+
+    def versions(self, prospect_ids: list) -> dict:
+        """{prospect_id: opaque version} for stored sessions, changes on every write"""
+        raise NotImplementedError
+
+    def put_many(self, sessions: dict):
+        """Write {prospect_id: session} in one go"""
+        for prospect_id, session in sessions.items():
+            self.put(prospect_id, session)
+
+    def query(self, status: str = None, industry: str = None, campaign_id: str = None,
+              limit: int = None, offset: int = 0) -> list:
+        """Return [(prospect_id, session)] matching every given filter"""
+        raise NotImplementedError
+
+    def count(self, status: str = None, industry: str = None, campaign_id: str = None) -> int:
+        return len(self.query(status, industry, campaign_id))
+
+    def distinct(self, column: str, campaign_id: str = None) -> list:
+        """Sorted distinct values of an indexed column ("status", "industry", "campaign_id")"""
+        values = {session_fields(s)[column] for _, s in self.query(campaign_id=campaign_id)}
+        return sorted(v for v in values if v is not None)
+
+    def delete(self, prospect_id: str):
+        raise NotImplementedError
+
+
+class JSONFileSessionStore(SessionStore):
+    """Original layout: one pretty-printed JSON file per prospect, queries scan the directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, prospect_id: str) -> str:
+        return os.path.join(self.directory, f"{prospect_id}.json")
+
+    def get(self, prospect_id: str):
+        try:
+            with open(self._path(prospect_id), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, prospect_id: str, session: dict):
+        with open(self._path(prospect_id), 'w') as f:
+            json.dump(session, f, indent=2)
+
+    def versions(self, prospect_ids: list) -> dict:
+        results = {}
+        for prospect_id in prospect_ids:
+            try:
+                results[prospect_id] = os.stat(self._path(prospect_id)).st_mtime_ns
+            except OSError:
+                continue
+        return results
+
+    def query(self, status=None, industry=None, campaign_id=None, limit=None, offset=0) -> list:
+        wanted = {"status": status, "industry": industry, "campaign_id": campaign_id}
+        results = []
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            prospect_id = os.path.splitext(os.path.basename(path))[0]
+            session = self.get(prospect_id)
+            if session is None:
+                continue
+            fields = session_fields(session)
+            if all(v is None or fields[k] == v for k, v in wanted.items()):
+                results.append((prospect_id, session))
+        results.sort(key=lambda item: (session_fields(item[1])["company_name"] or "", item[0]))
+        end = None if limit is None else offset + limit
+        return results[offset:end]
+
+    def delete(self, prospect_id: str):
+        try:
+            os.remove(self._path(prospect_id))
+        except OSError:
+            pass
+
+
+class SQLiteSessionStore(SessionStore):
+    """WAL-mode SQLite with indexes on status / industry / campaign"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                prospect_id TEXT PRIMARY KEY,
+                status TEXT,
+                industry TEXT,
+                campaign_id TEXT,
+                company_name TEXT,
+                updated_at REAL NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_status_industry ON sessions(status, industry);
+            CREATE INDEX IF NOT EXISTS idx_sessions_industry ON sessions(industry);
+            CREATE INDEX IF NOT EXISTS idx_sessions_campaign_status ON sessions(campaign_id, status);
+            CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at);
+            CREATE INDEX IF NOT EXISTS idx_sessions_campaign_company ON sessions(campaign_id, company_name, prospect_id);
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers run alongside the writer
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(prospect_id: str, session: dict, now: float) -> tuple:
+        fields = session_fields(session)
+        return (
+            prospect_id, fields["status"], fields["industry"], fields["campaign_id"],
+            fields["company_name"], now, json.dumps(session)
+        )
+
+    def get(self, prospect_id: str):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE prospect_id = ?", (prospect_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, prospect_ids: list) -> dict:
+        results = {}
+        ids = list(prospect_ids)
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for prospect_id, data in self._conn().execute(
+                f"SELECT prospect_id, data FROM sessions WHERE prospect_id IN ({placeholders})", chunk
+            ):
+                results[prospect_id] = json.loads(data)
+        return results
+
+    def put(self, prospect_id: str, session: dict):
+        self.put_many({prospect_id: session})
+
+    def versions(self, prospect_ids: list) -> dict:
+        results = {}
+        ids = list(prospect_ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            results.update(self._conn().execute(
+                f"SELECT prospect_id, updated_at FROM sessions WHERE prospect_id IN ({placeholders})", chunk
+            ))
+        return results
+
+    def put_many(self, sessions: dict):
+        if not sessions:
+            return
+        now = time.time()
+        rows = [self._row(pid, s, now) for pid, s in sessions.items()]
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO sessions "
+                "(prospect_id, status, industry, campaign_id, company_name, updated_at, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    @staticmethod
+    def _where(status, industry, campaign_id):
+        clauses, params = [], []
+        for column, value in (("status", status), ("industry", industry), ("campaign_id", campaign_id)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def query(self, status=None, industry=None, campaign_id=None, limit=None, offset=0) -> list:
+        where, params = self._where(status, industry, campaign_id)
+        sql = f"SELECT prospect_id, data FROM sessions{where} ORDER BY company_name, prospect_id"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return [(pid, json.loads(data)) for pid, data in self._conn().execute(sql, params)]
+
+    def count(self, status=None, industry=None, campaign_id=None) -> int:
+        where, params = self._where(status, industry, campaign_id)
+        return self._conn().execute(f"SELECT COUNT(*) FROM sessions{where}", params).fetchone()[0]
+
+    def distinct(self, column: str, campaign_id: str = None) -> list:
+        if column not in ("status", "industry", "campaign_id"):
+            raise ValueError(f"Not an indexed column: {column}")
+        where, params = self._where(None, None, campaign_id)
+        rows = self._conn().execute(
+            f"SELECT DISTINCT {column} FROM sessions{where} ORDER BY {column}", params
+        )
+        return [value for (value,) in rows if value is not None]
+
+    def delete(self, prospect_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE prospect_id = ?", (prospect_id,))
+
+
+class DynamoDBSessionStore(SessionStore):
+    """
+    One item per session, with GSIs on campaign, status and campaign+status
+
+    Index keys sort by company name like the SQLite backend. GSI reads are
+    eventually consistent, so a session written a moment ago can be missing
+    from a list query; get, get_many and versions use strongly consistent
+    reads of the table, so they always see it.
+    """
+
+    INDEXES = (
+        ("campaign-index", "campaign_id", "sort_key"),
+        ("status-index", "status", "sort_key"),
+        ("campaign-status-index", "campaign_status", "sort_key"),
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.created = dynamodb.ensure_table(
+            name, "prospect_id",
+            {"prospect_id": "S", "campaign_id": "S", "status": "S", "campaign_status": "S", "sort_key": "S"},
+            self.INDEXES
+        )
+
+    @staticmethod
+    def _item(prospect_id: str, session: dict, now: float) -> dict:
+        fields = session_fields(session)
+        return dynamodb.to_item(
+            prospect_id=prospect_id,
+            status=fields["status"],
+            industry=fields["industry"],
+            campaign_id=fields["campaign_id"],
+            company_name=fields["company_name"],
+            campaign_status=f"{fields['campaign_id']}#{fields['status']}" if fields["campaign_id"] else None,
+            sort_key=f"{fields['company_name'] or ''}#{prospect_id}",
+            updated_at=now,
+            data=json.dumps(session)
+        )
+
+    @staticmethod
+    def _key(prospect_id: str) -> dict:
+        return {"prospect_id": {"S": prospect_id}}
+
+    def get(self, prospect_id: str):
+        item = dynamodb.get_dynamodb().get_item(
+            TableName=self.name, Key=self._key(prospect_id), ConsistentRead=True
+        ).get("Item")
+        return json.loads(item["data"]["S"]) if item else None
+
+    def get_many(self, prospect_ids: list) -> dict:
+        items = dynamodb.batch_get(
+            self.name, [self._key(pid) for pid in dict.fromkeys(prospect_ids)],
+            projection="prospect_id, #d", names={"#d": "data"}, consistent=True
+        )
+        return {item["prospect_id"]["S"]: json.loads(item["data"]["S"]) for item in items}
+
+    def versions(self, prospect_ids: list) -> dict:
+        items = dynamodb.batch_get(
+            self.name, [self._key(pid) for pid in dict.fromkeys(prospect_ids)], projection="prospect_id, updated_at",
+            consistent=True
+        )
+        return {item["prospect_id"]["S"]: item["updated_at"]["N"] for item in items}
+
+    def put(self, prospect_id: str, session: dict):
+        dynamodb.get_dynamodb().put_item(TableName=self.name, Item=self._item(prospect_id, session, time.time()))
+
+    def put_many(self, sessions: dict):
+        if not sessions:
+            return
+        now = time.time()
+        dynamodb.batch_write(self.name, puts=[self._item(pid, s, now) for pid, s in sessions.items()])
+
+    def _request(self, status, industry, campaign_id, **extra) -> tuple:
+        """(operation, kwargs) for the narrowest index covering the filters"""
+        names, values, conditions = {}, {}, []
+        request = {"TableName": self.name, **extra}
+        if campaign_id is not None and status is not None:
+            request["IndexName"] = "campaign-status-index"
+            conditions.append("campaign_status = :k")
+            values[":k"] = {"S": f"{campaign_id}#{status}"}
+        elif campaign_id is not None:
+            request["IndexName"] = "campaign-index"
+            conditions.append("campaign_id = :k")
+            values[":k"] = {"S": campaign_id}
+        elif status is not None:
+            request["IndexName"] = "status-index"
+            conditions.append("#s = :k")
+            names["#s"] = "status"
+            values[":k"] = {"S": status}
+        if conditions:
+            request["KeyConditionExpression"] = conditions[0]
+        if industry is not None:
+            request["FilterExpression"] = "industry = :i"
+            values[":i"] = {"S": industry}
+        if "#d" in extra.get("ProjectionExpression", ""):
+            names["#d"] = "data"
+        if names:
+            request["ExpressionAttributeNames"] = names
+        if values:
+            request["ExpressionAttributeValues"] = values
+        return ("query" if conditions else "scan"), request
+
+    def query(self, status=None, industry=None, campaign_id=None, limit=None, offset=0) -> list:
+        operation, request = self._request(status, industry, campaign_id, ProjectionExpression="prospect_id, #d, sort_key")
+        items = dynamodb.iter_items(operation, **request)
+        if operation == "scan":
+            # No index to keep the order: sort the whole scan
+            items = iter(sorted(items, key=lambda item: item["sort_key"]["S"]))
+        # DynamoDB has no OFFSET: pages are read through and skipped
+        results = []
+        for n, item in enumerate(items):
+            if n < offset:
+                continue
+            if limit is not None and len(results) >= limit:
+                break
+            results.append((item["prospect_id"]["S"], json.loads(item["data"]["S"])))
+        return results
+
+    def count(self, status=None, industry=None, campaign_id=None) -> int:
+        operation, request = self._request(status, industry, campaign_id, Select="COUNT")
+        return sum(page["Count"] for page in dynamodb.paginate(operation, **request))
+
+    def distinct(self, column: str, campaign_id: str = None) -> list:
+        if column not in ("status", "industry", "campaign_id"):
+            raise ValueError(f"Not an indexed column: {column}")
+        operation, request = self._request(None, None, campaign_id, ProjectionExpression="#c")
+        request.setdefault("ExpressionAttributeNames", {})["#c"] = column
+        values = {item[column]["S"] for item in dynamodb.iter_items(operation, **request) if column in item}
+        return sorted(values)
+
+    def delete(self, prospect_id: str):
+        dynamodb.get_dynamodb().delete_item(TableName=self.name, Key=self._key(prospect_id))
+
+
+def import_json_sessions(store: SessionStore, directory: str) -> int:
+    """Copy legacy sessions/*.json files into store, returns how many were imported"""
+    if not os.path.isdir(directory):
+        return 0
+    legacy = JSONFileSessionStore(directory)
+    sessions = dict(legacy.query())
+    store.put_many(sessions)
+    return len(sessions)
+
+
+class SessionIndex:
+    """
+    In-memory prospect_id -> session map in front of a store, filled lazily
+
+    A lookup costs one primary-key probe of the session's version; the
+    session itself is only re-read when another process (e.g. a worker) has
+    written it since it was cached. Callers get copies, so a session mutated
+    but never saved doesn't leak into the index.
+    """
+
+    def __init__(self, store: SessionStore, max_entries: int = SESSION_INDEX_SIZE):
+        self.store = store
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, sessions: dict, versions: dict):
+        with self._lock:
+            for prospect_id, session in sessions.items():
+                if prospect_id in versions:
+                    self._entries[prospect_id] = (versions[prospect_id], session)
+                    self._entries.move_to_end(prospect_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_many(self, prospect_ids: list) -> dict:
+        versions = self.store.versions(prospect_ids)
+        results, missing = {}, []
+        with self._lock:
+            for prospect_id in prospect_ids:
+                entry = self._entries.get(prospect_id)
+                if prospect_id not in versions:
+                    self._entries.pop(prospect_id, None)
+                elif entry is not None and entry[0] == versions[prospect_id]:
+                    self._entries.move_to_end(prospect_id)
+                    results[prospect_id] = copy.deepcopy(entry[1])
+                else:
+                    missing.append(prospect_id)
+
+        if missing:
+            loaded = self.store.get_many(missing)
+            self._remember(loaded, versions)
+            results.update(copy.deepcopy(loaded))
+        return results
+
+    def get(self, prospect_id: str):
+        return self.get_many([prospect_id]).get(prospect_id)
+
+    def put_many(self, sessions: dict):
+        if not sessions:
+            return
+        self.store.put_many(sessions)
+        # Re-read on next access: the version the store gave this write is only
+        # known by asking, and another process may have written after us
+        with self._lock:
+            for prospect_id in sessions:
+                self._entries.pop(prospect_id, None)
+
+    def put(self, prospect_id: str, session: dict):
+        self.put_many({prospect_id: session})
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store for SESSION_BACKEND"""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if SESSION_BACKEND == "json":
+                    _store = JSONFileSessionStore(SESSIONS_DIR)
+                elif SESSION_BACKEND == "sqlite":
+                    is_new = not os.path.exists(SESSION_DB_PATH)
+                    _store = SQLiteSessionStore(SESSION_DB_PATH)
+                    if is_new:
+                        imported = import_json_sessions(_store, SESSIONS_DIR)
+                        if imported:
+                            print(f"[SESSIONS] Imported {imported} legacy JSON sessions into {SESSION_DB_PATH}")
+                elif SESSION_BACKEND == "dynamodb":
+                    _store = DynamoDBSessionStore(dynamodb.table_name("sessions"))
+                    if _store.created:
+                        imported = import_json_sessions(_store, SESSIONS_DIR)
+                        if imported:
+                            print(f"[SESSIONS] Imported {imported} legacy JSON sessions into DynamoDB")
+                else:
+                    raise ValueError(f"Unknown SESSION_BACKEND: {SESSION_BACKEND}")
+    return _store
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_session_index() -> SessionIndex:
+    """Return the process-wide in-memory index over the session store"""
+    global _index
+
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SessionIndex(get_session_store())
+    return _index
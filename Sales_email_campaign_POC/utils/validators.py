@@ -0,0 +1,266 @@
+"""
+Validators - Local checks and repairs for drafted emails before they reach approval
+
+Every draft is checked for word count, subject format, leftover template
+placeholders, a usable recipient and a body that repeats another draft in
+the same campaign. Problems with a mechanical fix (a "Body:" prefix, a
+capitalised subject, a "[Your Name]" sign-off, the wrong name in the
+greeting) are repaired here without an API call. Only drafts that still
+fail are marked "regenerate"; the orchestrator sends those together for a
+targeted rewrite. Recipient problems are marked "review", since a new
+email wouldn't fix them.
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from dataclasses import dataclass
+from utils.company_index import normalize_domain
+from utils.config import EMAIL_MIN_WORDS, EMAIL_MAX_WORDS, EMAIL_SUBJECT_MAX_WORDS, VALIDATION_DB_PATH
+
+# What to do about an issue
+REPAIRED = "repaired"
+REGENERATE = "regenerate"
+REVIEW = "review"
+
+PLACEHOLDER = re.compile(r"\[[^\]\n]{1,40}\]|\{\{?\s*[A-Za-z_ ]{1,40}\s*\}?\}|<[A-Za-z_ ]{2,30}>")
+GREETING = re.compile(r"^(hi|hello|dear|hey)\s+([^,\n]{1,60}),", re.IGNORECASE)
+ADDRESS = re.compile(r"^[\w.%+'-]+@[A-Za-z0-9-]+(\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,}$")
+
+# Placeholder -> what it stands for; sender placeholders are dropped with their line
+_PROSPECT_FIELDS = {
+    "company": "company", "companyname": "company", "theircompany": "company", "prospectcompany": "company",
+    "name": "first_name", "firstname": "first_name", "contactname": "first_name", "recipientname": "first_name",
+    "contact": "first_name", "recipient": "first_name", "prospectname": "first_name",
+}
+_SENDER_FIELDS = {"yourname", "sendername", "yourcompany", "yourtitle", "yourposition", "signature", "sender"}
+_GENERIC_NAMES = {"decision maker", "executive", "not available", "unknown"}
+
+
+@dataclass(slots=True)
+class Issue:
+    code: str
+    message: str
+    action: str
+
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+
+def _key(placeholder: str) -> str:
+    return re.sub(r"[^a-z]", "", placeholder.lower())
+
+
+def _first_name(contact: dict) -> str:
+    name = str((contact or {}).get("name") or "").strip()
+    if not name or name.lower() in _GENERIC_NAMES:
+        return ""
+    return name.split()[0]
+
+
+def repair_subject(subject: str) -> str:
+    """Strip labels, quotes, markdown and trailing punctuation; lowercase"""
+    subject = str(subject or "").replace("*", "").replace("`", "")
+    subject = re.sub(r"^\s*(subject(\s*line)?\s*:)\s*", "", subject, flags=re.IGNORECASE)
+    subject = subject.strip().strip("\"'“”‘’").strip()
+    subject = re.sub(r"[.!:;]+$", "", subject)
+    return " ".join(subject.split()).lower()
+
+
+def _repair_body(body: str, company: str, contact: dict, issues: list) -> str:
+    original = str(body or "")
+    body = re.sub(r"^\s*body\s*:\s*", "", original, flags=re.IGNORECASE)
+    if body != original:
+        issues.append(Issue("body_label", "Removed a leading 'Body:' label", REPAIRED))
+
+    first_name = _first_name(contact)
+    values = {"company": company, "first_name": first_name}
+    lines = []
+    for line in body.split("\n"):
+        for placeholder in PLACEHOLDER.findall(line):
+            key = _key(placeholder)
+            if key in _SENDER_FIELDS and not PLACEHOLDER.sub("", line).strip(" ,.-"):
+                # A sign-off line that is only "[Your Name]": the signature is added when sending
+                issues.append(Issue("placeholder", f"Removed the {placeholder} line", REPAIRED))
+                line = None
+                break
+            value = values.get(_PROSPECT_FIELDS.get(key))
+            if value:
+                line = line.replace(placeholder, value)
+                issues.append(Issue("placeholder", f"Filled {placeholder} with {value}", REPAIRED))
+        if line is not None:
+            lines.append(line.rstrip())
+    body = re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+    # Greeting must name this email's contact (or nobody in particular)
+    match = GREETING.match(body)
+    if match:
+        greeted = match.group(2).strip()
+        expected = first_name or "there"
+        if greeted.lower() in _GENERIC_NAMES or (first_name and first_name.lower() not in greeted.lower()):
+            body = f"{match.group(1)} {expected}," + body[match.end():]
+            issues.append(Issue("greeting", f"Greeting addressed '{greeted}', changed to '{expected}'", REPAIRED))
+    return body
+
+
+def _recipient(email: dict, contact: dict, enriched: dict, issues: list):
+    """Check (and tidy) the address the email will go to; returns a repaired address or None"""
+    raw = email.get("to") or (contact or {}).get("email") or ""
+    address = str(raw).strip().strip("<>").removeprefix("mailto:").strip().lower()
+    if not address or address == "not available":
+        issues.append(Issue("recipient", "No email address for this contact", REVIEW))
+        return None
+    if not ADDRESS.match(address):
+        issues.append(Issue("recipient", f"'{raw}' is not a deliverable email address", REVIEW))
+        return None
+
+    website = normalize_domain(((enriched or {}).get("company_info") or {}).get("website"))
+    domain = address.rsplit("@", 1)[1]
+    if website and domain != website and not domain.endswith("." + website) and not website.endswith("." + domain):
+        issues.append(Issue("recipient", f"{address} is not at the company's domain ({website})", REVIEW))
+    if address != raw:
+        issues.append(Issue("recipient", f"Tidied the address to {address}", REPAIRED))
+        return address
+    return None
+
+
+def validate_email(email: dict, enriched: dict = None, contact: dict = None) -> tuple:
+    """
+    Repair what can be fixed locally, then check what's left
+
+    Args:
+        email: Draft dict (subject, body, optionally subject_variants, to, contact)
+        enriched: The prospect's research, for the company name and website
+        contact: Contact the draft is addressed to (defaults to draft["contact"],
+            then the first researched contact)
+
+    Returns:
+        (repaired copy of email, [Issue]); the draft needs a rewrite if any
+        issue's action is REGENERATE
+    """
+    enriched = enriched or {}
+    contacts = enriched.get("contacts") or []
+    contact = contact or email.get("contact") or (contacts[0] if contacts else None)
+    company = enriched.get("company_name", "")
+    issues = []
+    email = dict(email)
+
+    email["body"] = _repair_body(email.get("body"), company, contact, issues)
+    email["word_count"] = word_count(email["body"])
+
+    subjects = [repair_subject(s) for s in (email.get("subject_variants") or [email.get("subject")])]
+    if subjects[0] != email.get("subject"):
+        issues.append(Issue("subject_format", f"Reformatted the subject to '{subjects[0]}'", REPAIRED))
+    usable = [s for s in dict.fromkeys(subjects) if s and word_count(s) <= EMAIL_SUBJECT_MAX_WORDS]
+    if not usable:
+        issues.append(Issue("subject_length", f"Subject must be 1-{EMAIL_SUBJECT_MAX_WORDS} words", REGENERATE))
+    else:
+        email["subject"] = usable[0]
+    if "subject_variants" in email:
+        email["subject_variants"] = usable or subjects[:1]
+
+    if not email["word_count"] or not EMAIL_MIN_WORDS <= email["word_count"] <= EMAIL_MAX_WORDS:
+        issues.append(Issue(
+            "word_count", f"Body has {email['word_count']} words, needs {EMAIL_MIN_WORDS}-{EMAIL_MAX_WORDS}", REGENERATE
+        ))
+
+    leftover = sorted(set(PLACEHOLDER.findall(email["subject"] + "\n" + email["body"])))
+    if leftover:
+        issues.append(Issue("placeholder", f"Unfilled placeholders: {', '.join(leftover)}", REGENERATE))
+
+    address = _recipient(email, contact, enriched, issues)
+    if address:
+        email["to"] = address
+        email.setdefault("contact", contact)
+    return email, issues
+
+
+def needs_rewrite(issues: list) -> bool:
+    return any(issue.action == REGENERATE for issue in issues)
+
+
+def body_signature(body: str) -> str:
+    """Hash of the body ignoring case, punctuation and spacing"""
+    text = " ".join(re.sub(r"[^\w\s]", " ", str(body).lower()).split())
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def duplicate_issue() -> Issue:
+    return Issue("duplicate", "Same body as another email in this campaign", REGENERATE)
+
+
+class DuplicateIndex:
+    """Body signatures per campaign and the draft that has each one (SQLite, shared by processes)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS body_signatures (
+                campaign_id TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                PRIMARY KEY (campaign_id, signature)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_body_signatures_owner ON body_signatures (campaign_id, owner)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def claim_many(self, campaign_id: str, claims: list) -> dict:
+        """
+        Register (owner, signature) pairs; owner is e.g. "prospect_id#draft"
+
+        An owner holds one signature: claiming again (after a rewrite or a
+        regeneration) releases the body it had before.
+
+        Returns:
+            {owner: other owner} for every claim whose body another draft already has
+        """
+        campaign_id = campaign_id or ""
+        with self._conn() as conn:
+            conn.executemany(
+                "DELETE FROM body_signatures WHERE campaign_id = ? AND owner = ? AND signature != ?",
+                [(campaign_id, owner, signature) for owner, signature in claims]
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO body_signatures (campaign_id, signature, owner) VALUES (?, ?, ?)",
+                [(campaign_id, signature, owner) for owner, signature in claims]
+            )
+            clashes = {}
+            for owner, signature in claims:
+                row = conn.execute(
+                    "SELECT owner FROM body_signatures WHERE campaign_id = ? AND signature = ?",
+                    (campaign_id, signature)
+                ).fetchone()
+                if row and row[0] != owner:
+                    clashes[owner] = row[0]
+        return clashes
+
+
+_duplicates = None
+_duplicates_lock = threading.Lock()
+
+
+def get_duplicate_index() -> DuplicateIndex:
+    """Return the process-wide duplicate-body index"""
+    global _duplicates
+
+    if _duplicates is None:
+        with _duplicates_lock:
+            if _duplicates is None:
+                _duplicates = DuplicateIndex(VALIDATION_DB_PATH)
+    return _duplicates
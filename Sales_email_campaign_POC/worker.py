@@ -0,0 +1,110 @@
+"""
+Background Worker - Runs queued orchestrator jobs outside the Streamlit process
+
+Usage:
+    python worker.py                      # WORKER_PROCESSES x WORKER_THREADS
+    python worker.py --processes 4 --threads 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from utils.config import JOB_LEASE_SECONDS, JOB_POLL_SECONDS, WORKER_PROCESSES, WORKER_THREADS, get_settings
+
+
+def _heartbeat(queue, job_id: int, worker_id: str, stop: threading.Event):
+    """Keep the lease alive while the job runs"""
+    while not stop.wait(JOB_LEASE_SECONDS / 3):
+        if not queue.heartbeat(job_id, worker_id):
+            print(f"[WORKER] {worker_id} lost the lease on job {job_id}")
+            return
+
+
+def _work_loop(worker_id: str, shutdown: threading.Event):
+    # Imported here so each spawned process builds its own clients and connections
+    from agents.orchestrator import run_job, abandon_job
+    from utils.job_queue import get_job_queue, FAILED, LOST
+
+    queue = get_job_queue()
+    while not shutdown.is_set():
+        # Jobs whose worker died on their last attempt are handed back here
+        for job in queue.reap():
+            print(f"[WORKER] Job {job['id']} failed permanently: lease expired")
+            abandon_job(job)
+
+        job = queue.claim(worker_id)
+        if job is None:
+            shutdown.wait(JOB_POLL_SECONDS)
+            continue
+
+        print(f"[WORKER] {worker_id} running job {job['id']} ({job['kind']}, attempt {job['attempts']})")
+        stop = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(queue, job["id"], worker_id, stop), daemon=True)
+        beat.start()
+        try:
+            result = run_job(job)
+            queue.complete(job["id"], worker_id, result)
+            print(f"[WORKER] {worker_id} finished job {job['id']}: {result}")
+        except Exception as e:
+            traceback.print_exc()
+            # LOST: the lease expired meanwhile, whoever holds the job now decides its fate
+            status = queue.fail(job["id"], worker_id, str(e))
+            if status == FAILED:
+                print(f"[WORKER] Job {job['id']} failed permanently: {str(e)}")
+                abandon_job(job)
+            elif status == LOST:
+                print(f"[WORKER] {worker_id} lost job {job['id']} to another worker")
+        finally:
+            stop.set()
+
+
+def run_process(threads: int):
+    """One worker process: `threads` claim loops sharing the process's Gemini client"""
+    shutdown = threading.Event()
+    base = f"{socket.gethostname()}-{os.getpid()}"
+    loops = [
+        threading.Thread(target=_work_loop, args=(f"{base}-{n}", shutdown), name=f"worker-{n}", daemon=True)
+        for n in range(threads)
+    ]
+    for loop in loops:
+        loop.start()
+    print(f"[WORKER] Process {os.getpid()} started with {threads} threads")
+    try:
+        while any(loop.is_alive() for loop in loops):
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        # Unfinished jobs are picked up again once their lease expires
+        shutdown.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background campaign workers")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES)
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS)
+    args = parser.parse_args()
+    # Bad settings stop here, not in every child process
+    get_settings()
+
+    if args.processes <= 1:
+        run_process(args.threads)
+        return
+
+    # spawn, not fork: children must not inherit SQLite or HTTP connections
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_process, args=(args.threads,)) for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()